@@ -0,0 +1,282 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import time
+from typing import IO, Any, Dict, Iterator, List, Optional
+
+from utils import BLOBS_DIR, BlobStore, DBManager, dbutils, hash_file, md5_hash
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+RECORDS_NAME = "records.jsonl"
+BLOBS_PREFIX = "blobs/"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_MAGIC = b"\x1f\x8b"
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+CHUNK_SIZE = 256 * 1024
+COMMIT_EVERY = 500
+# spill the record stream to disk once it gets larger than this
+RECORDS_SPOOL_SIZE = 8 * 1024 * 1024
+
+# tables whose rows are archived as records, rows are replaced by their unique keys on import
+ARCHIVE_TABLES = ("workflows", "sessions", "messages")
+
+
+def default_compression() -> str:
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def _rows(conn: sqlite3.Connection, query: str, args: tuple = ()) -> Iterator[Dict[str, Any]]:
+    cursor = conn.execute(query, args)
+    columns = [column[0] for column in cursor.description]
+    for row in cursor:
+        yield dict(zip(columns, row))
+
+
+def _add_bytes(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+class _Compressed:
+    """Wraps the output file in a zstd or gzip stream, tarfile writes an uncompressed stream into it"""
+
+    def __init__(self, fileobj: IO[bytes], compression: str) -> None:
+        self.fileobj = fileobj
+        self.compression = compression
+
+    def __enter__(self) -> tarfile.TarFile:
+        if self.compression == "zstd":
+            if zstandard is None:
+                raise ValueError("zstd compression requires the zstandard package")
+            self.writer = zstandard.ZstdCompressor(level=10, threads=-1).stream_writer(self.fileobj, closefd=False)
+            self.tar = tarfile.open(fileobj=self.writer, mode="w|")
+        elif self.compression == "gzip":
+            self.writer = None
+            self.tar = tarfile.open(fileobj=self.fileobj, mode="w|gz")
+        else:
+            raise ValueError(f"Unknown archive compression: {self.compression}")
+        return self.tar
+
+    def __exit__(self, *exc: Any) -> None:
+        self.tar.close()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def export_archive(
+    fileobj: IO[bytes],
+    dbmanager: DBManager,
+    files_static_root: str,
+    user_id: Optional[str] = None,
+    session_ids: Optional[List[str]] = None,
+    include_workflows: bool = True,
+    compression: Optional[str] = None,
+) -> Dict[str, int]:
+    """
+    Streams sessions, their messages, workflows and work dir files into a compressed tar archive written to
+    fileobj. Files are stored once per content hash under blobs/, followed by a records.jsonl member with one
+    database row or file reference per line. Rows are read with a database cursor and the records are spooled to
+    disk, so memory use does not depend on the number or size of the exported sessions.
+    """
+    compression = compression or default_compression()
+    stats = {"sessions": 0, "messages": 0, "workflows": 0, "files": 0, "blobs": 0}
+    seen_blobs = set()
+
+    conn = sqlite3.connect(f"file:{dbmanager.path}?mode=ro", uri=True)
+    records = tempfile.SpooledTemporaryFile(max_size=RECORDS_SPOOL_SIZE, mode="w+b")
+    try:
+        with _Compressed(fileobj, compression) as tar:
+            manifest = {"version": ARCHIVE_VERSION, "created": time.time(), "user_id": user_id}
+            _add_bytes(tar, MANIFEST_NAME, json.dumps(manifest).encode("utf-8"))
+
+            def write_record(kind: str, data: Dict[str, Any]) -> None:
+                records.write(json.dumps({"kind": kind, "data": data}).encode("utf-8") + b"\n")
+
+            if include_workflows:
+                query, args = "SELECT * FROM workflows", ()
+                if user_id:
+                    query, args = "SELECT * FROM workflows WHERE user_id = ?", (user_id,)
+                for row in _rows(conn, query, args):
+                    write_record("workflows", row)
+                    stats["workflows"] += 1
+
+            query, args = "SELECT * FROM sessions", ()
+            if user_id:
+                query, args = "SELECT * FROM sessions WHERE user_id = ?", (user_id,)
+            for session in _rows(conn, query, args):
+                if session_ids and session["id"] not in session_ids:
+                    continue
+                write_record("sessions", session)
+                stats["sessions"] += 1
+
+                message_rows = _rows(
+                    conn,
+                    "SELECT * FROM messages WHERE user_id = ? AND session_id = ? ORDER BY timestamp",
+                    (session["user_id"], session["id"]),
+                )
+                for message in message_rows:
+                    write_record("messages", message)
+                    stats["messages"] += 1
+
+                session_dir = os.path.join(files_static_root, "user", md5_hash(session["user_id"]), session["id"])
+                for root, _, files in os.walk(session_dir):
+                    for file in sorted(files):
+                        path = os.path.join(root, file)
+                        if os.path.islink(path) or not os.path.isfile(path):
+                            continue
+                        sha256 = hash_file(path)
+                        if sha256 not in seen_blobs:
+                            info = tar.gettarinfo(path, arcname=BLOBS_PREFIX + sha256)
+                            info.uid = info.gid = 0
+                            info.uname = info.gname = ""
+                            with open(path, "rb") as f:
+                                tar.addfile(info, f)
+                            seen_blobs.add(sha256)
+                            stats["blobs"] += 1
+                        file_record = {
+                            "user_id": session["user_id"],
+                            "session_id": session["id"],
+                            "path": os.path.relpath(path, session_dir),
+                            "sha256": sha256,
+                        }
+                        write_record("files", file_record)
+                        stats["files"] += 1
+
+            # blobs come first so the importer has every file in place when it reaches the file records
+            info = tarfile.TarInfo(RECORDS_NAME)
+            info.size = records.tell()
+            info.mtime = int(time.time())
+            records.seek(0)
+            tar.addfile(info, records)
+    finally:
+        records.close()
+        conn.close()
+
+    logger.info("Exported archive: %s", stats)
+    return stats
+
+
+def _open_tar(fileobj: IO[bytes]) -> tarfile.TarFile:
+    magic = fileobj.read(4)
+    fileobj.seek(0)
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError("Archive is zstd compressed, install the zstandard package to import it")
+        return tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(fileobj), mode="r|")
+    if magic[:2] == GZIP_MAGIC:
+        return tarfile.open(fileobj=fileobj, mode="r|gz")
+    return tarfile.open(fileobj=fileobj, mode="r|")
+
+
+def _upsert_row(cursor: sqlite3.Cursor, table: str, row: Dict[str, Any], columns: List[str]) -> None:
+    row = {key: value for key, value in row.items() if key in columns}
+    names = ", ".join(row.keys())
+    placeholders = ", ".join("?" for _ in row)
+    cursor.execute(f"INSERT OR REPLACE INTO {table} ({names}) VALUES ({placeholders})", tuple(row.values()))
+
+
+def import_archive(
+    fileobj: IO[bytes], dbmanager: DBManager, files_static_root: str, user_id: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    Imports an archive written by export_archive. Existing rows with the same keys are replaced. When user_id is
+    given every record is imported for that user and file paths in message metadata are rewritten to match. The
+    archive is read as a stream, blobs are moved into the blob store (where it supports reflinks, otherwise they
+    are only staged), imported files are copied from them and rows are committed in batches.
+    """
+    stats = {"sessions": 0, "messages": 0, "workflows": 0, "files": 0, "blobs": 0}
+    # staged next to the files root (the app root), not under it where /api/files serves it, blobs are moved in
+    staging_dir = tempfile.mkdtemp(prefix=".import-", dir=os.path.dirname(os.path.normpath(files_static_root)))
+    blob_store = BlobStore(os.path.join(files_static_root, BLOBS_DIR))
+    # where the content of each blob of the archive is, in the store or still in the staging dir
+    sources: Dict[str, str] = {}
+    cursor = dbmanager.conn.cursor()
+    columns = {
+        table: [column[1] for column in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+        for table in ARCHIVE_TABLES
+    }
+
+    def import_record(record: Dict[str, Any]) -> None:
+        kind, data = record["kind"], record["data"]
+        if user_id and data.get("user_id") not in (None, "default"):
+            if kind == "messages" and data.get("metadata"):
+                old_dir, new_dir = md5_hash(data["user_id"]), md5_hash(user_id)
+                data["metadata"] = data["metadata"].replace(f"user/{old_dir}/", f"user/{new_dir}/")
+            data["user_id"] = user_id
+
+        if kind == "files":
+            session_dir = os.path.join(files_static_root, "user", md5_hash(data["user_id"]), data["session_id"])
+            target = os.path.realpath(os.path.join(session_dir, data["path"]))
+            in_session = target.startswith(os.path.realpath(session_dir) + os.sep)
+            source = sources.get(data["sha256"])
+            if source is None and SHA256_PATTERN.match(data["sha256"]):
+                source = blob_store.blob_path(data["sha256"])
+            if not in_session or source is None or not os.path.exists(source):
+                logger.warning("Skipping archive file %s", data["path"])
+                return
+            blob_store.link(data["sha256"], target, source=source)
+        elif kind in ARCHIVE_TABLES:
+            _upsert_row(cursor, kind, data, columns[kind])
+        else:
+            logger.warning("Skipping unknown archive record %s", kind)
+            return
+        stats[kind] += 1
+
+    try:
+        with _open_tar(fileobj) as tar:
+            for member in tar:
+                if member.name == MANIFEST_NAME:
+                    manifest = json.load(tar.extractfile(member))
+                    if manifest.get("version", 0) > ARCHIVE_VERSION:
+                        raise ValueError(f"Unsupported archive version {manifest['version']}")
+                elif member.name.startswith(BLOBS_PREFIX) and member.isfile():
+                    sha256 = os.path.basename(member.name)
+                    if not SHA256_PATTERN.match(sha256):
+                        continue
+                    digest = hashlib.sha256()
+                    blob_path = os.path.join(staging_dir, sha256)
+                    with tar.extractfile(member) as src, open(blob_path, "wb") as dst:
+                        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                            digest.update(chunk)
+                            dst.write(chunk)
+                    if digest.hexdigest() != sha256:
+                        os.remove(blob_path)
+                        raise ValueError(f"Archive blob {sha256} is corrupted")
+                    sources[sha256] = blob_store.add_file(blob_path, sha256) or blob_path
+                    stats["blobs"] += 1
+                elif member.name == RECORDS_NAME:
+                    pending = 0
+                    for line in tar.extractfile(member):
+                        if not line.strip():
+                            continue
+                        # the connection is shared with the web app, hold its lock per record, not per import
+                        with dbutils.lock:
+                            import_record(json.loads(line))
+                            pending += 1
+                            if pending >= COMMIT_EVERY:
+                                dbmanager.commit()
+                                pending = 0
+                    with dbutils.lock:
+                        dbmanager.commit()
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    logger.info("Imported archive: %s", stats)
+    return stats
@@ -0,0 +1,345 @@
+import copy
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, Optional
+
+from chatmanager import AutoGenChatManager
+from datamodel import AgentWorkFlowConfig, Message
+from metrics import percentile
+from profiler import run_scope
+from tracing import Span, span, tracer
+from utils import DBManager, dbutils, md5_hash
+from yandexgpt.ratelimit import BACKGROUND, llm_priority
+
+logger = logging.getLogger(__name__)
+
+TASKS_NAME = "tasks.jsonl"
+RESULTS_NAME = "results.jsonl"
+META_NAME = "batch.json"
+# fields of a task line that are not passed through to its result as "input"
+TASK_FIELDS = ("id", "task", "prompt")
+
+
+def summary_path(results_path: str) -> str:
+    """results.jsonl -> results.summary.json"""
+    return os.path.splitext(results_path)[0] + ".summary.json"
+
+
+def read_tasks(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Parses a JSONL task file. A line is a JSON string or an object with "task" (or "prompt") and an optional "id",
+    which defaults to the line number. Other fields, e.g. an expected answer, are copied to the result.
+    """
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        row = json.loads(line)
+        if isinstance(row, str):
+            row = {"task": row}
+        task = row.get("task") or row.get("prompt")
+        if not task:
+            raise ValueError(f"Task line {number} has no task")
+        yield {
+            "id": str(row.get("id", number)),
+            "task": task,
+            "input": {key: value for key, value in row.items() if key not in TASK_FIELDS},
+        }
+
+
+def read_results(path: str) -> Iterator[Dict[str, Any]]:
+    """Results in file order, a line cut off by a crash is skipped"""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def latest_results(path: str) -> Dict[str, Dict[str, Any]]:
+    """The last result per task id, a task that was retried after an error appears more than once"""
+    return {result["id"]: result for result in read_results(path)}
+
+
+def summarize_results(path: str) -> Dict[str, Any]:
+    results = latest_results(path)
+    latencies = [result["latency"] for result in results.values() if result["status"] == "ok"]
+    usage = {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0}
+    for result in results.values():
+        for key in usage:
+            usage[key] += result.get("usage", {}).get(key, 0)
+    return {
+        "tasks": len(results),
+        "ok": len(latencies),
+        "failed": len(results) - len(latencies),
+        "latency": {
+            "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+        },
+        "usage": usage,
+    }
+
+
+class UsageCollector:
+    """Span listener that sums the LLM usage of the completions in the traces of running batch tasks"""
+
+    def __init__(self) -> None:
+        self.usage: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+
+    def register(self, trace_id: str) -> None:
+        with self.lock:
+            self.usage[trace_id] = {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0}
+
+    def pop(self, trace_id: str) -> Dict[str, int]:
+        with self.lock:
+            return self.usage.pop(trace_id, {})
+
+    def __call__(self, finished: Span) -> None:
+        if finished.name != "yandexgpt.completion":
+            return
+        with self.lock:
+            usage = self.usage.get(finished.trace_id)
+            if usage is not None:
+                usage["llm_calls"] += 1
+                usage["input_tokens"] += finished.attributes.get("llm.usage.input_tokens", 0)
+                usage["output_tokens"] += finished.attributes.get("llm.usage.output_tokens", 0)
+
+
+class BatchRun:
+    """
+    Runs a workflow over every task of a JSONL file with bounded concurrency, appending one result line per task.
+    The results file is the checkpoint: a run with an existing results file skips tasks that already succeeded
+    (and failed ones unless retry_failed). Tasks run as fresh sessions that are not stored in the database, their
+    LLM calls have background priority so interactive chats are served first.
+    """
+
+    def __init__(
+        self,
+        workflow: AgentWorkFlowConfig,
+        tasks_path: str,
+        results_path: str,
+        files_static_root: str,
+        user_id: str = "batch",
+        concurrency: int = 4,
+        retry_failed: bool = True,
+        batch_id: Optional[str] = None,
+    ) -> None:
+        self.workflow = workflow
+        self.tasks_path = tasks_path
+        self.results_path = results_path
+        self.summary_path = summary_path(results_path)
+        self.user_id = user_id
+        self.user_dir = os.path.join(files_static_root, "user", md5_hash(user_id))
+        self.concurrency = max(1, concurrency)
+        self.retry_failed = retry_failed
+        self.batch_id = batch_id or uuid.uuid4().hex[:12]
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancelled = threading.Event()
+        self.usage = UsageCollector()
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            "id": self.batch_id,
+            "workflow_id": self.workflow.id,
+            "status": self.status,
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+    def cancel(self) -> None:
+        """Stops submitting tasks, the running ones finish and are recorded"""
+        self.cancelled.set()
+
+    def run(self, on_progress: Optional[Callable[["BatchRun"], None]] = None) -> Dict[str, Any]:
+        self.status = "running"
+        self.started_at = time.time()
+        finished = {
+            task_id
+            for task_id, result in latest_results(self.results_path).items()
+            if result["status"] == "ok" or not self.retry_failed
+        }
+        tracer.add_listener(self.usage)
+        try:
+            with open(self.tasks_path, "r", encoding="utf-8") as tasks, open(
+                self.results_path, "a", encoding="utf-8"
+            ) as results, ThreadPoolExecutor(self.concurrency, thread_name_prefix="batch") as executor:
+                pending: set = set()
+                for task in read_tasks(tasks):
+                    if self.cancelled.is_set():
+                        break
+                    if task["id"] in finished:
+                        self.skipped += 1
+                        continue
+                    # only a window of tasks is submitted, so memory does not grow with the size of the task file
+                    if len(pending) >= self.concurrency * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        self._record(done, results, on_progress)
+                    pending.add(executor.submit(self.run_task, task))
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._record(done, results, on_progress)
+            self.status = "cancelled" if self.cancelled.is_set() else "done"
+        except Exception as e:
+            logger.exception("Batch %s failed", self.batch_id)
+            self.status, self.error = "failed", str(e)
+        finally:
+            tracer.remove_listener(self.usage)
+            self.finished_at = time.time()
+
+        summary = {**self.progress(), **summarize_results(self.results_path)}
+        summary["duration"] = self.finished_at - self.started_at
+        with open(self.summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        logger.info("Batch %s %s: %d ok, %d failed", self.batch_id, self.status, summary["ok"], summary["failed"])
+        return summary
+
+    def _record(
+        self, done: Iterable[Future], results: IO[str], on_progress: Optional[Callable[["BatchRun"], None]]
+    ) -> None:
+        for future in done:
+            result = future.result()
+            results.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            results.flush()
+            self.completed += 1
+            if result["status"] != "ok":
+                self.failed += 1
+            if on_progress is not None:
+                on_progress(self)
+
+    def run_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        session_id = "batch-{}-{}".format(self.batch_id, re.sub(r"[^\w.-]", "_", task["id"]))
+        result: Dict[str, Any] = {"id": task["id"], "task": task["task"]}
+        if task["input"]:
+            result["input"] = task["input"]
+        start = time.time()
+        attributes = {"batch.id": self.batch_id, "batch.task_id": task["id"], "workflow.name": self.workflow.name}
+        with span("batch.task", attributes) as task_span, llm_priority(BACKGROUND), run_scope(
+            self.batch_id, session_id
+        ):
+            self.usage.register(task_span.trace_id)
+            try:
+                chat_manager = AutoGenChatManager(message_queue=None)
+                message = Message(user_id=self.user_id, role="user", content=task["task"], session_id=session_id)
+                # tasks run concurrently, each gets a workflow config of its own
+                response = chat_manager.chat(
+                    message=message, history=[], flow_config=copy.deepcopy(self.workflow), user_dir=self.user_dir
+                )
+                output = response.content
+                # the web path summarizes in the background, a batch result waits for the summary
+                pending = chat_manager.pending_summaries.pop(response.msg_id, None)
+                if pending is not None:
+                    output = chat_manager.summarizer.summarize(pending["task"], pending["transcript"], pending["model"])
+                metadata = json.loads(response.metadata)
+                result.update(
+                    status="ok",
+                    output=output,
+                    messages=len(metadata["messages"]),
+                    files=[file["path"] for file in metadata["files"]],
+                    termination=metadata.get("termination"),
+                )
+            except Exception as e:
+                task_span.set_error(e)
+                logger.warning("Batch %s task %s failed: %s", self.batch_id, task["id"], e)
+                result.update(status="error", error=str(e))
+            finally:
+                result["usage"] = self.usage.pop(task_span.trace_id)
+        result["latency"] = time.time() - start
+        return result
+
+
+class BatchManager:
+    """
+    Batches started through the api. Each batch has a directory under root with its task file, metadata, results
+    and summary, so its status and results outlive the process and an interrupted batch can be resumed.
+    """
+
+    def __init__(self, root: str, dbmanager: DBManager, files_static_root: str) -> None:
+        self.root = root
+        self.dbmanager = dbmanager
+        self.files_static_root = files_static_root
+        self.runs: Dict[str, BatchRun] = {}
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, batch_id: str, name: str) -> str:
+        if not re.fullmatch(r"[0-9a-f]{12}", batch_id):
+            raise ValueError(f"Invalid batch id: {batch_id}")
+        return os.path.join(self.root, batch_id, name)
+
+    def create(self, tasks: IO[bytes], workflow_id: str, user_id: str, concurrency: int = 4) -> BatchRun:
+        if dbutils.get_workflow(workflow_id, self.dbmanager) is None:
+            raise ValueError(f"Workflow {workflow_id} not found")
+        batch_id = uuid.uuid4().hex[:12]
+        os.makedirs(os.path.join(self.root, batch_id))
+        with open(self.path(batch_id, TASKS_NAME), "wb") as f:
+            shutil.copyfileobj(tasks, f)
+        meta = {"workflow_id": workflow_id, "user_id": user_id, "concurrency": concurrency, "created": time.time()}
+        with open(self.path(batch_id, META_NAME), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return self.start(batch_id)
+
+    def start(self, batch_id: str) -> BatchRun:
+        """Starts or resumes a batch on a background thread"""
+        with open(self.path(batch_id, META_NAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with self.lock:
+            run = self.runs.get(batch_id)
+            if run is not None and run.status in ("pending", "running"):
+                raise ValueError(f"Batch {batch_id} is already running")
+            workflow = dbutils.get_workflow(meta["workflow_id"], self.dbmanager)
+            if workflow is None:
+                raise ValueError(f"Workflow {meta['workflow_id']} not found")
+            run = self.runs[batch_id] = BatchRun(
+                workflow,
+                tasks_path=self.path(batch_id, TASKS_NAME),
+                results_path=self.path(batch_id, RESULTS_NAME),
+                files_static_root=self.files_static_root,
+                user_id=meta["user_id"],
+                concurrency=meta["concurrency"],
+                batch_id=batch_id,
+            )
+        threading.Thread(target=run.run, name=f"batch-{batch_id}", daemon=True).start()
+        return run
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        run = self.runs.get(batch_id)
+        if run is not None and run.status in ("pending", "running"):
+            return run.progress()
+        summary_file = summary_path(self.path(batch_id, RESULTS_NAME))
+        if os.path.exists(summary_file):
+            with open(summary_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        if os.path.exists(self.path(batch_id, META_NAME)):
+            # interrupted by a restart, or running in another worker process
+            return {"id": batch_id, "status": "incomplete", **summarize_results(self.path(batch_id, RESULTS_NAME))}
+        return None
+
+    def cancel(self, batch_id: str) -> bool:
+        run = self.runs.get(batch_id)
+        if run is None or run.status != "running":
+            return False
+        run.cancel()
+        return True
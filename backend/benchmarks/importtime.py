@@ -0,0 +1,86 @@
+"""
+Import time budget check for the startup paths. Each entry point is imported in a fresh interpreter with
+`python -X importtime` and the cumulative import time is compared against its budget. Modules that must stay lazy
+(autogen, openai, ...) fail the check when they show up in the import graph of an entry point.
+
+    python benchmarks/importtime.py            # check the budgets, exits 1 on a regression
+    python benchmarks/importtime.py --top 15   # also print the slowest imports of each entry point
+
+Run from the backend directory. Budgets can be scaled with AUTOGENSTUDIO_IMPORT_BUDGET_SCALE on slow machines.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# entry point module -> (budget in milliseconds, modules that must not be imported)
+BUDGETS: Dict[str, Tuple[float, List[str]]] = {
+    "cli": (150, ["uvicorn", "fastapi", "autogen", "openai", "requests"]),
+    "web.app": (1500, ["autogen", "openai", "requests", "PIL"]),
+    "worker": (1500, ["autogen", "openai", "requests"]),
+}
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure(module: str, repeat: int = 3) -> Tuple[float, List[Tuple[float, str]]]:
+    """Returns the best cumulative import time of module in ms and the per module cumulative times of that run"""
+    best_total, best_modules = float("inf"), []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+        # the entry point and its parent packages are top level lines, everything they import is nested below
+        targets = {".".join(module.split(".")[: i + 1]) for i in range(module.count(".") + 1)}
+        modules, total = [], 0.0
+        for line in result.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                cumulative, indent, name = int(match.group(2)) / 1000, len(match.group(3)), match.group(4)
+                modules.append((cumulative, name))
+                if indent == 1 and name in targets:
+                    total += cumulative
+        if total < best_total:
+            best_total, best_modules = total, modules
+    return best_total, best_modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS), help="entry points to check")
+    parser.add_argument("--repeat", type=int, default=3, help="imports per entry point, the best run is used")
+    parser.add_argument("--top", type=int, default=0, help="print the N slowest imports of each entry point")
+    args = parser.parse_args()
+
+    scale = float(os.environ.get("AUTOGENSTUDIO_IMPORT_BUDGET_SCALE", "1"))
+    failed = False
+    for module in args.modules:
+        budget, forbidden = BUDGETS.get(module, (float("inf"), []))
+        budget *= scale
+        total, modules = measure(module, repeat=args.repeat)
+        imported = {name.split(".")[0] for _, name in modules}
+        eager = sorted(name for name in forbidden if name in imported)
+
+        ok = total <= budget and not eager
+        failed = failed or not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {module:<10} {total:8.1f} ms (budget {budget:.0f} ms)")
+        if eager:
+            print(f"     imported eagerly: {', '.join(eager)}")
+        for cumulative, name in sorted(modules, reverse=True)[: args.top]:
+            print(f"     {cumulative:8.1f} ms  {name}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Load test for a running AutoGen Studio server. N simulated users each create a session for a twoagents or groupchat
+workflow and send a number of turns, over POST /api/messages or over the websocket, and the harness reports
+throughput, p50/p95/p99 turn latency and the database time reported by the server.
+
+Run it against the mock YandexGPT server so the numbers are repeatable and need no credentials:
+
+    python benchmarks/mock_yandexgpt.py --port 8090 --latency const:0.2 &
+    autogenstudio ui --port 8081 &
+    python benchmarks/loadtest.py --users 8 --turns 3 --workflow twoagents --llm-base-url http://127.0.0.1:8090
+
+--llm-base-url rewrites the model entries of the workflow sent with each message, so the app database does not
+have to be changed. Use --json to store the results for before/after comparisons.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import requests
+
+try:
+    from websockets.sync.client import connect as ws_connect
+except ImportError:
+    ws_connect = None
+
+# run as a script from the backend dir, the percentile helper is shared with batch summaries
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics import percentile  # noqa: E402
+
+
+def patch_workflow(workflow: Dict[str, Any], base_url: Optional[str], api_key: str) -> Dict[str, Any]:
+    """Points every model of the workflow at base_url"""
+
+    def patch_agent(agent: Dict[str, Any]) -> None:
+        llm_config = agent.get("config", {}).get("llm_config")
+        if llm_config:
+            for model in llm_config.get("config_list", []):
+                model["base_url"] = base_url
+                model["api_key"] = model.get("api_key") or api_key
+        for member in agent.get("groupchat_config", {}).get("agents", []):
+            patch_agent(member)
+
+    workflow = json.loads(json.dumps(workflow))
+    if base_url:
+        patch_agent(workflow["sender"])
+        patch_agent(workflow["receiver"])
+    return workflow
+
+
+class SimulatedUser:
+    def __init__(self, index: int, args: argparse.Namespace, results: Dict[str, List[Any]], lock: threading.Lock):
+        self.user_id = f"loadtest-{index}@local"
+        self.args = args
+        self.results = results
+        self.lock = lock
+        self.http = requests.Session()
+        self.connection_id = str(uuid.uuid4())
+
+    def api(self, method: str, path: str, **kwargs) -> Any:
+        response = self.http.request(method, f"{self.args.url}{path}", timeout=self.args.timeout, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def record(self, key: str, value: Any) -> None:
+        with self.lock:
+            self.results[key].append(value)
+
+    def setup(self) -> None:
+        workflows = self.api("GET", "/workflows", params={"user_id": self.user_id})["data"]
+        matching = [workflow for workflow in workflows if workflow["type"] == self.args.workflow]
+        if not matching:
+            raise RuntimeError(f"No {self.args.workflow} workflow found")
+        self.workflow = patch_workflow(matching[0], self.args.llm_base_url, self.args.llm_api_key)
+        session_request = {"user_id": self.user_id, "session": {"user_id": self.user_id, "flow_config": self.workflow}}
+        self.session = self.api("POST", "/sessions", json=session_request)["data"][0]
+
+    def request_body(self, turn: int) -> Dict[str, Any]:
+        message = {
+            "role": "user",
+            "content": f"{self.args.prompt} (turn {turn})",
+            "user_id": self.user_id,
+            "root_msg_id": "0",
+            "session_id": self.session["id"],
+        }
+        return {
+            "message": message,
+            "workflow": self.workflow,
+            "session": self.session,
+            "user_id": self.user_id,
+            "connection_id": self.connection_id,
+        }
+
+    def run(self) -> None:
+        try:
+            self.setup()
+        except Exception as e:
+            self.record("errors", f"setup: {e}")
+            return
+
+        websocket = None
+        if self.args.transport == "ws":
+            ws_url = self.args.url.replace("http", "ws", 1) + f"/ws/{self.connection_id}"
+            websocket = ws_connect(ws_url, open_timeout=self.args.timeout)
+        try:
+            for turn in range(self.args.turns):
+                start = time.perf_counter()
+                try:
+                    if websocket is not None:
+                        response, events = self.ws_turn(websocket, turn)
+                        self.record("agent_events", events)
+                    else:
+                        response = self.api("POST", "/messages", json=self.request_body(turn))
+                except Exception as e:
+                    self.record("errors", str(e))
+                    continue
+                latency = time.perf_counter() - start
+                if not response.get("status"):
+                    self.record("errors", response.get("message"))
+                    continue
+                self.record("latencies", latency)
+                if response.get("db_time") is not None:
+                    self.record("db_times", response["db_time"])
+        finally:
+            if websocket is not None:
+                websocket.close()
+
+    def ws_turn(self, websocket, turn: int):
+        payload = {"connection_id": self.connection_id, "data": self.request_body(turn), "type": "user_message"}
+        websocket.send(json.dumps(payload))
+        events = 0
+        while True:
+            message = json.loads(websocket.recv(timeout=self.args.timeout))
+            if message.get("type") == "agent_response":
+                return message["data"], events
+            events += 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8081/api", help="api url of the server under test")
+    parser.add_argument("--users", type=int, default=4, help="concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=3, help="messages sent by each user")
+    parser.add_argument("--workflow", default="twoagents", choices=["twoagents", "groupchat"])
+    parser.add_argument("--transport", default="http", choices=["http", "ws"])
+    parser.add_argument("--prompt", default="Plot the sine function and save it to sine.png")
+    parser.add_argument("--llm-base-url", default=None, help="rewrite workflow models to this base url")
+    parser.add_argument("--llm-api-key", default="mock")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--json", default=None, help="write the results to this file")
+    args = parser.parse_args()
+
+    if args.transport == "ws" and ws_connect is None:
+        parser.error("--transport ws requires websockets>=12")
+
+    results: Dict[str, List[Any]] = {"latencies": [], "db_times": [], "errors": [], "agent_events": []}
+    lock = threading.Lock()
+    users = [SimulatedUser(i, args, results, lock) for i in range(args.users)]
+    threads = [threading.Thread(target=user.run) for user in users]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    latencies, db_times = results["latencies"], results["db_times"]
+    report = {
+        "users": args.users,
+        "turns": len(latencies),
+        "errors": len(results["errors"]),
+        "duration": duration,
+        "throughput": len(latencies) / duration if duration else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "db_time_p50": percentile(db_times, 50),
+        "db_time_p95": percentile(db_times, 95),
+        "db_time_total": sum(db_times),
+        "agent_events": sum(results["agent_events"]),
+    }
+
+    print(f"{report['turns']} turns by {args.users} users in {duration:.1f}s, {report['errors']} errors")
+    print(f"throughput  {report['throughput']:.2f} turns/s")
+    print(
+        f"latency     p50 {report['latency_p50']:.3f}s  p95 {report['latency_p95']:.3f}s"
+        f"  p99 {report['latency_p99']:.3f}s"
+    )
+    print(f"db time     p50 {report['db_time_p50'] * 1000:.1f}ms  p95 {report['db_time_p95'] * 1000:.1f}ms")
+    for error in results["errors"][:5]:
+        print(f"error: {error}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Local stand-in for the YandexGPT foundation models API, for load tests without credentials. Implements
+
+    POST /foundationModels/v1/completionAsync   returns an operation that is done after a sampled latency
+    GET  /operations/{id}                       polls that operation
+    POST /foundationModels/v1/completion        sync completion, or newline delimited chunks with stream=true
+
+Point the app at it with the model base_url or YANDEXGPT_BASE_URL=http://127.0.0.1:8090. Latency specs:
+"const:0.5", "uniform:0.2,1.5", "normal:0.8,0.2" and "lognormal:-0.5,0.4" (mu and sigma of the log, in seconds).
+
+    python benchmarks/mock_yandexgpt.py --port 8090 --latency lognormal:-0.5,0.4 --terminate-prob 0.5
+
+--error-rate answers that fraction of requests with 503 and --fail-rate finishes that fraction of operations with
+an error, to exercise the client's retries and circuit breaker.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+COMPLETION_PATH = "/foundationModels/v1/completion"
+COMPLETION_ASYNC_PATH = "/foundationModels/v1/completionAsync"
+OPERATION_PATH = re.compile(r"^/operations/([\w-]+)$")
+
+
+def parse_latency(spec: str, rng: random.Random) -> Callable[[], float]:
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value]
+    samplers = {
+        "const": lambda: values[0],
+        "uniform": lambda: rng.uniform(values[0], values[1]),
+        "normal": lambda: max(0.0, rng.gauss(values[0], values[1])),
+        "lognormal": lambda: rng.lognormvariate(values[0], values[1]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution: {spec}")
+    return samplers[kind]
+
+
+class MockYandexGPT:
+    """Generates replies and keeps the state of async operations"""
+
+    def __init__(
+        self,
+        latency: str = "const:0.2",
+        terminate_prob: float = 0.5,
+        seed: int = 0,
+        error_rate: float = 0.0,
+        fail_rate: float = 0.0,
+    ) -> None:
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.sample_latency = parse_latency(latency, self.rng)
+        self.terminate_prob = terminate_prob
+        self.error_rate = error_rate
+        self.fail_rate = fail_rate
+        self.operations: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def chance(self, probability: float) -> bool:
+        with self.rng_lock:
+            return self.rng.random() < probability
+
+    def latency(self) -> float:
+        with self.rng_lock:
+            return self.sample_latency()
+
+    def reply(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        messages = request.get("messages") or [{"text": ""}]
+        prompt = messages[-1].get("text", "")
+        with self.rng_lock:
+            terminate = self.rng.random() < self.terminate_prob
+        text = f"Mock answer to: {prompt[:80]}"
+        if terminate:
+            text += "\n\nTERMINATE"
+        input_tokens = sum(len(message.get("text", "").split()) for message in messages)
+        output_tokens = len(text.split())
+        return {
+            "alternatives": [{"message": {"role": "assistant", "text": text}, "status": "ALTERNATIVE_STATUS_FINAL"}],
+            "usage": {
+                "inputTextTokens": str(input_tokens),
+                "completionTokens": str(output_tokens),
+                "totalTokens": str(input_tokens + output_tokens),
+            },
+            "modelVersion": "mock",
+        }
+
+    def start_operation(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        operation_id = uuid.uuid4().hex
+        with self.lock:
+            self.operations[operation_id] = {
+                "ready_at": time.time() + self.latency(),
+                "response": self.reply(request),
+                "failed": self.chance(self.fail_rate),
+            }
+        return {"id": operation_id, "done": False}
+
+    def get_operation(self, operation_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            operation = self.operations.get(operation_id)
+            if operation is None:
+                return None
+            if time.time() < operation["ready_at"]:
+                return {"id": operation_id, "done": False}
+            del self.operations[operation_id]
+        if operation["failed"]:
+            return {"id": operation_id, "done": True, "error": {"code": 13, "message": "Internal error", "details": []}}
+        return {"id": operation_id, "done": True, "response": operation["response"]}
+
+
+def make_handler(mock: MockYandexGPT):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def send_json(self, status: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_json(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_POST(self) -> None:
+            request = self.read_json()
+            if mock.chance(mock.error_rate):
+                self.send_json(503, {"error": "service unavailable"})
+                return
+            if self.path == COMPLETION_ASYNC_PATH:
+                self.send_json(200, mock.start_operation(request))
+            elif self.path == COMPLETION_PATH:
+                self.complete(request)
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_GET(self) -> None:
+            if mock.chance(mock.error_rate):
+                self.send_json(503, {"error": "service unavailable"})
+                return
+            match = OPERATION_PATH.match(self.path)
+            operation = mock.get_operation(match.group(1)) if match else None
+            if operation is None:
+                self.send_json(404, {"error": "operation not found"})
+            else:
+                self.send_json(200, operation)
+
+        def complete(self, request: Dict[str, Any]) -> None:
+            latency = mock.latency()
+            result = mock.reply(request)
+            if not (request.get("completionOptions") or {}).get("stream"):
+                time.sleep(latency)
+                self.send_json(200, {"result": result})
+                return
+
+            # stream the text word by word as partial alternatives, then the final one
+            words = result["alternatives"][0]["message"]["text"].split(" ")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(1, len(words) + 1):
+                time.sleep(latency / len(words))
+                final = i == len(words)
+                alternative = {
+                    "message": {"role": "assistant", "text": " ".join(words[:i])},
+                    "status": "ALTERNATIVE_STATUS_FINAL" if final else "ALTERNATIVE_STATUS_PARTIAL",
+                }
+                chunk = json.dumps({"result": {**result, "alternatives": [alternative]}}).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def serve(host: str, port: int, mock: MockYandexGPT) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", default="const:0.2", help="latency distribution of a completion")
+    parser.add_argument("--terminate-prob", type=float, default=0.5, help="probability that a reply ends the chat")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of operations that fail")
+    args = parser.parse_args()
+
+    mock = MockYandexGPT(
+        latency=args.latency,
+        terminate_prob=args.terminate_prob,
+        seed=args.seed,
+        error_rate=args.error_rate,
+        fail_rate=args.fail_rate,
+    )
+    server = serve(args.host, args.port, mock)
+    print(f"Mock YandexGPT listening on http://{args.host}:{args.port} (latency {args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,48 @@
 import asyncio
 import json
+import logging
 import os
 import time
 from datetime import datetime
 from queue import Queue
-from typing import Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 import websockets
 from fastapi import WebSocket, WebSocketDisconnect
 
-from datamodel import AgentWorkFlowConfig, Message, SocketMessage
-from utils import extract_successful_code_blocks, get_modified_files, summarize_chat_history
-from workflowmanager import AutoGenWorkFlowManager
+from datamodel import AgentWorkFlowConfig, DBWebRequestModel, Message, SocketMessage
+from utils import (
+    BlobStore,
+    DBManager,
+    FileChangeTracker,
+    dbutils,
+    compact_transcript,
+    extract_successful_code_blocks,
+    md5_hash,
+)
+from metrics import WORKFLOWS_IN_FLIGHT
+from profiler import run_scope
+from socketbatch import SocketBatcher
+from summarizer import ChatSummarizer, get_default_summarizer
+from tracing import span
+
+if TYPE_CHECKING:
+    from workflowmanager import AutoGenWorkFlowManager
+
+logger = logging.getLogger(__name__)
 
 
 class AutoGenChatManager:
-    def __init__(self, message_queue: Queue) -> None:
+    def __init__(
+        self,
+        message_queue: Queue,
+        summarizer: Optional[ChatSummarizer] = None,
+        blob_store: Optional[BlobStore] = None,
+    ) -> None:
         self.message_queue = message_queue
+        self.summarizer = summarizer or get_default_summarizer()
+        self.blob_store = blob_store
+        self.pending_summaries: Dict[str, Dict[str, Any]] = {}
 
     def send(self, message: str) -> None:
         if self.message_queue is not None:
@@ -37,6 +63,10 @@ class AutoGenChatManager:
         if flow_config is None:
             raise ValueError("flow_config must be specified")
 
+        # autogen is slow to import, load it with the first chat instead of at startup
+        with span("workflow.import"):
+            from workflowmanager import AutoGenWorkFlowManager
+
         flow = AutoGenWorkFlowManager(
             config=flow_config,
             history=history,
@@ -47,20 +77,38 @@ class AutoGenChatManager:
 
         message_text = message.content.strip()
 
+        file_tracker = FileChangeTracker(work_dir)
+        with span("files.scan"):
+            file_tracker.start()
         start_time = time.time()
-        flow.run(message=f"{message_text}", clear_history=False)
+        WORKFLOWS_IN_FLIGHT.inc()
+        try:
+            flow.run(message=f"{message_text}", clear_history=False)
+        finally:
+            WORKFLOWS_IN_FLIGHT.dec()
         end_time = time.time()
+        with span("files.scan"):
+            file_changes = file_tracker.changes()
+        if self.blob_store is not None:
+            # the run is over, its outputs are deduplicated against earlier runs
+            with span("files.dedup"):
+                for file_path, sha256 in file_tracker.hashes.items():
+                    self.blob_store.add(file_path, sha256)
 
         metadata = {
-            "messages": flow.agent_history,
+            "messages": flow.agent_history.to_metadata(),
             "summary_method": flow_config.summary_method,
             "time": end_time - start_time,
-            "files": get_modified_files(start_time, end_time, source_dir=work_dir),
+            "files": [file for file in file_changes if file["status"] != "deleted"],
+            "deleted_files": [file for file in file_changes if file["status"] == "deleted"],
+            "termination": flow.termination_policy.summary(),
         }
 
-        print("Modified files: ", len(metadata["files"]))
+        logger.debug("Modified files: %d", len(metadata["files"]))
 
         output = self._generate_output(message_text, flow, flow_config)
+        if flow_config.summary_method == "llm":
+            metadata["summary_pending"] = True
 
         output_message = Message(
             user_id=message.user_id,
@@ -71,31 +119,132 @@ class AutoGenChatManager:
             session_id=message.session_id,
         )
 
+        if flow_config.summary_method == "llm":
+            self.pending_summaries[output_message.msg_id] = {
+                "task": message_text,
+                "transcript": compact_transcript(flow.agent_history),
+                "model": flow.config.receiver.config.llm_config.config_list[0],
+                "connection_id": connection_id,
+            }
+
         return output_message
 
     def _generate_output(
-        self, message_text: str, flow: AutoGenWorkFlowManager, flow_config: AgentWorkFlowConfig
+        self, message_text: str, flow: "AutoGenWorkFlowManager", flow_config: AgentWorkFlowConfig
     ) -> str:
         output = ""
-        if flow_config.summary_method == "last":
+        # "llm" answers with the last message right away, the summary replaces it once start_summary finishes
+        if flow_config.summary_method in ("last", "llm"):
             successful_code_blocks = extract_successful_code_blocks(flow.agent_history)
             last_message = flow.agent_history[-1]["message"]["content"] if flow.agent_history else ""
             successful_code_blocks = "\n\n".join(successful_code_blocks)
             output = (last_message + "\n" + successful_code_blocks) if successful_code_blocks else last_message
-        elif flow_config.summary_method == "llm":
-            model = flow.config.receiver.config.llm_config.config_list[0]
-            status_message = SocketMessage(
-                type="agent_status",
-                data={"status": "summarizing", "message": "Generating summary of agent dialogue"},
-                connection_id=flow.connection_id,
-            )
-            self.send(status_message.dict())
-            output = summarize_chat_history(task=message_text, messages=flow.agent_history, model=model)
-
         elif flow_config.summary_method == "none":
             output = ""
         return output
 
+    def start_summary(self, message: Message, dbmanager: DBManager) -> None:
+        """
+        Summarizes the dialogue behind a stored response message in the background, then patches the stored message
+        and pushes the summary to the client as an agent_summary socket message.
+        """
+        pending = self.pending_summaries.pop(message.msg_id, None)
+        if pending is None:
+            return
+
+        status_message = SocketMessage(
+            type="agent_status",
+            data={"status": "summarizing", "message": "Generating summary of agent dialogue"},
+            connection_id=pending["connection_id"],
+        )
+        self.send(status_message.dict())
+
+        def on_summary(summary: Optional[str]) -> None:
+            metadata = json.loads(message.metadata)
+            metadata["summary_pending"] = False
+            content = summary if summary is not None else message.content
+            dbutils.update_message(
+                msg_id=message.msg_id, content=content, metadata=json.dumps(metadata), dbmanager=dbmanager
+            )
+            if summary is None:
+                return
+            summary_message = SocketMessage(
+                type="agent_summary",
+                data={"msg_id": message.msg_id, "session_id": message.session_id, "content": summary},
+                connection_id=pending["connection_id"],
+            )
+            self.send(summary_message.dict())
+
+        self.summarizer.submit(pending["task"], pending["transcript"], pending["model"], on_summary)
+
+
+def process_chat_request(
+    req: DBWebRequestModel,
+    chat_manager: AutoGenChatManager,
+    dbmanager: DBManager,
+    files_static_root: str,
+    raise_errors: bool = False,
+) -> Dict[str, Any]:
+    """
+    Runs a single user message through its workflow and stores both messages. Shared by the inline web path and
+    queue workers, it is safe to retry: a user message that was already stored is not inserted again.
+    """
+    attributes = {"session.id": req.message.session_id, "workflow.name": req.workflow.name if req.workflow else None}
+    with span("chat.turn", attributes) as turn, run_scope(req.message.session_id, req.message.msg_id):
+        message = Message(**req.message.dict())
+        db_start = time.time()
+        user_history = dbutils.get_messages(
+            user_id=message.user_id, session_id=req.message.session_id, dbmanager=dbmanager
+        )
+
+        # save incoming message to db
+        if any(row["msg_id"] == message.msg_id for row in user_history):
+            user_history = [row for row in user_history if row["msg_id"] != message.msg_id]
+        else:
+            dbutils.create_message(message=message, dbmanager=dbmanager)
+        db_time = time.time() - db_start
+        user_dir = os.path.join(files_static_root, "user", md5_hash(message.user_id))
+        os.makedirs(user_dir, exist_ok=True)
+
+        try:
+            response_message: Message = chat_manager.chat(
+                message=message,
+                history=user_history,
+                user_dir=user_dir,
+                flow_config=req.workflow,
+                connection_id=req.connection_id,
+            )
+
+            # db time and stage timings of the turn up to storing the response, the response insert itself is only in
+            # the api response and the exported trace
+            metadata = json.loads(response_message.metadata)
+            metadata["db_time"] = db_time
+            metadata["timings"] = turn.timings()
+            response_message.metadata = json.dumps(metadata)
+
+            # save agent's response to db
+            db_start = time.time()
+            messages = dbutils.create_message(message=response_message, dbmanager=dbmanager)
+            db_time += time.time() - db_start
+            chat_manager.start_summary(response_message, dbmanager)
+            response = {
+                "status": True,
+                "message": "Message processed successfully",
+                "data": messages,
+                "db_time": db_time,
+                # "metadata": json.loads(response_message.metadata),
+            }
+            return response
+        except Exception as ex_error:
+            turn.set_error(ex_error)
+            logger.exception("Error occurred while processing message")
+            if raise_errors:
+                raise
+            return {
+                "status": False,
+                "message": "Error occurred while processing message: " + str(ex_error),
+            }
+
 
 class WebSocketConnectionManager:
     def __init__(
@@ -110,37 +259,55 @@ class WebSocketConnectionManager:
             active_connections = []
         self.active_connections_lock = active_connections_lock
         self.active_connections: List[Tuple[WebSocket, str]] = active_connections
+        self.batchers: Dict[WebSocket, SocketBatcher] = {}
 
-    async def connect(self, websocket: WebSocket, client_id: str) -> None:
+    async def connect(self, websocket: WebSocket, client_id: str, batch: bool = False) -> None:
+        """Accepts a connection, with batch=True its messages are coalesced into compact batch frames"""
         await websocket.accept()
+        if batch:
+
+            async def send_text(text: str) -> None:
+                await self._send(websocket, websocket.send_text, text)
+
+            self.batchers[websocket] = SocketBatcher(send_text)
         async with self.active_connections_lock:
             self.active_connections.append((websocket, client_id))
-            print(f"New Connection: {client_id}, Total: {len(self.active_connections)}")
+            logger.debug("New connection %s, total: %d", client_id, len(self.active_connections))
 
     async def disconnect(self, websocket: WebSocket) -> None:
+        batcher = self.batchers.pop(websocket, None)
+        if batcher is not None:
+            batcher.close()
         async with self.active_connections_lock:
             try:
                 self.active_connections = [conn for conn in self.active_connections if conn[0] != websocket]
-                print(f"Connection Closed. Total: {len(self.active_connections)}")
+                logger.debug("Connection closed, total: %d", len(self.active_connections))
             except ValueError:
-                print("Error: WebSocket connection not found")
+                logger.warning("WebSocket connection not found")
 
     async def disconnect_all(self) -> None:
         for connection, _ in self.active_connections[:]:
             await self.disconnect(connection)
 
     async def send_message(self, message: Dict, websocket: WebSocket) -> None:
+        batcher = self.batchers.get(websocket)
+        if batcher is not None:
+            batcher.add(message)
+            return
+        await self._send(websocket, websocket.send_json, message)
+
+    async def _send(self, websocket: WebSocket, send: Callable[[Any], Awaitable[None]], data: Any) -> None:
         try:
             async with self.active_connections_lock:
-                await websocket.send_json(message)
+                await send(data)
         except WebSocketDisconnect:
-            print("Error: Tried to send a message to a closed WebSocket")
+            logger.warning("Tried to send a message to a closed WebSocket")
             await self.disconnect(websocket)
         except websockets.exceptions.ConnectionClosedOK:
-            print("Error: WebSocket connection closed normally")
+            logger.debug("WebSocket connection closed normally")
             await self.disconnect(websocket)
         except Exception as e:
-            print(f"Error in sending message: {str(e)}")
+            logger.error("Error in sending message: %s", e)
             await self.disconnect(websocket)
 
     async def broadcast(self, message: Dict) -> None:
@@ -152,8 +319,8 @@ class WebSocketConnectionManager:
                     # Call send_message method with the message dictionary and current WebSocket connection
                     await self.send_message(message_dict, connection)
                 else:
-                    print("Error: WebSocket connection is closed")
+                    logger.debug("WebSocket connection is closed")
                     await self.disconnect(connection)
             except (WebSocketDisconnect, websockets.exceptions.ConnectionClosedOK) as e:
-                print(f"Error: WebSocket disconnected or closed({str(e)})")
+                logger.debug("WebSocket disconnected or closed (%s)", e)
                 await self.disconnect(connection)
@@ -1,7 +1,7 @@
 import os
+from typing import List
 
 import typer
-import uvicorn
 from typing_extensions import Annotated
 
 from version import VERSION
@@ -17,17 +17,135 @@ def ui(
     reload: Annotated[bool, typer.Option("--reload")] = False,
     docs: bool = False,
     appdir: str = None,
+    queue: Annotated[bool, typer.Option("--queue")] = False,
+    ws_per_message_deflate: bool = True,
 ):
     os.environ["AUTOGENSTUDIO_API_DOCS"] = str(docs)
+    os.environ["AUTOGENSTUDIO_QUEUE"] = str(queue)
+    # with several workers, socket messages are exchanged over a message bus (see messagebus.py)
+    os.environ["AUTOGENSTUDIO_WORKERS"] = str(workers)
     if appdir:
         os.environ["AUTOGENSTUDIO_APPDIR"] = appdir
 
+    import uvicorn
+
     uvicorn.run(
         "web.app:app",
         host=host,
         port=port,
         workers=workers,
         reload=reload,
+        ws_per_message_deflate=ws_per_message_deflate,
+    )
+
+
+@app.command()
+def worker(
+    concurrency: int = 1,
+    poll_interval: float = 1,
+    appdir: str = None,
+    metrics_port: int = None,
+):
+    if appdir:
+        os.environ["AUTOGENSTUDIO_APPDIR"] = appdir
+
+    from worker import run_worker
+
+    run_worker(concurrency=concurrency, poll_interval=poll_interval, metrics_port=metrics_port)
+
+
+def _app_context(appdir: str = None):
+    if appdir:
+        os.environ["AUTOGENSTUDIO_APPDIR"] = appdir
+
+    from utils import DBManager, init_app_folders
+
+    folders = init_app_folders(os.path.join(os.path.dirname(os.path.abspath(__file__)), "web"))
+    dbmanager = DBManager(path=os.path.join(folders["app_root"], "database.sqlite"))
+    return dbmanager, folders["files_static_root"]
+
+
+@app.command("export")
+def export_sessions(
+    output: str,
+    user_id: str = None,
+    session_id: Annotated[List[str], typer.Option()] = None,
+    workflows: bool = True,
+    compression: str = None,
+    appdir: str = None,
+):
+    from archive import export_archive
+
+    dbmanager, files_static_root = _app_context(appdir)
+    with open(output, "wb") as f:
+        stats = export_archive(
+            f,
+            dbmanager=dbmanager,
+            files_static_root=files_static_root,
+            user_id=user_id,
+            session_ids=session_id or None,
+            include_workflows=workflows,
+            compression=compression,
+        )
+    typer.echo(f"Exported {stats} to {output}")
+
+
+@app.command("import")
+def import_sessions(
+    archive: str,
+    user_id: str = None,
+    appdir: str = None,
+):
+    from archive import import_archive
+
+    dbmanager, files_static_root = _app_context(appdir)
+    with open(archive, "rb") as f:
+        stats = import_archive(f, dbmanager=dbmanager, files_static_root=files_static_root, user_id=user_id)
+    typer.echo(f"Imported {stats} from {archive}")
+
+
+@app.command()
+def batch(
+    tasks: str,
+    workflow_id: str,
+    output: str = "results.jsonl",
+    concurrency: int = 4,
+    user_id: str = "batch",
+    retry_failed: bool = True,
+    appdir: str = None,
+):
+    """Runs a workflow over a JSONL file of tasks, rerunning with the same output resumes where it stopped"""
+    from batch import BatchRun
+    from logconfig import configure_logging
+    from utils import dbutils
+
+    configure_logging()
+    dbmanager, files_static_root = _app_context(appdir)
+    workflow = dbutils.get_workflow(workflow_id, dbmanager)
+    if workflow is None:
+        raise typer.BadParameter(f"Workflow {workflow_id} not found", param_hint="--workflow-id")
+
+    def on_progress(run: BatchRun) -> None:
+        typer.echo(f"{run.completed} done, {run.failed} failed ({run.skipped} skipped)", err=True)
+
+    run = BatchRun(
+        workflow,
+        tasks_path=tasks,
+        results_path=output,
+        files_static_root=files_static_root,
+        user_id=user_id,
+        concurrency=concurrency,
+        retry_failed=retry_failed,
+    )
+    try:
+        summary = run.run(on_progress=on_progress)
+    except KeyboardInterrupt:
+        run.cancel()
+        raise
+    latency = summary["latency"]
+    typer.echo(
+        f"{summary['ok']} ok, {summary['failed']} failed, p50 {latency['p50']:.1f}s p95 {latency['p95']:.1f}s, "
+        f"{summary['usage']['input_tokens'] + summary['usage']['output_tokens']} tokens. Results in {output}"
     )
 
 
@@ -68,6 +68,10 @@ class Model:
     timestamp: Optional[str] = None
     user_id: Optional[str] = None
     description: Optional[str] = None
+    # YandexGPT folder of the api_key, and optionally more keys to balance over as
+    # [{"api_key": ..., "folder_id": ..., "weight": 1}, ...]
+    folder_id: Optional[str] = None
+    credentials: Optional[List[Dict[str, Any]]] = None
 
     def dict(self):
         result = asdict(self)
@@ -207,6 +211,7 @@ class AgentWorkFlowConfig:
     user_id: Optional[str] = None
     timestamp: Optional[str] = None
     summary_method: Optional[Literal["last", "none", "llm"]] = "last"
+    termination_config: Optional[Dict[str, Any]] = None
 
     def init_spec(self, spec: Dict):
         """initialize the agent spec"""
@@ -0,0 +1,138 @@
+import json
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+HISTORY_DIR = ".history"
+PREVIEW_LENGTH = 2000
+
+
+class HistoryRecord:
+    """Compact agent message record, large contents live in a spill file referenced by ref"""
+
+    __slots__ = ("sender", "recipient", "sender_type", "timestamp", "role", "content", "extra", "ref", "length")
+
+    def __init__(
+        self,
+        sender: str,
+        recipient: str,
+        sender_type: str,
+        timestamp: str,
+        role: Optional[str],
+        content: Optional[str],
+        extra: Optional[Dict[str, Any]] = None,
+        ref: Optional[str] = None,
+        length: int = 0,
+    ) -> None:
+        self.sender = sender
+        self.recipient = recipient
+        self.sender_type = sender_type
+        self.timestamp = timestamp
+        self.role = role
+        self.content = content
+        self.extra = extra
+        self.ref = ref
+        self.length = length
+
+
+class AgentHistory:
+    """
+    Bounded in-memory store for the agent messages of a workflow run. It behaves like the list of payload dicts it
+    replaces, but keeps __slots__ records with interned agent names and spills message contents larger than
+    spill_threshold to files under <work_dir>/.history. Only a preview of spilled messages stays in memory.
+    """
+
+    def __init__(self, work_dir: str, connection_id: Optional[str] = None, spill_threshold: int = 16 * 1024) -> None:
+        self.work_dir = work_dir
+        self.connection_id = connection_id
+        self.spill_threshold = spill_threshold
+        self.records: List[HistoryRecord] = []
+        self.total_chars = 0
+
+    def append(self, payload: Dict[str, Any]) -> None:
+        message = dict(payload["message"])
+        role = message.pop("role", None)
+        content = message.pop("content", None)
+        length = len(content) if isinstance(content, str) else 0
+        record = HistoryRecord(
+            sender=sys.intern(payload["sender"]),
+            recipient=sys.intern(payload["recipient"]),
+            sender_type=sys.intern(payload.get("sender_type", "agent")),
+            timestamp=payload["timestamp"],
+            role=role,
+            content=content,
+            extra=message or None,
+            length=length,
+        )
+
+        if length > self.spill_threshold:
+            record.ref = self._spill(len(self.records), payload)
+            record.content = content[:PREVIEW_LENGTH]
+
+        self.records.append(record)
+        self.total_chars += length
+
+    def _spill(self, index: int, payload: Dict[str, Any]) -> str:
+        history_dir = os.path.join(self.work_dir, HISTORY_DIR)
+        os.makedirs(history_dir, exist_ok=True)
+        file_path = os.path.join(history_dir, f"{index}.json")
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(payload["message"], f)
+
+        # refs use the same files/user/... form as get_modified_files so they are served under /api/files
+        return "files/user" + file_path.split("files/user", 1)[1] if "files/user" in file_path else file_path
+
+    def _load_message(self, record: HistoryRecord) -> Dict[str, Any]:
+        if record.ref is not None:
+            path = record.ref
+            if not os.path.isabs(path):
+                path = os.path.join(self.work_dir, HISTORY_DIR, os.path.basename(path))
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        message = {"content": record.content, "role": record.role}
+        if record.extra:
+            message.update(record.extra)
+        return message
+
+    def _payload(self, record: HistoryRecord, message: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "recipient": record.recipient,
+            "sender": record.sender,
+            "message": message,
+            "timestamp": record.timestamp,
+            "sender_type": record.sender_type,
+            "connection_id": self.connection_id,
+            "message_type": "agent_message",
+        }
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __bool__(self) -> bool:
+        return bool(self.records)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        if isinstance(index, slice):
+            return [self._payload(record, self._load_message(record)) for record in self.records[index]]
+        record = self.records[index]
+        return self._payload(record, self._load_message(record))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for record in self.records:
+            yield self._payload(record, self._load_message(record))
+
+    def to_metadata(self) -> List[Dict[str, Any]]:
+        """Message list for the stored metadata, spilled messages carry a preview and a ref to the full payload"""
+        messages = []
+        for record in self.records:
+            message = {"content": record.content, "role": record.role}
+            if record.extra:
+                message.update(record.extra)
+            payload = self._payload(record, message)
+            del payload["connection_id"]
+            if record.ref is not None:
+                payload["ref"] = record.ref
+                payload["truncated"] = True
+            messages.append(payload)
+        return messages
@@ -0,0 +1,190 @@
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOBS_TABLE_SQL = """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                visible_at REAL NOT NULL,
+                worker_id TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (id)
+            )
+            """
+
+JOBS_INDEX_SQL = "CREATE INDEX IF NOT EXISTS jobs_status_visible_at ON jobs (status, visible_at)"
+
+JOB_EVENTS_TABLE_SQL = """
+            CREATE TABLE IF NOT EXISTS job_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT,
+                connection_id TEXT,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+
+
+class JobQueue:
+    """
+    Durable job queue backed by SQLite. A claimed job stays invisible to other workers until its visibility timeout
+    expires; workers extend it with heartbeat() while a job runs. Jobs whose worker dies become visible again and are
+    retried until max_attempts is reached.
+    """
+
+    def __init__(self, path: str, visibility_timeout: float = 300, max_attempts: int = 3) -> None:
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(JOBS_TABLE_SQL)
+        self.conn.execute(JOBS_INDEX_SQL)
+        self.conn.execute(JOB_EVENTS_TABLE_SQL)
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], max_attempts: Optional[int] = None) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, max_attempts, visible_at, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), max_attempts or self.max_attempts, now, now, now),
+            )
+        return job_id
+
+    def claim(self, worker_id: str, kinds: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # running jobs past their visibility timeout have lost their worker
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'visibility timeout exceeded', updated_at = ? WHERE status = 'running' AND visible_at <= ? AND attempts >= max_attempts",
+                    (now, now),
+                )
+                query = "SELECT id FROM jobs WHERE status IN ('queued', 'running') AND visible_at <= ?"
+                args: tuple = (now,)
+                if kinds:
+                    query += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+                    args += tuple(kinds)
+                row = self.conn.execute(query + " ORDER BY created_at LIMIT 1", args).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, visible_at = ?, worker_id = ?, updated_at = ? WHERE id = ?",
+                    (now + self.visibility_timeout, worker_id, now, row[0]),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0])
+
+    def heartbeat(self, job_id: str, worker_id: str) -> None:
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET visible_at = ?, updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now + self.visibility_timeout, now, job_id, worker_id),
+            )
+
+    def complete(self, job_id: str, worker_id: str, result: Any) -> None:
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, updated_at = ? WHERE id = ? AND worker_id = ?",
+                (json.dumps(result), time.time(), job_id, worker_id),
+            )
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Records a failed attempt, returns whether the job is retried"""
+        job = self.get(job_id)
+        if job is None:
+            return False
+        now = time.time()
+        with self.lock:
+            if job["attempts"] < job["max_attempts"]:
+                backoff = min(60, 2 ** job["attempts"]) * random.uniform(0.5, 1.5)
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, visible_at = ?, worker_id = NULL, updated_at = ? WHERE id = ? AND worker_id = ?",
+                    (error, now + backoff, now, job_id, worker_id),
+                )
+                return True
+            else:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ? AND worker_id = ?",
+                    (error, now, job_id, worker_id),
+                )
+                return False
+
+    def depth(self) -> int:
+        """Number of jobs waiting to be claimed"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            cursor = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            job = dict(zip([key[0] for key in cursor.description], row))
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def publish_event(self, message: Dict[str, Any], job_id: Optional[str] = None) -> None:
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO job_events (job_id, connection_id, payload, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, message.get("connection_id"), json.dumps(message), time.time()),
+            )
+
+    def last_event_id(self) -> int:
+        with self.lock:
+            row = self.conn.execute("SELECT MAX(id) FROM job_events").fetchone()
+        return row[0] or 0
+
+    def read_events(self, after_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, payload FROM job_events WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+            ).fetchall()
+        return [{"id": row[0], "message": json.loads(row[1])} for row in rows]
+
+    def prune(self, max_age: float = 24 * 3600) -> None:
+        cutoff = time.time() - max_age
+        with self.lock:
+            self.conn.execute("DELETE FROM job_events WHERE created_at < ?", (cutoff,))
+            self.conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class JobEventPublisher:
+    """Queue-like adapter so AutoGenChatManager can stream agent messages of a job through the queue database"""
+
+    def __init__(self, job_queue: JobQueue, job_id: str) -> None:
+        self.job_queue = job_queue
+        self.job_id = job_id
+
+    def put_nowait(self, message: Dict[str, Any]) -> None:
+        self.job_queue.publish_event(message, job_id=self.job_id)
@@ -0,0 +1,221 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from tracing import current_span
+
+# attributes of every LogRecord, anything else on a record came in through extra= and is logged as a field
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+REDACTED = "[REDACTED]"
+SECRET_PATTERNS: List[Tuple[re.Pattern, str]] = [
+    # Authorization headers and header dicts: Api-Key <key>, Bearer <token>
+    (re.compile(r"\b(Api-Key|Bearer)\s+[\w\-.~+/=]+", re.IGNORECASE), rf"\1 {REDACTED}"),
+    # key/value pairs in JSON, dict reprs, query strings and env style assignments
+    (
+        re.compile(
+            r"""(["']?\b(?:api_key|apikey|api-key|token|access_token|secret|password|authorization)["']?\s*[:=]\s*)"""
+            r"""(["']?)[^"'\s,}&]+""",
+            re.IGNORECASE,
+        ),
+        rf"\1\2{REDACTED}",
+    ),
+    # bare Yandex Cloud API keys and IAM tokens, OpenAI style keys
+    (re.compile(r"\bAQVN[\w\-]{20,}"), REDACTED),
+    (re.compile(r"\bt1\.[\w\-.]{20,}"), REDACTED),
+    (re.compile(r"\bsk-[\w\-]{20,}"), REDACTED),
+]
+SECRET_FIELDS = re.compile(r"api_?key|token|secret|password|authorization", re.IGNORECASE)
+
+# high-frequency debug/info events that are sampled unless configured otherwise, as logger name -> kept fraction
+DEFAULT_SAMPLING = {"yandexgpt.http_client": 0.05}
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _redact_value(key: str, value: Any) -> Any:
+    if SECRET_FIELDS.search(key):
+        return REDACTED
+    if isinstance(value, str):
+        return redact(value)
+    if isinstance(value, dict):
+        return {k: _redact_value(str(k), v) for k, v in value.items()}
+    return value
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the timestamp, level, logger, message, extra fields and trace ids"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = _redact_value(key, value)
+        if record.exc_text or record.exc_info:
+            entry["exc"] = redact(record.exc_text or self.formatException(record.exc_info))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Human readable lines for local development, redacted like the JSON output"""
+
+    def __init__(self) -> None:
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = {key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES}
+        if fields:
+            line += " " + " ".join(f"{key}={_redact_value(key, value)}" for key, value in fields.items())
+        return redact(line)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps one in every 1/rate records per logger and message template below WARNING, so hot loops log a
+    representative trickle. Warnings and errors always pass. Kept records carry the sampling rate as a field.
+    """
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        # longest prefix first, so "yandexgpt.http_client" wins over "yandexgpt"
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self.counts: Dict[Tuple[str, Any], int] = {}
+        self.lock = threading.Lock()
+
+    def rate(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        every = round(1 / rate)
+        key = (record.name, record.msg)
+        with self.lock:
+            count = self.counts.get(key, 0)
+            self.counts[key] = count + 1
+        if count % every:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a background listener thread. Only the message is rendered on the calling thread, formatting,
+    redaction and I/O happen on the listener. When the queue is full records are dropped and counted rather than
+    blocking the caller.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        span = current_span()
+        if span is not None:
+            record.trace_id, record.span_id = span.trace_id, span.span_id
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """Parses "yandexgpt=DEBUG,web.app=WARNING" into logger name -> level"""
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """Parses "yandexgpt.http_client=0.05,chatmanager=0.5" into logger name -> kept fraction"""
+    return {name: float(rate) for name, rate in parse_levels(spec).items()}
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    levels: Optional[Dict[str, str]] = None,
+    sampling: Optional[Dict[str, float]] = None,
+) -> None:
+    """
+    Routes all logging through a queue to a stderr handler on a background thread. Settings default to the
+    environment: AUTOGENSTUDIO_LOG_LEVEL (INFO), AUTOGENSTUDIO_LOG_FORMAT (json or text),
+    AUTOGENSTUDIO_LOG_LEVELS ("module=LEVEL,...") and AUTOGENSTUDIO_LOG_SAMPLING ("module=fraction,...").
+    Safe to call more than once, only the first call configures.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = level or os.environ.get("AUTOGENSTUDIO_LOG_LEVEL", "INFO")
+    fmt = fmt or os.environ.get("AUTOGENSTUDIO_LOG_FORMAT", "json")
+    if levels is None:
+        levels = parse_levels(os.environ.get("AUTOGENSTUDIO_LOG_LEVELS", ""))
+    if sampling is None:
+        sampling = {**DEFAULT_SAMPLING, **parse_sampling(os.environ.get("AUTOGENSTUDIO_LOG_SAMPLING", ""))}
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=10000)
+    queue_handler = AsyncQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sampling))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+    # uvicorn logs through its own stdout handlers, the access log writes a line per request
+    for name in ("uvicorn", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        if uvicorn_logger.handlers:
+            uvicorn_logger.handlers = [queue_handler]
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
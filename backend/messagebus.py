@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+REDIS_CHANNEL = "autogenstudio:messages"
+
+BUS_MESSAGES_TABLE_SQL = """
+            CREATE TABLE IF NOT EXISTS bus_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                origin TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+
+
+class MessageBus(ABC):
+    """
+    Delivers socket messages to every web worker process. Each worker listens on the bus and forwards the messages
+    whose connection_id belongs to one of its own websocket connections. put_nowait() makes a bus usable as the
+    message_queue of AutoGenChatManager.
+    """
+
+    @abstractmethod
+    def publish(self, message: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def listen(self) -> Iterator[Dict[str, Any]]:
+        """Blocking iterator over the messages published by any process, meant to be consumed by one thread"""
+
+    def put_nowait(self, message: Dict[str, Any]) -> None:
+        self.publish(message)
+
+    def depth(self) -> int:
+        """Messages published or received by this process that the listener has not consumed yet"""
+        return 0
+
+    def close(self) -> None:
+        pass
+
+
+class LocalMessageBus(MessageBus):
+    """In-process bus for a single web worker"""
+
+    def __init__(self) -> None:
+        self.queue: queue.Queue = queue.Queue()
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        self.queue.put_nowait(message)
+
+    def listen(self) -> Iterator[Dict[str, Any]]:
+        while True:
+            yield self.queue.get()
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+
+class SQLiteMessageBus(MessageBus):
+    """
+    Bus shared by the worker processes of one host through a WAL SQLite table. Every listener keeps its own cursor
+    (the last row id it has read), so each message fans out to all workers. Messages published by this process are
+    also handed to the local listener directly and skipped when they come back from the table, so local delivery does
+    not wait for the poll interval. Rows older than retention seconds are pruned.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.05, retention: float = 60) -> None:
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.local: queue.Queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.last_prune = time.time()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(BUS_MESSAGES_TABLE_SQL)
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO bus_messages (origin, payload, created_at) VALUES (?, ?, ?)",
+                (self.origin, json.dumps(message), now),
+            )
+            if now - self.last_prune > self.retention:
+                self.conn.execute("DELETE FROM bus_messages WHERE created_at < ?", (now - self.retention,))
+                self.last_prune = now
+        self.local.put_nowait(message)
+
+    def listen(self) -> Iterator[Dict[str, Any]]:
+        with self.lock:
+            last_id = self.conn.execute("SELECT MAX(id) FROM bus_messages").fetchone()[0] or 0
+        next_poll = 0.0
+        while True:
+            try:
+                yield self.local.get(timeout=max(0.0, next_poll - time.time()))
+                if time.time() < next_poll:
+                    continue
+            except queue.Empty:
+                pass
+
+            next_poll = time.time() + self.poll_interval
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT id, origin, payload FROM bus_messages WHERE id > ? ORDER BY id LIMIT 500", (last_id,)
+                ).fetchall()
+            for row_id, origin, payload in rows:
+                last_id = row_id
+                if origin != self.origin:
+                    yield json.loads(payload)
+
+    def depth(self) -> int:
+        return self.local.qsize()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class RedisMessageBus(MessageBus):
+    """Bus over Redis (or a Redis-compatible broker) pub/sub, for workers spread over several hosts"""
+
+    def __init__(self, url: str, channel: str = REDIS_CHANNEL) -> None:
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis message bus requires the redis package, install it with: pip install redis")
+
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        self.client.publish(self.channel, json.dumps(message))
+
+    def listen(self) -> Iterator[Dict[str, Any]]:
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for item in pubsub.listen():
+            if item["type"] == "message":
+                yield json.loads(item["data"])
+
+    def close(self) -> None:
+        self.client.close()
+
+
+def get_message_bus(app_root: str, url: Optional[str] = None) -> MessageBus:
+    """
+    Returns the bus configured by url or AUTOGENSTUDIO_MESSAGE_BUS: "local", "sqlite" or a redis:// url. Without a
+    setting a SQLite bus is used when the app runs with several workers and a local bus otherwise.
+    """
+    url = url or os.environ.get("AUTOGENSTUDIO_MESSAGE_BUS")
+    if not url:
+        url = "sqlite" if int(os.environ.get("AUTOGENSTUDIO_WORKERS", "1")) > 1 else "local"
+
+    if url == "local":
+        return LocalMessageBus()
+    if url == "sqlite":
+        return SQLiteMessageBus(path=os.path.join(app_root, "messagebus.sqlite"))
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisMessageBus(url)
+    raise ValueError(f"Unknown message bus: {url}")
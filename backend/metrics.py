@@ -0,0 +1,295 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+from tracing import STATUS_ERROR, Span, tracer
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "autogenstudio_"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 30, 60, 120, 300)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    """
+    Base of the metric types. Values are kept per tuple of label values under a lock, so updates from worker
+    threads are safe and cost a dict lookup and an addition.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[Tuple[str, LabelValues, float, Sequence[str]]]:
+        ...
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, values, value, labelnames in self.samples():
+            lines.append(f"{name}{_format_labels(labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name + "_total", key, value, self.labelnames) for key, value in self.values.items()]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[LabelValues, float] = {}
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels: str) -> None:
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Reads the value from function at scrape time, for values that are cheaper to look up than to track"""
+        self.function = function
+
+    def samples(self):
+        if self.function is not None:
+            try:
+                return [(self.name, (), float(self.function()), ())]
+            except Exception:
+                return []
+        with self.lock:
+            return [(self.name, key, value, self.labelnames) for key, value in self.values.items()]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # per label values: non-cumulative bucket counts, sum and count
+        self.values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        samples = []
+        labelnames = self.labelnames + ("le",)
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((self.name + "_bucket", key + (_format_value(bound),), cumulative, labelnames))
+                samples.append((self.name + "_sum", key, total, self.labelnames))
+                samples.append((self.name + "_count", key, count, self.labelnames))
+        return samples
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION: Histogram = REGISTRY.register(
+    Histogram("http_request_duration_seconds", "Latency of api requests.", ("method", "route", "status"))
+)
+WEBSOCKET_CONNECTIONS: Gauge = REGISTRY.register(Gauge("websocket_connections", "Open websocket connections."))
+MESSAGE_QUEUE_DEPTH: Gauge = REGISTRY.register(
+    Gauge("message_queue_depth", "Socket messages waiting for delivery in this process.")
+)
+JOB_QUEUE_DEPTH: Gauge = REGISTRY.register(Gauge("job_queue_depth", "Chat jobs waiting for a queue worker."))
+WORKFLOWS_IN_FLIGHT: Gauge = REGISTRY.register(Gauge("workflows_in_flight", "Agent workflows currently running."))
+LLM_REQUESTS: Counter = REGISTRY.register(Counter("llm_requests", "LLM completion calls.", ("model", "status")))
+LLM_REQUEST_DURATION: Histogram = REGISTRY.register(
+    Histogram("llm_request_duration_seconds", "Latency of LLM completion calls.", ("model",))
+)
+LLM_TOKENS: Counter = REGISTRY.register(Counter("llm_tokens", "Tokens used by LLM calls.", ("model", "type")))
+LLM_OPERATION_POLLS: Histogram = REGISTRY.register(
+    Histogram("llm_operation_polls", "Polls until an async LLM operation was done.", buckets=COUNT_BUCKETS)
+)
+DB_QUERY_DURATION: Histogram = REGISTRY.register(
+    Histogram(
+        "db_query_duration_seconds", "Latency of database queries by dbutils function.", ("function",), DB_BUCKETS
+    )
+)
+STAGE_DURATION: Histogram = REGISTRY.register(
+    Histogram("stage_duration_seconds", "Duration of traced stages of a chat turn.", ("stage",))
+)
+CACHE_REQUESTS: Counter = REGISTRY.register(Counter("cache_requests", "Cache lookups.", ("cache", "result")))
+LLM_CREDENTIAL_HEALTHY: Gauge = REGISTRY.register(
+    Gauge(
+        "llm_credential_healthy", "Whether an LLM credential (key fingerprint/folder) is in rotation.", ("credential",)
+    )
+)
+WORKFLOWS_IN_FLIGHT.set(0)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank q-th percentile of values, shared by batch summaries and the load test reports"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))]
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def _model_name(model_uri: str) -> str:
+    # gpt://<folder>/yandexgpt/latest -> yandexgpt/latest, the folder id is not a useful label
+    return model_uri.split("://", 1)[-1].split("/", 1)[-1] if model_uri else "unknown"
+
+
+def record_span(span: Span) -> None:
+    """Feeds the span based metrics, registered as a tracer listener"""
+    name, duration = span.name, span.duration or 0.0
+    if name == "db.query":
+        DB_QUERY_DURATION.observe(duration, function=span.attributes.get("db.function", "unknown"))
+        return
+
+    STAGE_DURATION.observe(duration, stage=name)
+    if name == "yandexgpt.completion":
+        model = _model_name(span.attributes.get("llm.model", ""))
+        LLM_REQUESTS.inc(model=model, status="error" if span.status == STATUS_ERROR else "ok")
+        LLM_REQUEST_DURATION.observe(duration, model=model)
+        for token_type in ("input", "output"):
+            tokens = span.attributes.get(f"llm.usage.{token_type}_tokens")
+            if tokens:
+                LLM_TOKENS.inc(tokens, model=model, type=token_type)
+    elif name == "yandexgpt.poll" and "llm.polls" in span.attributes:
+        LLM_OPERATION_POLLS.observe(span.attributes["llm.polls"])
+
+
+tracer.add_listener(record_span)
+
+
+class HTTPMetricsMiddleware:
+    """ASGI middleware that records the latency of every http request by method, route template and status"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # the router stores the matched route in the scope, its path is the template without parameters
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start, method=scope["method"], route=route, status=str(status[0])
+            )
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> "ThreadingHTTPServer":
+    """Serves /metrics from a background thread, for processes without a web app such as queue workers"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
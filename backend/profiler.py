@@ -0,0 +1,214 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# (function name, file, first line) of a code object, the unit of a flamegraph frame
+Frame = Tuple[str, str, int]
+
+# thread ident -> workflow run ids (session id, message id) the thread is working on
+_thread_runs: Dict[int, Tuple[str, ...]] = {}
+
+
+@contextmanager
+def run_scope(*run_ids: Optional[str]) -> Iterator[None]:
+    """Marks the current thread as working on the given runs, so a profiler started for one of them samples it"""
+    ident = threading.get_ident()
+    previous = _thread_runs.get(ident)
+    _thread_runs[ident] = tuple(run_id for run_id in run_ids if run_id)
+    try:
+        yield
+    finally:
+        if previous is None:
+            _thread_runs.pop(ident, None)
+        else:
+            _thread_runs[ident] = previous
+
+
+def _thread_names() -> Dict[int, str]:
+    return {thread.ident: thread.name for thread in threading.enumerate() if thread.ident is not None}
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for all threads of the process. A background thread reads sys._current_frames()
+    every interval and counts identical stacks per thread, so the cost is one stack walk per thread per sample and
+    memory grows with the number of distinct stacks, not with time. Each sample is weighted with the wall time
+    since the previous one, so a late sample (the GIL was held) does not understate the time spent. With run_id
+    only threads inside run_scope(run_id) are sampled. Sampling stops by itself after duration seconds.
+    """
+
+    def __init__(self, interval: float = 0.01, run_id: Optional[str] = None, duration: float = 60) -> None:
+        self.interval = interval
+        self.run_id = run_id
+        self.duration = duration
+        # (thread name, stack) -> [samples, seconds]
+        self.counts: Dict[Tuple[str, Tuple[Frame, ...]], List] = {}
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    @property
+    def running(self) -> bool:
+        return self.thread.is_alive()
+
+    def start(self) -> None:
+        self.started_at = time.time()
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread.is_alive() and threading.current_thread() is not self.thread:
+            self.thread.join()
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + self.duration
+        names = _thread_names()
+        last_sample = time.monotonic()
+        while not self.stopped.wait(self.interval) and time.monotonic() < deadline:
+            now = time.monotonic()
+            elapsed, last_sample = now - last_sample, now
+            frames = sys._current_frames()
+            if any(ident not in names for ident in frames):
+                names = _thread_names()
+            for ident, frame in frames.items():
+                if ident == own_ident:
+                    continue
+                if self.run_id is not None and self.run_id not in _thread_runs.get(ident, ()):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                key = (names.get(ident, str(ident)), tuple(reversed(stack)))
+                counts = self.counts.setdefault(key, [0, 0.0])
+                counts[0] += 1
+                counts[1] += elapsed
+            self.samples += 1
+        self.stopped_at = time.time()
+
+    def summary(self) -> Dict[str, Any]:
+        end = self.stopped_at or time.time()
+        return {
+            "running": self.running,
+            "run_id": self.run_id,
+            "interval": self.interval,
+            "samples": self.samples,
+            "stacks": len(self.counts),
+            "duration": end - self.started_at if self.started_at else 0,
+        }
+
+    def collapsed(self) -> str:
+        """Folded stacks ("thread;outer;...;inner count" lines) for flamegraph.pl, inferno or speedscope"""
+        lines = []
+        for (thread_name, stack), (count, _) in list(self.counts.items()):
+            frames = [thread_name] + [f"{name} ({_short_path(filename)}:{line})" for name, filename, line in stack]
+            lines.append(f"{';'.join(frame.replace(';', ':') for frame in frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> Dict[str, Any]:
+        """The profile in speedscope's file format, one sampled profile per thread weighted in seconds"""
+        frame_index: Dict[Frame, int] = {}
+        frames: List[Dict[str, Any]] = []
+        profiles: Dict[str, Dict[str, Any]] = {}
+        for (thread_name, stack), (_, seconds) in list(self.counts.items()):
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indices.append(frame_index[frame])
+            profile = profiles.setdefault(thread_name, {"name": thread_name, "samples": [], "weights": []})
+            profile["samples"].append(indices)
+            profile["weights"].append(seconds)
+        for profile in profiles.values():
+            profile.update(type="sampled", unit="seconds", startValue=0, endValue=sum(profile["weights"]))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"autogenstudio {self.run_id or 'all threads'}",
+            "exporter": "autogenstudio",
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values()),
+        }
+
+
+def _short_path(filename: str) -> str:
+    parts = filename.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+
+_profiler: Optional[SamplingProfiler] = None
+_profiler_lock = threading.Lock()
+
+
+def start_profiler(interval: float = 0.01, run_id: Optional[str] = None, duration: float = 60) -> SamplingProfiler:
+    global _profiler
+    with _profiler_lock:
+        if _profiler is not None and _profiler.running:
+            raise RuntimeError("A profiler is already running")
+        _profiler = SamplingProfiler(interval=interval, run_id=run_id, duration=duration)
+        _profiler.start()
+        return _profiler
+
+
+def stop_profiler() -> Optional[SamplingProfiler]:
+    with _profiler_lock:
+        if _profiler is not None:
+            _profiler.stop()
+        return _profiler
+
+
+def get_profiler() -> Optional[SamplingProfiler]:
+    return _profiler
+
+
+def thread_stacks() -> List[Dict[str, Any]]:
+    """Current stack of every thread, with the runs it is working on"""
+    names = _thread_names()
+    threads = []
+    for ident, frame in sys._current_frames().items():
+        threads.append(
+            {
+                "id": ident,
+                "name": names.get(ident, str(ident)),
+                "runs": list(_thread_runs.get(ident, ())),
+                "stack": traceback.format_stack(frame),
+            }
+        )
+    return threads
+
+
+def asyncio_tasks(loop: asyncio.AbstractEventLoop, limit: int = 20) -> List[Dict[str, Any]]:
+    """Pending tasks of loop and where each is suspended, must be called from the loop's thread"""
+    tasks = []
+    for task in asyncio.all_tasks(loop):
+        coro = task.get_coro()
+        stack = []
+        for frame in task.get_stack(limit=limit):
+            stack.append(f"{_short_path(frame.f_code.co_filename)}:{frame.f_lineno} in {frame.f_code.co_name}")
+        tasks.append(
+            {
+                "name": task.get_name(),
+                "coro": getattr(coro, "__qualname__", repr(coro)),
+                "done": task.done(),
+                "stack": stack,
+            }
+        )
+    return tasks
+
+
+def snapshot(loop: Optional[asyncio.AbstractEventLoop] = None) -> Dict[str, Any]:
+    return {
+        "pid": os.getpid(),
+        "time": time.time(),
+        "threads": thread_stacks(),
+        "tasks": asyncio_tasks(loop) if loop is not None else [],
+    }
@@ -0,0 +1,291 @@
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import List, Optional, Set, Tuple
+
+from utils import BLOBS_DIR, BlobStore, clear_folder, md5_hash
+
+logger = logging.getLogger(__name__)
+
+TRASH_DIR = ".trash"
+
+
+@dataclass
+class RunDir:
+    path: str
+    user: str
+    session: str
+    size: int
+    last_used: float
+
+
+def _dir_usage(path: str, seen: Set[Tuple[int, int]]) -> RunDir:
+    """Disk usage of a run dir, files hardlinked from several places are only counted where seen first"""
+    size = 0
+    last_used = os.stat(path).st_mtime
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                stat = os.lstat(os.path.join(root, file))
+            except OSError:
+                continue
+            if stat.st_nlink > 1:
+                inode = (stat.st_dev, stat.st_ino)
+                if inode in seen:
+                    continue
+                seen.add(inode)
+            size += stat.st_size
+            last_used = max(last_used, stat.st_mtime)
+    return RunDir(path=path, user="", session="", size=size, last_used=last_used)
+
+
+def evict_cache(cache_dir: str, max_bytes: Optional[int] = None, max_age: Optional[float] = None) -> int:
+    """
+    Removes files of a flat cache dir unused for max_age seconds, then the least recently used until the dir is
+    under max_bytes. Caches touch the mtime of an entry when they use it. Returns the number of freed bytes.
+    """
+    entries = []
+    with os.scandir(cache_dir) as scan:
+        for entry in scan:
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except OSError:
+                continue
+    entries.sort()
+
+    now = time.time()
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for mtime, size, path in entries:
+        expired = max_age is not None and now - mtime > max_age
+        if not expired and (max_bytes is None or total - freed <= max_bytes):
+            # entries are sorted oldest first, the rest are newer and fit
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        freed += size
+    return freed
+
+
+class RetentionManager:
+    """
+    Background cleanup of run work dirs under files/user/<md5(user_id)>/<session_id>/<run>. Deletions are moved out
+    of the request path by renaming the directory into files/.trash and removing it on the service thread. A periodic
+    sweep evicts runs older than max_run_age and then least recently used runs until sessions and users are back
+    under their disk quotas. Runs touched within protect_recent seconds are never evicted. Blobs that were not used
+    for a while are collected after each sweep, and the cache_dirs (e.g. compressed artifact variants and
+    thumbnails) are trimmed to max_cache_bytes and max_cache_age.
+    """
+
+    def __init__(
+        self,
+        files_static_root: str,
+        max_user_bytes: Optional[int] = None,
+        max_session_bytes: Optional[int] = None,
+        max_run_age: Optional[float] = None,
+        sweep_interval: Optional[float] = 3600,
+        protect_recent: float = 600,
+        cache_dirs: Optional[List[str]] = None,
+        max_cache_bytes: Optional[int] = None,
+        max_cache_age: Optional[float] = None,
+    ) -> None:
+        self.user_root = os.path.join(files_static_root, "user")
+        self.trash_root = os.path.join(files_static_root, TRASH_DIR)
+        self.max_user_bytes = max_user_bytes
+        self.max_session_bytes = max_session_bytes
+        self.max_run_age = max_run_age
+        self.sweep_interval = sweep_interval
+        self.protect_recent = protect_recent
+        self.cache_dirs = cache_dirs or []
+        self.max_cache_bytes = max_cache_bytes
+        self.max_cache_age = max_cache_age
+        self.blob_store = BlobStore(os.path.join(files_static_root, BLOBS_DIR))
+        self.tasks: queue.Queue = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        os.makedirs(self.trash_root, exist_ok=True)
+
+    def start(self) -> None:
+        # leftovers from a previous process
+        for entry in os.listdir(self.trash_root):
+            self.tasks.put(os.path.join(self.trash_root, entry))
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def delete_later(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+        trash_path = os.path.join(self.trash_root, f"{uuid.uuid4().hex}-{os.path.basename(path.rstrip(os.sep))}")
+        try:
+            os.rename(path, trash_path)
+        except OSError:
+            # not on the same filesystem, delete in place on the service thread
+            trash_path = path
+        self.tasks.put(trash_path)
+
+    def clear_folder(self, folder_path: str) -> None:
+        if not os.path.isdir(folder_path) or not os.listdir(folder_path):
+            return
+        self.delete_later(folder_path)
+        os.makedirs(folder_path, exist_ok=True)
+
+    def delete_session(self, user_id: str, session_id: str) -> None:
+        if session_id:
+            self.delete_later(os.path.join(self.user_root, md5_hash(user_id), session_id))
+
+    def _run(self) -> None:
+        next_sweep = time.time() + (self.sweep_interval or 0)
+        while True:
+            timeout = max(0.0, next_sweep - time.time()) if self.sweep_interval else None
+            try:
+                path = self.tasks.get(timeout=timeout)
+                shutil.rmtree(path, ignore_errors=True)
+                self.tasks.task_done()
+            except queue.Empty:
+                pass
+
+            if self.sweep_interval and time.time() >= next_sweep:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error("Retention sweep failed: %s", e)
+                next_sweep = time.time() + self.sweep_interval
+
+    def list_runs(self) -> List[RunDir]:
+        runs = []
+        seen: Set[Tuple[int, int]] = set()
+        for user in os.listdir(self.user_root):
+            user_dir = os.path.join(self.user_root, user)
+            if not os.path.isdir(user_dir):
+                continue
+            for session in os.listdir(user_dir):
+                session_dir = os.path.join(user_dir, session)
+                if not os.path.isdir(session_dir):
+                    continue
+                for run in os.listdir(session_dir):
+                    run_dir = os.path.join(session_dir, run)
+                    if os.path.isdir(run_dir):
+                        usage = _dir_usage(run_dir, seen)
+                        usage.user, usage.session = user, session
+                        runs.append(usage)
+        return runs
+
+    def sweep(self) -> None:
+        if self.max_run_age or self.max_session_bytes or self.max_user_bytes:
+            self._evict_runs()
+
+        freed = self.blob_store.gc()
+        if freed:
+            logger.info("Retention sweep freed %d bytes of unused blobs", freed)
+
+        for cache_dir in self.cache_dirs:
+            if os.path.isdir(cache_dir):
+                freed = evict_cache(cache_dir, self.max_cache_bytes, self.max_cache_age)
+                if freed:
+                    logger.info("Retention sweep freed %d bytes of %s", freed, cache_dir)
+
+    def _evict_runs(self) -> None:
+        now = time.time()
+        runs = sorted(self.list_runs(), key=lambda run: run.last_used)
+        evicted = set()
+
+        def evict(run: RunDir) -> None:
+            evicted.add(run.path)
+            self.delete_later(run.path)
+
+        def evictable(run: RunDir) -> bool:
+            return run.path not in evicted and now - run.last_used > self.protect_recent
+
+        if self.max_run_age:
+            for run in runs:
+                if evictable(run) and now - run.last_used > self.max_run_age:
+                    evict(run)
+
+        quotas = (
+            (self.max_session_bytes, lambda run: (run.user, run.session)),
+            (self.max_user_bytes, lambda run: run.user),
+        )
+        for limit, key in quotas:
+            if not limit:
+                continue
+            usage = {}
+            for run in runs:
+                if run.path not in evicted:
+                    usage[key(run)] = usage.get(key(run), 0) + run.size
+            # runs are sorted by last use, so the least recently used are evicted first
+            for run in runs:
+                if usage.get(key(run), 0) > limit and evictable(run):
+                    evict(run)
+                    usage[key(run)] -= run.size
+
+        if evicted:
+            logger.info("Retention sweep evicted %d run directories", len(evicted))
+
+
+_retention_manager: Optional[RetentionManager] = None
+_sweeper_lock = None
+
+
+def _claim_sweeper(lock_path: str) -> bool:
+    """Elects one process per host to run the sweeps when the web app runs several workers"""
+    global _sweeper_lock
+    try:
+        import fcntl
+    except ImportError:
+        return True
+
+    lock_file = open(lock_path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _sweeper_lock = lock_file
+    return True
+
+
+def start_retention_manager(
+    files_static_root: str, sweep: bool = True, cache_dirs: Optional[List[str]] = None
+) -> RetentionManager:
+    """Starts the process wide retention service, quotas and ages are read from AUTOGENSTUDIO_* variables"""
+    global _retention_manager
+
+    def env_number(name: str, scale: float) -> Optional[float]:
+        value = os.environ.get(name)
+        return float(value) * scale if value else None
+
+    max_user_bytes = env_number("AUTOGENSTUDIO_USER_QUOTA_MB", 1024 * 1024)
+    max_session_bytes = env_number("AUTOGENSTUDIO_SESSION_QUOTA_MB", 1024 * 1024)
+    sweep = sweep and _claim_sweeper(os.path.join(files_static_root, ".retention.lock"))
+    _retention_manager = RetentionManager(
+        files_static_root=files_static_root,
+        max_user_bytes=int(max_user_bytes) if max_user_bytes else None,
+        max_session_bytes=int(max_session_bytes) if max_session_bytes else None,
+        max_run_age=env_number("AUTOGENSTUDIO_RUN_MAX_AGE_DAYS", 24 * 3600),
+        sweep_interval=(env_number("AUTOGENSTUDIO_RETENTION_INTERVAL", 1) or 3600) if sweep else None,
+        cache_dirs=cache_dirs,
+        max_cache_bytes=int(env_number("AUTOGENSTUDIO_CACHE_QUOTA_MB", 1024 * 1024) or 1024 * 1024 * 1024),
+        max_cache_age=env_number("AUTOGENSTUDIO_CACHE_MAX_AGE_DAYS", 24 * 3600) or 7 * 24 * 3600,
+    )
+    _retention_manager.start()
+    return _retention_manager
+
+
+def get_retention_manager() -> Optional[RetentionManager]:
+    return _retention_manager
+
+
+def clear_folder_async(folder_path: str) -> None:
+    """Empties folder_path, deferring the actual deletion to the retention service when it is running"""
+    if _retention_manager is None:
+        clear_folder(folder_path)
+    else:
+        _retention_manager.clear_folder(folder_path)
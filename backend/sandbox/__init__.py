@@ -0,0 +1,2 @@
+from .executor import PooledCodeExecutor, build_pooled_execution_config
+from .pool import WorkerPool, get_default_pool
@@ -0,0 +1,78 @@
+from typing import Any, Dict, List, Optional
+
+from autogen.coding import CodeBlock, CodeResult, MarkdownCodeExtractor
+
+from sandbox.pool import WorkerPool, get_default_pool
+from sandbox.worker import PYTHON_LANGUAGES, SHELL_LANGUAGES
+
+
+class PooledCodeExecutor:
+    """
+    AutoGen code executor that runs code blocks on the pre-warmed worker pool. Pass it to an agent through
+    code_execution_config={"executor": PooledCodeExecutor(...)}.
+    """
+
+    def __init__(
+        self,
+        work_dir: str,
+        pool: Optional[WorkerPool] = None,
+        timeout: float = 60,
+        cpu_seconds: Optional[int] = None,
+        memory_mb: Optional[int] = None,
+    ) -> None:
+        self.work_dir = work_dir
+        self.pool = pool
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+
+    @property
+    def code_extractor(self) -> MarkdownCodeExtractor:
+        return MarkdownCodeExtractor()
+
+    def execute_code_blocks(self, code_blocks: List[CodeBlock]) -> CodeResult:
+        pool = self.pool or get_default_pool()
+        outputs = []
+        exit_code = 0
+        for code_block in code_blocks:
+            lang = (code_block.language or "python").lower()
+            if lang not in PYTHON_LANGUAGES | SHELL_LANGUAGES:
+                outputs.append(f"unknown language {lang}")
+                exit_code = 1
+                break
+
+            result = pool.run(
+                code=code_block.code,
+                lang=lang,
+                work_dir=self.work_dir,
+                timeout=self.timeout,
+                cpu_seconds=self.cpu_seconds,
+                memory_mb=self.memory_mb,
+            )
+            outputs.append(result["output"])
+            exit_code = result["exit_code"]
+            if exit_code != 0:
+                break
+
+        return CodeResult(exit_code=exit_code, output="".join(outputs))
+
+    def restart(self) -> None:
+        pass
+
+    def __deepcopy__(self, memo: Dict) -> "PooledCodeExecutor":
+        # agent configs are deep copied by dataclasses.asdict, the executor must stay shared
+        return self
+
+
+def build_pooled_execution_config(code_execution_config: Dict[str, Any], work_dir: str) -> Dict[str, Any]:
+    """Replaces {"executor": "pooled", ...} with a config holding a PooledCodeExecutor for work_dir"""
+    config = dict(code_execution_config)
+    config.pop("use_docker", None)
+    config.pop("work_dir", None)
+    config["executor"] = PooledCodeExecutor(
+        work_dir=work_dir,
+        timeout=config.pop("timeout", None) or 60,
+        cpu_seconds=config.pop("cpu_seconds", None),
+        memory_mb=config.pop("memory_mb", None),
+    )
+    return config
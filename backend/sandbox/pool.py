@@ -0,0 +1,135 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+import uuid
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRELOAD = ["numpy", "pandas", "matplotlib", "matplotlib.pyplot", "requests"]
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py")
+
+
+class WorkerProcess:
+    """A single pre-warmed worker process speaking the JSON lines protocol of worker.py"""
+
+    def __init__(self, preload: List[str]) -> None:
+        env = dict(os.environ, MPLBACKEND="Agg", PYTHONUNBUFFERED="1")
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, *preload],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            env=env,
+        )
+        self.ready = False
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def wait_ready(self) -> None:
+        if self.ready:
+            return
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("Code execution worker exited during startup")
+        self.ready = json.loads(line).get("ready", False)
+
+    def run(self, job: Dict, timeout: float) -> Dict:
+        self.wait_ready()
+        # the worker enforces the job timeout itself, this guards against the worker hanging
+        watchdog = threading.Timer(timeout + 10, self.kill)
+        watchdog.start()
+        try:
+            self.process.stdin.write(json.dumps(job) + "\n")
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        finally:
+            watchdog.cancel()
+
+        if not line:
+            raise RuntimeError("Code execution worker died while running a job")
+        return json.loads(line)
+
+    def kill(self) -> None:
+        if self.alive():
+            self.process.kill()
+
+
+class WorkerPool:
+    """
+    Pool of pre-warmed local worker processes. Workers import common packages once at startup and fork a fresh
+    child for every job, so jobs do not pay interpreter startup and import costs.
+    """
+
+    def __init__(self, size: int = 2, preload: Optional[List[str]] = None) -> None:
+        self.size = size
+        self.preload = DEFAULT_PRELOAD if preload is None else preload
+        self._idle: queue.Queue = queue.Queue()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(WorkerProcess(self.preload))
+
+    def run(
+        self,
+        code: str,
+        lang: str,
+        work_dir: str,
+        timeout: float = 60,
+        cpu_seconds: Optional[int] = None,
+        memory_mb: Optional[int] = None,
+    ) -> Dict:
+        if self._closed:
+            raise RuntimeError("Worker pool is closed")
+
+        job = {
+            "id": str(uuid.uuid4()),
+            "code": code,
+            "lang": lang,
+            "work_dir": os.path.abspath(work_dir),
+            "timeout": timeout,
+            "cpu_seconds": cpu_seconds,
+            "memory_mb": memory_mb,
+        }
+
+        worker = self._idle.get()
+        try:
+            if not worker.alive():
+                worker = WorkerProcess(self.preload)
+            return worker.run(job, timeout)
+        except Exception as e:
+            logger.error("Code execution worker failed: %s", e)
+            worker.kill()
+            worker = WorkerProcess(self.preload)
+            return {"id": job["id"], "exit_code": 1, "output": f"Code execution worker failed: {e}", "code_file": None}
+        finally:
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        self._closed = True
+        while not self._idle.empty():
+            self._idle.get_nowait().kill()
+
+
+_default_pool: Optional[WorkerPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool() -> WorkerPool:
+    """Returns the process wide worker pool, sized by AUTOGENSTUDIO_CODE_WORKERS"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            size = int(os.environ.get("AUTOGENSTUDIO_CODE_WORKERS", "2"))
+            preload = os.environ.get("AUTOGENSTUDIO_CODE_PRELOAD")
+            _default_pool = WorkerPool(
+                size=size, preload=[m.strip() for m in preload.split(",")] if preload is not None else None
+            )
+            atexit.register(_default_pool.close)
+        return _default_pool
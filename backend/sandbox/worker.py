@@ -0,0 +1,149 @@
+"""
+Pre-warmed code execution worker.
+
+The worker imports a set of common packages once, then reads one JSON job per line from stdin. Every job runs in
+a forked child (so it inherits the already imported modules) with its own working directory and resource limits.
+One JSON result per line is written back to stdout.
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import resource
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+PYTHON_LANGUAGES = {"python", "py", "python3"}
+SHELL_LANGUAGES = {"bash", "shell", "sh"}
+MAX_OUTPUT_BYTES = 64 * 1024
+
+
+def preload(modules):
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+
+def apply_limits(job: dict) -> None:
+    cpu_seconds = job.get("cpu_seconds")
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (int(cpu_seconds), int(cpu_seconds) + 1))
+
+    memory_mb = job.get("memory_mb")
+    if memory_mb:
+        limit = int(memory_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def write_code_file(job: dict) -> str:
+    code = job["code"]
+    extension = "py" if job["lang"] in PYTHON_LANGUAGES else "sh"
+    file_name = f"tmp_code_{hashlib.md5(code.encode()).hexdigest()}.{extension}"
+    file_path = os.path.join(job["work_dir"], file_name)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(code)
+    return file_path
+
+
+def run_child(job: dict, code_file: str, output_fd: int) -> None:
+    """Runs inside the forked child, never returns."""
+    exit_code = 1
+    try:
+        os.setpgrp()
+        os.chdir(job["work_dir"])
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(output_fd, 1)
+        os.dup2(output_fd, 2)
+        apply_limits(job)
+
+        if job["lang"] in SHELL_LANGUAGES:
+            os.execvp("bash", ["bash", code_file])
+
+        sys.path.insert(0, job["work_dir"])
+        sys.argv = [code_file]
+        with open(code_file, "r", encoding="utf-8") as f:
+            compiled = compile(f.read(), code_file, "exec")
+        try:
+            exec(compiled, {"__name__": "__main__", "__file__": code_file})
+            exit_code = 0
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+
+
+def run_job(job: dict) -> dict:
+    os.makedirs(job["work_dir"], exist_ok=True)
+    code_file = write_code_file(job)
+    timeout = job.get("timeout") or 60
+
+    with tempfile.TemporaryFile() as output:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            run_child(job, code_file, output.fileno())
+
+        deadline = time.monotonic() + timeout
+        timed_out = False
+        while True:
+            finished_pid, status = os.waitpid(pid, os.WNOHANG)
+            if finished_pid:
+                break
+            if time.monotonic() > deadline:
+                timed_out = True
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                os.waitpid(pid, 0)
+                break
+            time.sleep(0.01)
+
+        output.seek(0)
+        text = output.read(MAX_OUTPUT_BYTES).decode("utf-8", errors="replace")
+
+    if timed_out:
+        exit_code = 124
+        text += "\nTimeout"
+    elif os.WIFSIGNALED(status):
+        exit_code = 128 + os.WTERMSIG(status)
+        if os.WTERMSIG(status) == signal.SIGXCPU:
+            text += "\nCPU time limit exceeded"
+    else:
+        exit_code = os.WEXITSTATUS(status)
+
+    return {"id": job.get("id"), "exit_code": exit_code, "output": text, "code_file": code_file}
+
+
+def main() -> None:
+    preload([name for name in sys.argv[1:] if name])
+    sys.stdout.write(json.dumps({"ready": True, "pid": os.getpid()}) + "\n")
+    sys.stdout.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        try:
+            result = run_job(job)
+        except Exception as e:
+            result = {"id": job.get("id"), "exit_code": 1, "output": f"Worker error: {e}", "code_file": None}
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+MISSING = object()
+# fields that are the same for every event of a connection and are implied by the socket
+IMPLIED_FIELDS = ("connection_id", "message_type")
+
+
+def _epoch_ms(timestamp: Optional[str]) -> Optional[int]:
+    if not timestamp:
+        return None
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+class AgentEventEncoder:
+    """
+    Compact encoding of the socket messages of one connection. Agent names are sent once and then referenced by
+    index, and each agent_message only carries the fields that differ from the previous one:
+
+        {"k": "m", "d": {"sender": 0, "timestamp": 1712345678901}, "m": {"content": "..."}, "x": ["tool_calls"]}
+
+    where d holds changed top level fields, m changed fields of the message dict and x message fields that are no
+    longer present. Other socket messages are passed through as {"k": "e", "e": <message>}.
+    """
+
+    def __init__(self) -> None:
+        self.names: Dict[str, int] = {}
+        self.previous: Dict[str, Any] = {}
+        self.previous_message: Dict[str, Any] = {}
+
+    def name_index(self, name: str, new_names: List[str]) -> int:
+        if name not in self.names:
+            self.names[name] = len(self.names)
+            new_names.append(name)
+        return self.names[name]
+
+    def encode(self, message: Dict[str, Any], new_names: List[str]) -> Dict[str, Any]:
+        if message.get("type") != "agent_message":
+            return {"k": "e", "e": message}
+
+        data = message["data"]
+        fields = {key: value for key, value in data.items() if key not in IMPLIED_FIELDS and key != "message"}
+        fields["recipient"] = self.name_index(data["recipient"], new_names)
+        fields["sender"] = self.name_index(data["sender"], new_names)
+        fields["timestamp"] = _epoch_ms(data.get("timestamp"))
+        agent_message = data.get("message") or {}
+
+        event: Dict[str, Any] = {"k": "m"}
+        delta = {key: value for key, value in fields.items() if self.previous.get(key, MISSING) != value}
+        message_delta = {
+            key: value for key, value in agent_message.items() if self.previous_message.get(key, MISSING) != value
+        }
+        removed = [key for key in self.previous_message if key not in agent_message]
+        if delta:
+            event["d"] = delta
+        if message_delta:
+            event["m"] = message_delta
+        if removed:
+            event["x"] = removed
+
+        self.previous = fields
+        self.previous_message = agent_message
+        return event
+
+
+class SocketBatcher:
+    """
+    Coalesces the socket messages of one connection over a short window and sends them as a single
+    {"type": "batch", "n": [new agent names], "events": [...]} frame encoded by AgentEventEncoder.
+    """
+
+    def __init__(self, send_text: Callable[[str], Awaitable[None]], window: float = 0.05, max_events: int = 100):
+        self.send_text = send_text
+        self.window = window
+        self.max_events = max_events
+        self.encoder = AgentEventEncoder()
+        self.pending: List[Dict[str, Any]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, message: Dict[str, Any]) -> None:
+        """Queues a message, must be called on the event loop of the connection"""
+        self.pending.append(message)
+        if len(self.pending) >= self.max_events:
+            self._schedule_flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self._schedule_flush)
+
+    def _schedule_flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending:
+            asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> None:
+        messages, self.pending = self.pending, []
+        if not messages:
+            return
+        new_names: List[str] = []
+        events = [self.encoder.encode(message, new_names) for message in messages]
+        frame = {"type": "batch", "n": new_names, "events": events}
+        await self.send_text(json.dumps(frame, separators=(",", ":")))
+
+    def close(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.pending = []
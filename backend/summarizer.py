@@ -0,0 +1,81 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from metrics import record_cache
+from tracing import SpanContext, current_span, span
+from utils import summarize_chat_history
+from yandexgpt.ratelimit import BACKGROUND, llm_priority
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSummarizer:
+    """
+    Runs summary_method="llm" summarization off the request path on a small thread pool. Summaries are cached by
+    the hash of the task, transcript and model, so replays of the same dialogue do not call the LLM again.
+    """
+
+    def __init__(self, max_workers: int = 2, cache_size: int = 256) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summarizer")
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[str, str]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(task: str, transcript: str, model: Dict[str, Any]) -> str:
+        model_name = model.get("model") if isinstance(model, dict) else getattr(model, "model", "")
+        return hashlib.sha256(json.dumps([task, transcript, model_name]).encode("utf-8")).hexdigest()
+
+    def summarize(self, task: str, transcript: str, model: Dict[str, Any]) -> str:
+        key = self.cache_key(task, transcript, model)
+        with self.lock:
+            record_cache("summary", key in self.cache)
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        summary = summarize_chat_history(task=task, messages=transcript, model=model)
+
+        with self.lock:
+            self.cache[key] = summary
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return summary
+
+    def submit(
+        self, task: str, transcript: str, model: Dict[str, Any], callback: Callable[[Optional[str]], None]
+    ) -> Future:
+        """Summarizes in the background and calls callback with the summary, or None when summarization failed"""
+
+        # the summary runs after the turn has finished, it joins the turn's trace without adding to its timings
+        turn = current_span()
+        parent = SpanContext(turn.trace_id, turn.span_id) if turn else None
+
+        def run() -> None:
+            # summaries queue behind interactive turns for the shared LLM rate limits
+            with span("chat.summarize", parent=parent), llm_priority(BACKGROUND):
+                try:
+                    summary = self.summarize(task, transcript, model)
+                except Exception as e:
+                    logger.error("Chat summarization failed: %s", e)
+                    summary = None
+                callback(summary)
+
+        return self.executor.submit(run)
+
+
+_default_summarizer: Optional[ChatSummarizer] = None
+_default_summarizer_lock = threading.Lock()
+
+
+def get_default_summarizer() -> ChatSummarizer:
+    global _default_summarizer
+    with _default_summarizer_lock:
+        if _default_summarizer is None:
+            _default_summarizer = ChatSummarizer()
+        return _default_summarizer
@@ -0,0 +1,211 @@
+import threading
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# reported when no detector fired, i.e. the chat stopped on max_consecutive_auto_reply, max_round or no reply
+DEFAULT_REASON = "auto_reply_limit"
+
+_stats_lock = threading.Lock()
+_termination_reasons: Counter = Counter()
+
+
+def _content(entry: Dict) -> str:
+    message = entry.get("message", entry)
+    return (message.get("content") or "").strip() if isinstance(message, dict) else str(message or "").strip()
+
+
+def _entry(history: Sequence[Dict], index: int) -> Tuple[Optional[str], str]:
+    """
+    Sender and content of a history entry. An AgentHistory is read from its in-memory records, so spilled messages
+    are compared by their preview instead of being loaded from disk on every check.
+    """
+    records = getattr(history, "records", None)
+    if records is not None:
+        record = records[index]
+        return record.sender, (record.content or "").strip() if isinstance(record.content, str) else ""
+    entry = history[index]
+    return entry.get("sender"), _content(entry)
+
+
+def _last_from_sender(history: Sequence[Dict], count: int) -> List[str]:
+    """Contents of the last count messages sent by the sender of the latest message, oldest first"""
+    sender = _entry(history, -1)[0]
+    contents = []
+    for index in range(len(history) - 1, -1, -1):
+        entry_sender, content = _entry(history, index)
+        if entry_sender == sender:
+            contents.append(content)
+            if len(contents) == count:
+                break
+    return contents[::-1]
+
+
+class KeywordDetector:
+    """The original rule: stop when the keyword appears at the end of a message"""
+
+    name = "keyword"
+
+    def __init__(self, keyword: str = "TERMINATE", tail: int = 20) -> None:
+        self.keyword = keyword
+        self.tail = tail
+
+    def __call__(self, message: Dict, history: Sequence[Dict]) -> bool:
+        content = (message.get("content") or "") if isinstance(message, dict) else str(message or "")
+        return self.keyword in content.rstrip()[-self.tail :]
+
+
+class EmptyContentDetector:
+    """Stops after max_empty consecutive messages without content"""
+
+    name = "empty_loop"
+
+    def __init__(self, max_empty: int = 2) -> None:
+        self.max_empty = max_empty
+
+    def __call__(self, message: Dict, history: Sequence[Dict]) -> bool:
+        if len(history) < self.max_empty:
+            return False
+        return all(not _entry(history, index)[1] for index in range(-self.max_empty, 0))
+
+
+class RepeatedContentDetector:
+    """Stops when the same content was sent max_repeats times in a row by the same sender"""
+
+    name = "repeated_loop"
+
+    def __init__(self, max_repeats: int = 2) -> None:
+        self.max_repeats = max_repeats
+
+    def __call__(self, message: Dict, history: Sequence[Dict]) -> bool:
+        if not history:
+            return False
+        contents = _last_from_sender(history, self.max_repeats)
+        return len(contents) == self.max_repeats and len(set(contents)) == 1 and contents[0] != ""
+
+
+class SimilarityDetector:
+    """Stops when two consecutive replies of the same sender are nearly identical"""
+
+    name = "similar_replies"
+
+    def __init__(self, threshold: float = 0.95, min_length: int = 20) -> None:
+        self.threshold = threshold
+        self.min_length = min_length
+
+    def __call__(self, message: Dict, history: Sequence[Dict]) -> bool:
+        if not history:
+            return False
+        replies = _last_from_sender(history, 2)
+        if len(replies) < 2 or min(len(r) for r in replies) < self.min_length:
+            return False
+        matcher = SequenceMatcher(None, replies[0], replies[1])
+        # the quick ratios are upper bounds of ratio(), most replies are told apart without the quadratic diff
+        return (
+            matcher.real_quick_ratio() >= self.threshold
+            and matcher.quick_ratio() >= self.threshold
+            and matcher.ratio() >= self.threshold
+        )
+
+
+class TurnCapDetector:
+    """Stops the workflow after max_turns recorded messages"""
+
+    name = "turn_cap"
+
+    def __init__(self, max_turns: int) -> None:
+        self.max_turns = max_turns
+
+    def __call__(self, message: Dict, history: Sequence[Dict]) -> bool:
+        return len(history) >= self.max_turns
+
+
+class TokenCapDetector:
+    """Stops the workflow once the approximate token count (4 characters per token) of the dialogue exceeds max_tokens"""
+
+    name = "token_cap"
+
+    def __init__(self, max_tokens: int) -> None:
+        self.max_tokens = max_tokens
+
+    def __call__(self, message: Dict, history: Sequence[Dict]) -> bool:
+        return estimate_tokens(history) >= self.max_tokens
+
+
+def estimate_tokens(history: Sequence[Dict]) -> int:
+    total_chars = getattr(history, "total_chars", None)
+    if total_chars is None:
+        total_chars = sum(len(_content(entry)) for entry in history)
+    return total_chars // 4
+
+
+class TerminationPolicy:
+    """
+    Composite is_termination_msg for all agents of a workflow. Detectors look at the workflow's agent history, so
+    evaluating the same message from several agents gives the same answer. The first detector that fires is
+    recorded as the reason the run ended.
+    """
+
+    def __init__(self, detectors: List[Callable], history: Optional[Callable[[], Sequence[Dict]]] = None) -> None:
+        self.detectors = detectors
+        self.history = history or (lambda: [])
+        self.reason: Optional[str] = None
+
+    def __call__(self, message: Dict) -> bool:
+        history = self.history()
+        for detector in self.detectors:
+            if detector(message, history):
+                self.reason = getattr(detector, "name", type(detector).__name__)
+                return True
+        return False
+
+    def __deepcopy__(self, memo: Dict) -> "TerminationPolicy":
+        # agent configs are deep copied by dataclasses.asdict, all agents must share the policy
+        return self
+
+    def summary(self) -> Dict[str, Any]:
+        history = self.history()
+        reason = self.reason or DEFAULT_REASON
+        with _stats_lock:
+            _termination_reasons[reason] += 1
+        return {"reason": reason, "turns": len(history), "tokens": estimate_tokens(history)}
+
+
+def build_termination_policy(
+    config: Optional[Dict[str, Any]] = None, history: Optional[Callable[[], Sequence[Dict]]] = None
+) -> TerminationPolicy:
+    """
+    Builds a policy from a workflow termination_config, e.g.
+    {"keyword": "TERMINATE", "max_empty": 2, "max_repeats": 2, "similarity_threshold": 0.95, "max_turns": 30,
+    "max_tokens": 20000}. Set a detector option to null to disable it. The repeat and similarity detectors are off
+    unless configured: a fixed attempt in a code loop often differs from the failed one by a line or two.
+    """
+    config = {
+        "keyword": "TERMINATE",
+        "max_empty": 2,
+        "max_repeats": None,
+        "similarity_threshold": None,
+        "max_turns": None,
+        "max_tokens": None,
+        **(config or {}),
+    }
+
+    detectors = []
+    if config["keyword"]:
+        detectors.append(KeywordDetector(keyword=config["keyword"]))
+    if config["max_empty"]:
+        detectors.append(EmptyContentDetector(max_empty=config["max_empty"]))
+    if config["max_repeats"]:
+        detectors.append(RepeatedContentDetector(max_repeats=config["max_repeats"]))
+    if config["similarity_threshold"]:
+        detectors.append(SimilarityDetector(threshold=config["similarity_threshold"]))
+    if config["max_turns"]:
+        detectors.append(TurnCapDetector(max_turns=config["max_turns"]))
+    if config["max_tokens"]:
+        detectors.append(TokenCapDetector(max_tokens=config["max_tokens"]))
+    return TerminationPolicy(detectors=detectors, history=history)
+
+
+def get_termination_stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(_termination_reasons)
@@ -0,0 +1,92 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from batch import BatchRun, latest_results, read_results, read_tasks, summarize_results, summary_path
+
+
+def write_lines(path, rows) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write((row if isinstance(row, str) else json.dumps(row)) + "\n")
+
+
+def test_read_tasks():
+    lines = ['"plain task"', "", '{"id": 7, "task": "with id", "expected": 42}', '{"prompt": "from prompt"}']
+    assert list(read_tasks(lines)) == [
+        {"id": "1", "task": "plain task", "input": {}},
+        {"id": "7", "task": "with id", "input": {"expected": 42}},
+        {"id": "4", "task": "from prompt", "input": {}},
+    ]
+
+
+def test_read_tasks_rejects_lines_without_a_task():
+    with pytest.raises(ValueError, match="line 2"):
+        list(read_tasks(['"ok"', '{"id": "x"}']))
+
+
+def test_results_skip_cut_off_lines_and_keep_the_latest(tmp_path):
+    path = tmp_path / "results.jsonl"
+    write_lines(path, [{"id": "1", "status": "error"}, {"id": "1", "status": "ok", "latency": 2.0}, '{"id": "2", "st'])
+    assert len(list(read_results(str(path)))) == 2
+    assert latest_results(str(path)) == {"1": {"id": "1", "status": "ok", "latency": 2.0}}
+    assert list(read_results(str(tmp_path / "missing.jsonl"))) == []
+
+
+def test_summarize_results(tmp_path):
+    path = tmp_path / "results.jsonl"
+    write_lines(
+        path,
+        [
+            {"id": "1", "status": "ok", "latency": 1.0, "usage": {"llm_calls": 2, "input_tokens": 10}},
+            {"id": "2", "status": "ok", "latency": 3.0, "usage": {"llm_calls": 1, "output_tokens": 5}},
+            {"id": "3", "status": "error", "latency": 9.0},
+        ],
+    )
+    summary = summarize_results(str(path))
+    assert (summary["tasks"], summary["ok"], summary["failed"]) == (3, 2, 1)
+    assert summary["latency"]["mean"] == 2.0
+    assert summary["usage"] == {"llm_calls": 3, "input_tokens": 10, "output_tokens": 5}
+
+
+@pytest.fixture
+def batch_run(tmp_path, monkeypatch):
+    calls = []
+
+    def run_task(self, task):
+        calls.append(task["id"])
+        status = "error" if task["input"].get("fail") else "ok"
+        return {"id": task["id"], "task": task["task"], "status": status, "latency": 0.1}
+
+    monkeypatch.setattr(BatchRun, "run_task", run_task)
+    write_lines(tmp_path / "tasks.jsonl", [{"id": "a", "task": "A"}, {"id": "b", "task": "B", "fail": True}, '"C"'])
+    workflow = SimpleNamespace(id="wf", name="workflow")
+    run = BatchRun(workflow, str(tmp_path / "tasks.jsonl"), str(tmp_path / "results.jsonl"), str(tmp_path))
+    return run, calls
+
+
+def test_run_writes_results_and_summary(batch_run):
+    run, calls = batch_run
+    summary = run.run()
+
+    assert sorted(calls) == ["3", "a", "b"]
+    assert run.status == "done"
+    assert (run.completed, run.failed, run.skipped) == (3, 1, 0)
+    assert (summary["ok"], summary["failed"]) == (2, 1)
+    with open(summary_path(run.results_path), encoding="utf-8") as f:
+        assert json.load(f)["status"] == "done"
+
+
+def test_resume_skips_finished_tasks(batch_run):
+    run, calls = batch_run
+    write_lines(run.results_path, [{"id": "a", "status": "ok", "latency": 1}, {"id": "b", "status": "error"}])
+    run.run()
+    assert sorted(calls) == ["3", "b"]
+    assert run.skipped == 1
+
+    calls.clear()
+    rerun = BatchRun(run.workflow, run.tasks_path, run.results_path, "unused", retry_failed=False)
+    rerun.run()
+    assert calls == []
+    assert rerun.skipped == 3
@@ -0,0 +1,69 @@
+import os
+import time
+
+from utils import FileChangeTracker, hash_file
+
+
+def write(path, content: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def by_name(changes):
+    return {change["name"]: change for change in changes}
+
+
+def test_created_modified_and_deleted_files(tmp_path):
+    write(tmp_path / "kept.txt", "kept")
+    write(tmp_path / "edited.py", "x = 1")
+    write(tmp_path / "removed.csv", "a,b")
+    tracker = FileChangeTracker(str(tmp_path))
+    tracker.start()
+
+    write(tmp_path / "out" / "plot.png", "png")
+    # same size and a possibly equal mtime, the inode or mtime_ns still tell the change apart
+    os.remove(tmp_path / "edited.py")
+    write(tmp_path / "edited.py", "x = 2")
+    os.remove(tmp_path / "removed.csv")
+
+    changes = by_name(tracker.changes())
+    assert set(changes) == {"plot.png", "edited.py", "removed.csv"}
+    assert changes["plot.png"]["status"] == "created"
+    assert changes["plot.png"]["extension"] == "png"
+    assert changes["edited.py"]["status"] == "modified"
+    assert changes["removed.csv"]["status"] == "deleted"
+    assert changes["removed.csv"]["sha256"] is None
+    assert changes["removed.csv"]["size"] == 3
+
+
+def test_changed_files_are_hashed(tmp_path):
+    tracker = FileChangeTracker(str(tmp_path), max_hash_bytes=10)
+    tracker.start()
+    write(tmp_path / "small.txt", "small")
+    write(tmp_path / "large.txt", "x" * 11)
+
+    changes = by_name(tracker.changes())
+    small = str(tmp_path / "small.txt")
+    assert changes["small.txt"]["sha256"] == hash_file(small)
+    assert changes["large.txt"]["sha256"] is None
+    assert tracker.hashes == {small: hash_file(small)}
+
+
+def test_unchanged_and_ignored_files_are_skipped(tmp_path):
+    write(tmp_path / "data.txt", "data")
+    tracker = FileChangeTracker(str(tmp_path))
+    tracker.start()
+    time.sleep(0.01)
+    write(tmp_path / "__pycache__" / "mod.cpython-311.pyc", "")
+    write(tmp_path / ".history" / "0.json", "{}")
+    write(tmp_path / "module.pyc", "")
+    write(tmp_path / "__init__.py", "")
+
+    assert tracker.changes() == []
+
+
+def test_missing_source_dir(tmp_path):
+    tracker = FileChangeTracker(str(tmp_path / "missing"))
+    tracker.start()
+    assert tracker.changes() == []
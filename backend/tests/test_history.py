@@ -0,0 +1,65 @@
+import json
+import os
+
+from history import HISTORY_DIR, PREVIEW_LENGTH, AgentHistory
+
+
+def entry(content: str, **message) -> dict:
+    return {
+        "sender": "assistant",
+        "recipient": "user_proxy",
+        "timestamp": "t",
+        "message": {"content": content, "role": "user", **message},
+    }
+
+
+def test_small_messages_stay_in_memory(tmp_path):
+    history = AgentHistory(str(tmp_path), connection_id="c1", spill_threshold=100)
+    history.append(entry("hello", name="assistant"))
+
+    assert len(history) == 1
+    assert history.records[0].ref is None
+    assert not os.path.exists(tmp_path / HISTORY_DIR)
+    payload = history[0]
+    assert payload["message"] == {"content": "hello", "role": "user", "name": "assistant"}
+    assert payload["connection_id"] == "c1"
+    assert payload["sender_type"] == "agent"
+
+
+def test_large_messages_spill_to_disk(tmp_path):
+    history = AgentHistory(str(tmp_path), spill_threshold=100)
+    content = "x" * (PREVIEW_LENGTH + 500)
+    history.append(entry("small"))
+    history.append(entry(content))
+
+    record = history.records[1]
+    assert record.ref is not None
+    assert record.content == content[:PREVIEW_LENGTH]
+    assert record.length == len(content)
+    assert history.total_chars == len("small") + len(content)
+    with open(tmp_path / HISTORY_DIR / "1.json", encoding="utf-8") as f:
+        assert json.load(f)["content"] == content
+
+
+def test_spilled_messages_are_reloaded(tmp_path):
+    history = AgentHistory(str(tmp_path), spill_threshold=10)
+    contents = ["short", "y" * 50, "z" * 60]
+    for content in contents:
+        history.append(entry(content))
+
+    assert history[1]["message"]["content"] == contents[1]
+    assert [payload["message"]["content"] for payload in history] == contents
+    assert [payload["message"]["content"] for payload in history[1:]] == contents[1:]
+
+
+def test_metadata_keeps_previews_and_refs(tmp_path):
+    history = AgentHistory(str(tmp_path), connection_id="c1", spill_threshold=PREVIEW_LENGTH)
+    history.append(entry("short"))
+    history.append(entry("y" * (PREVIEW_LENGTH + 1)))
+
+    metadata = history.to_metadata()
+    assert "ref" not in metadata[0] and "truncated" not in metadata[0]
+    assert metadata[1]["ref"] == history.records[1].ref
+    assert metadata[1]["truncated"] is True
+    assert len(metadata[1]["message"]["content"]) == PREVIEW_LENGTH
+    assert all("connection_id" not in message for message in metadata)
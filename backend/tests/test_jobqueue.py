@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+from jobqueue import JobEventPublisher, JobQueue
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), visibility_timeout=60, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def test_claim_runs_jobs_in_order_once(job_queue):
+    first = job_queue.enqueue("chat", {"n": 1})
+    second = job_queue.enqueue("chat", {"n": 2})
+
+    job = job_queue.claim("w1")
+    assert job["id"] == first
+    assert job["status"] == "running"
+    assert job["attempts"] == 1
+    assert job["payload"] == {"n": 1}
+
+    assert job_queue.claim("w2")["id"] == second
+    assert job_queue.claim("w3") is None
+
+
+def test_claim_filters_kinds(job_queue):
+    job_queue.enqueue("batch", {})
+    assert job_queue.claim("w1", kinds=["chat"]) is None
+    assert job_queue.claim("w1", kinds=["batch"]) is not None
+
+
+def test_complete_stores_result(job_queue):
+    job_id = job_queue.enqueue("chat", {})
+    job_queue.claim("w1")
+    job_queue.complete(job_id, "w1", {"status": True})
+
+    job = job_queue.get(job_id)
+    assert job["status"] == "done"
+    assert job["result"] == {"status": True}
+    assert job_queue.depth() == 0
+
+
+def test_expired_visibility_timeout_is_reclaimed(job_queue):
+    job_queue.visibility_timeout = 0
+    job_id = job_queue.enqueue("chat", {})
+    assert job_queue.claim("w1")["id"] == job_id
+
+    # the first worker died, its job becomes visible again
+    job = job_queue.claim("w2")
+    assert job["id"] == job_id
+    assert job["worker_id"] == "w2"
+    assert job["attempts"] == 2
+
+    # out of attempts, the job fails instead of being claimed again
+    assert job_queue.claim("w3") is None
+    assert job_queue.get(job_id)["status"] == "failed"
+
+
+def test_heartbeat_extends_visibility(job_queue):
+    job_id = job_queue.enqueue("chat", {})
+    job_queue.claim("w1")
+    before = job_queue.get(job_id)["visible_at"]
+    time.sleep(0.01)
+    job_queue.heartbeat(job_id, "w1")
+    assert job_queue.get(job_id)["visible_at"] > before
+
+
+def test_fail_retries_with_backoff_then_fails(job_queue):
+    job_id = job_queue.enqueue("chat", {})
+    job_queue.claim("w1")
+
+    assert job_queue.fail(job_id, "w1", "boom") is True
+    job = job_queue.get(job_id)
+    assert job["status"] == "queued"
+    assert job["error"] == "boom"
+    assert job["worker_id"] is None
+    assert job["visible_at"] > time.time()
+    # backed off, not claimable yet
+    assert job_queue.claim("w1") is None
+
+    job_queue.conn.execute("UPDATE jobs SET visible_at = 0 WHERE id = ?", (job_id,))
+    assert job_queue.claim("w2")["attempts"] == 2
+    assert job_queue.fail(job_id, "w2", "boom again") is False
+    assert job_queue.get(job_id)["status"] == "failed"
+
+
+def test_events_are_read_in_order(job_queue):
+    publisher = JobEventPublisher(job_queue, "job-1")
+    start = job_queue.last_event_id()
+    publisher.put_nowait({"connection_id": "c1", "n": 1})
+    publisher.put_nowait({"connection_id": "c1", "n": 2})
+
+    events = job_queue.read_events(after_id=start)
+    assert [event["message"]["n"] for event in events] == [1, 2]
+    assert job_queue.read_events(after_id=events[-1]["id"]) == []
+
+
+def test_prune_removes_old_finished_jobs_and_events(job_queue):
+    done = job_queue.enqueue("chat", {})
+    queued = job_queue.enqueue("chat", {})
+    job_queue.claim("w1")
+    job_queue.complete(done, "w1", {})
+    job_queue.publish_event({"connection_id": "c1"}, job_id=done)
+
+    job_queue.prune(max_age=-1)
+    assert job_queue.get(done) is None
+    assert job_queue.get(queued) is not None
+    assert job_queue.read_events(after_id=0) == []
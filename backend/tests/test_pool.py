@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from yandexgpt.http_client import YandexGPTApiError
+from yandexgpt.pool import (
+    LEAST_LOADED,
+    MAX_COOLDOWN,
+    ROUND_ROBIN,
+    Credential,
+    CredentialPool,
+    parse_credentials,
+    should_fail_over,
+)
+
+
+def make_pool(strategy: str = LEAST_LOADED, weights=(1, 1)) -> CredentialPool:
+    return CredentialPool([Credential(f"key-{i}", "folder", weight) for i, weight in enumerate(weights)], strategy)
+
+
+def keys(credentials):
+    return [credential.api_key for credential in credentials]
+
+
+def test_round_robin_follows_the_weights():
+    pool = make_pool(ROUND_ROBIN, weights=(2, 1))
+    picked = [pool.pick(exclude=[]) for _ in range(6)]
+    assert keys(picked).count("key-0") == 4
+    assert keys(picked).count("key-1") == 2
+    # smooth: the heavier key is not picked in a run of all its turns
+    assert keys(picked[:3]) == ["key-0", "key-1", "key-0"]
+
+
+def test_least_loaded_picks_the_fewest_in_flight():
+    pool = make_pool(LEAST_LOADED)
+    first = pool.pick(exclude=[])
+    second = pool.pick(exclude=[])
+    assert first is not second
+    pool.release(first)
+    assert pool.pick(exclude=[]) is first
+    assert (first.in_flight, second.in_flight) == (1, 1)
+
+
+def test_least_loaded_scales_the_load_by_weight():
+    pool = make_pool(LEAST_LOADED, weights=(3, 1))
+    picked = keys(pool.pick(exclude=[]) for _ in range(4))
+    assert picked.count("key-0") == 3
+
+
+def test_unhealthy_credentials_are_skipped_until_all_are():
+    pool = make_pool()
+    first, second = pool.credentials
+    pool.record_failure(first)
+    assert not first.healthy(time.monotonic())
+    assert all(pool.pick(exclude=[]) is second for _ in range(3))
+
+    pool.record_failure(second)
+    pool.record_failure(second)
+    # everything cools down, the one that recovers first is tried
+    assert pool.pick(exclude=[]) is first
+    assert pool.pick(exclude=[first, second]) is None
+
+
+def test_cooldown_doubles_and_is_capped():
+    pool = make_pool()
+    credential = pool.credentials[0]
+    for cooldown in (1, 2, 4):
+        pool.record_failure(credential)
+        assert credential.unhealthy_until - time.monotonic() == pytest.approx(cooldown, abs=0.5)
+    credential.failures = 20
+    pool.record_failure(credential)
+    assert credential.unhealthy_until - time.monotonic() <= MAX_COOLDOWN
+
+    pool.record_success(credential)
+    assert credential.failures == 0
+    assert credential.healthy(time.monotonic())
+
+
+def test_call_fails_over_to_the_next_credential():
+    pool = make_pool()
+    calls = []
+
+    def function(credential):
+        calls.append(credential.api_key)
+        if len(calls) == 1:
+            raise YandexGPTApiError("unavailable", status_code=503)
+        return credential.api_key
+
+    assert pool.call(function) == calls[1]
+    assert calls[0] != calls[1]
+    failed = next(credential for credential in pool.credentials if credential.api_key == calls[0])
+    assert failed.failures == 1
+    assert all(credential.in_flight == 0 for credential in pool.credentials)
+
+
+def test_call_raises_when_every_credential_failed():
+    pool = make_pool()
+
+    def function(credential):
+        raise YandexGPTApiError("revoked", status_code=401)
+
+    with pytest.raises(YandexGPTApiError, match="revoked"):
+        pool.call(function)
+    assert all(credential.failures == 1 for credential in pool.credentials)
+
+
+def test_request_errors_do_not_fail_over():
+    pool = make_pool()
+    calls = []
+
+    def function(credential):
+        calls.append(credential)
+        raise YandexGPTApiError("bad request", status_code=400)
+
+    with pytest.raises(YandexGPTApiError, match="bad request"):
+        pool.call(function)
+    assert len(calls) == 1
+    assert calls[0].failures == 0
+    assert not should_fail_over(ValueError())
+
+
+def test_parse_credentials():
+    config = {"folder_id": "f", "credentials": '[{"api_key": "a"}, {"api_key": "b", "folder_id": "g", "weight": 2}]'}
+    credentials = parse_credentials(config)
+    assert [(c.api_key, c.folder_id, c.weight) for c in credentials] == [("a", "f", 1.0), ("b", "g", 2.0)]
+    assert keys(parse_credentials({"api_key": "single"})) == ["single"]
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from yandexgpt.ratelimit import (
+    BACKGROUND,
+    INTERACTIVE,
+    RateLimiter,
+    RateLimitTimeout,
+    TokenBucket,
+    current_priority,
+    key_fingerprint,
+    llm_priority,
+    load_limits,
+    model_family,
+)
+
+
+def test_token_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(rate=2, capacity=4)
+    now = bucket.updated
+    assert bucket.wait_time(4, now) == 0
+    bucket.consume(4)
+    assert bucket.wait_time(1, now) == pytest.approx(0.5)
+    assert bucket.wait_time(1, now + 0.5) == 0
+    # amounts over the capacity only wait for a full bucket
+    assert bucket.wait_time(100, now + 10) == 0
+    assert bucket.level == 4
+
+
+def test_token_bucket_goes_negative_when_settled_late():
+    bucket = TokenBucket(rate=1, capacity=10)
+    bucket.consume(15)
+    assert bucket.wait_time(1, bucket.updated) == pytest.approx(6)
+
+
+def test_concurrency_cap_and_timeout():
+    limiter = RateLimiter(rps=100, concurrency=1)
+    permit = limiter.acquire()
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(timeout=0.05)
+    assert limiter.waiters == []
+    permit.release()
+    permit.release()
+    assert limiter.active == 0
+    with limiter.acquire(timeout=0.05):
+        assert limiter.active == 1
+    assert limiter.active == 0
+
+
+def test_interactive_waiters_overtake_background_ones():
+    limiter = RateLimiter(rps=100, concurrency=1)
+    permit = limiter.acquire()
+    order = []
+
+    def wait(name, priority):
+        with limiter.acquire(priority=priority, timeout=5):
+            order.append(name)
+
+    threads = [threading.Thread(target=wait, args=("background", BACKGROUND))]
+    threads[0].start()
+    while len(limiter.waiters) < 1:
+        time.sleep(0.001)
+    threads.append(threading.Thread(target=wait, args=("interactive", INTERACTIVE)))
+    threads[1].start()
+    while len(limiter.waiters) < 2:
+        time.sleep(0.001)
+
+    permit.release()
+    for thread in threads:
+        thread.join()
+    assert order == ["interactive", "background"]
+
+
+def test_token_usage_is_settled_on_release():
+    limiter = RateLimiter(rps=100, tpm=600, concurrency=5)
+    permit = limiter.acquire(tokens=100)
+    level = limiter.tokens.level
+    permit.release(used_tokens=300)
+    assert limiter.tokens.level == pytest.approx(level - 200, abs=1)
+
+
+def test_llm_priority_context():
+    assert current_priority() == INTERACTIVE
+    with llm_priority(BACKGROUND):
+        assert current_priority() == BACKGROUND
+    assert current_priority() == INTERACTIVE
+
+
+def test_model_family():
+    assert model_family("gpt://b1g/yandexgpt-lite/latest") == "yandexgpt-lite"
+    assert model_family("yandexgpt") == "yandexgpt"
+
+
+def test_load_limits_per_model_and_key(monkeypatch):
+    fingerprint = key_fingerprint("secret")
+    config = (
+        '{"*": {"rps": 8, "concurrency": 8}, "yandexgpt": {"tpm": 60000}, '
+        f'"{fingerprint}/*": {{"rps": 2}}, "{fingerprint}/yandexgpt": {{"concurrency": 3}}}}'
+    )
+    monkeypatch.setenv("YANDEXGPT_RATE_LIMITS", config)
+    monkeypatch.delenv("YANDEXGPT_PROCESSES", raising=False)
+    monkeypatch.delenv("AUTOGENSTUDIO_WORKERS", raising=False)
+
+    assert load_limits("yandexgpt-lite") == {"rps": 8, "tpm": None, "concurrency": 8, "poll_rps": 50.0}
+    assert load_limits("yandexgpt", "secret") == {"rps": 2, "tpm": 60000, "concurrency": 3, "poll_rps": 50.0}
+    assert load_limits("yandexgpt", "other")["rps"] == 8
+
+
+def test_load_limits_are_divided_between_processes(monkeypatch):
+    monkeypatch.setenv("YANDEXGPT_RATE_LIMITS", '{"*": {"rps": 8, "tpm": 1200, "concurrency": 3}}')
+    monkeypatch.setenv("AUTOGENSTUDIO_WORKERS", "4")
+    monkeypatch.delenv("YANDEXGPT_PROCESSES", raising=False)
+    assert load_limits("yandexgpt") == {"rps": 2, "tpm": 300, "concurrency": 1, "poll_rps": 12.5}
+
+    monkeypatch.setenv("YANDEXGPT_PROCESSES", "2")
+    assert load_limits("yandexgpt")["rps"] == 4
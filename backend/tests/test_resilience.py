@@ -0,0 +1,75 @@
+import pytest
+
+from yandexgpt.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, RetryPolicy, get_circuit_breaker
+
+
+def test_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(base_delay=0.5, max_delay=3)
+    for attempt in range(6):
+        for _ in range(50):
+            assert 0 <= policy.backoff(attempt) <= min(3, 0.5 * 2**attempt)
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(failure_threshold=2, recovery_time=60)
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures(breaker):
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert 0 < breaker.retry_after() <= 60
+
+
+def test_success_resets_the_failure_count(breaker):
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_trial_success_closes(breaker):
+    trip(breaker)
+    breaker.recovery_time = 0
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # only a single trial call at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_half_open_trial_failure_opens_again(breaker):
+    trip(breaker)
+    breaker.recovery_time = 0
+    assert breaker.allow()
+    breaker.recovery_time = 60
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_released_trial_lets_the_next_call_through(breaker):
+    trip(breaker)
+    breaker.recovery_time = 0
+    assert breaker.allow()
+    breaker.release_trial()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_breakers_are_shared_per_base_url():
+    breaker = get_circuit_breaker("https://test-resilience.example")
+    assert get_circuit_breaker("https://test-resilience.example") is breaker
+    assert get_circuit_breaker("https://other-resilience.example") is not breaker
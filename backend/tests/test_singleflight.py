@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from yandexgpt.singleflight import SingleFlight, request_key
+
+
+def count_waiters(flight, key):
+    """Counts the callers blocked on the in-flight call of key"""
+    future = flight.calls[key]
+    result = future.result
+    waiters = []
+
+    def wait(*args, **kwargs):
+        waiters.append(1)
+        return result(*args, **kwargs)
+
+    future.result = wait
+    return waiters
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def leader_fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    def follower_fn():
+        calls.append(2)
+        return "unexpected"
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", leader_fn)))]
+    threads[0].start()
+    started.wait(5)
+    waiters = count_waiters(flight, "k")
+    threads += [threading.Thread(target=lambda: results.append(flight.do("k", follower_fn))) for _ in range(3)]
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: len(waiters) == 3)
+    assert flight.in_flight() == 1
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert sorted(results) == [("answer", False)] + [("answer", True)] * 3
+    assert flight.in_flight() == 0
+
+
+def test_exceptions_are_shared_with_waiters():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    def run(fn):
+        try:
+            flight.do("k", fn)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=run, args=(failing,))
+    leader.start()
+    started.wait(5)
+    waiters = count_waiters(flight, "k")
+    follower = threading.Thread(target=run, args=(lambda: None,))
+    follower.start()
+    wait_for(lambda: waiters)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(errors) == 2
+    assert errors[0] is errors[1]
+    assert flight.in_flight() == 0
+
+
+def test_results_are_not_cached_after_the_call():
+    flight = SingleFlight()
+    assert flight.do("k", lambda: 1) == (1, False)
+    assert flight.do("k", lambda: 2) == (2, False)
+    with pytest.raises(KeyError):
+        flight.do("k", lambda: {}["missing"])
+    assert flight.do("k", lambda: 3) == (3, False)
+
+
+def test_request_key_ignores_key_order():
+    assert request_key({"a": 1, "b": [1, 2]}, "m") == request_key({"b": [1, 2], "a": 1}, "m")
+    assert request_key({"a": 1}) != request_key({"a": 2})
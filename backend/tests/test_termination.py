@@ -0,0 +1,93 @@
+from history import AgentHistory
+from termination import (
+    DEFAULT_REASON,
+    EmptyContentDetector,
+    KeywordDetector,
+    RepeatedContentDetector,
+    SimilarityDetector,
+    TokenCapDetector,
+    TurnCapDetector,
+    build_termination_policy,
+)
+
+
+def entry(sender: str, content: str) -> dict:
+    return {"sender": sender, "recipient": "other", "timestamp": "t", "message": {"content": content, "role": "user"}}
+
+
+def test_keyword_at_the_end_of_a_message():
+    detector = KeywordDetector()
+    assert detector({"content": "Done. TERMINATE"}, [])
+    assert detector({"content": "TERMINATE\n\n"}, [])
+    assert not detector({"content": "TERMINATE " + "x" * 50}, [])
+    assert not detector({"content": None}, [])
+
+
+def test_empty_content_loop():
+    detector = EmptyContentDetector(max_empty=2)
+    assert not detector({}, [entry("a", "hi"), entry("b", "")])
+    assert detector({}, [entry("a", "hi"), entry("b", ""), entry("a", "  ")])
+    assert not detector({}, [entry("a", "")])
+
+
+def test_repeated_content_of_the_same_sender():
+    detector = RepeatedContentDetector(max_repeats=2)
+    assert detector({}, [entry("a", "same"), entry("b", "other"), entry("a", "same")])
+    assert not detector({}, [entry("a", "same"), entry("b", "same")])
+    assert not detector({}, [entry("a", ""), entry("a", "")])
+    assert not detector({}, [])
+
+
+def test_similar_replies():
+    detector = SimilarityDetector(threshold=0.9, min_length=20)
+    reply = "The answer is 42 because of the following reasoning."
+    assert detector({}, [entry("a", reply), entry("b", "ok"), entry("a", reply + "!")])
+    assert not detector({}, [entry("a", reply), entry("a", "Something entirely different from before.")])
+    assert not detector({}, [entry("a", "short"), entry("a", "short")])
+
+
+def test_turn_and_token_caps():
+    history = [entry("a", "x" * 40)] * 3
+    assert TurnCapDetector(max_turns=3)({}, history)
+    assert not TurnCapDetector(max_turns=4)({}, history)
+    assert TokenCapDetector(max_tokens=30)({}, history)
+    assert not TokenCapDetector(max_tokens=31)({}, history)
+
+
+def test_detectors_read_agent_history_records_without_loading_spills(tmp_path, monkeypatch):
+    history = AgentHistory(str(tmp_path), spill_threshold=10)
+    for content in ["y" * 30, "z", "y" * 30]:
+        history.append(entry("a", content))
+    assert history.records[0].ref is not None
+
+    def fail(record):
+        raise AssertionError("spilled message loaded")
+
+    monkeypatch.setattr(history, "_load_message", fail)
+    assert not RepeatedContentDetector(max_repeats=2)({}, history)
+    assert not EmptyContentDetector(max_empty=1)({}, history)
+    assert not SimilarityDetector()({}, history)
+
+
+def test_default_policy_keeps_code_loops_running():
+    history = []
+    policy = build_termination_policy(history=lambda: history)
+    attempt = "```python\nimport pandas as pd\nprint(pd.read_csv('data.csv').head())\n```"
+    history.extend([entry("assistant", attempt), entry("user_proxy", "error"), entry("assistant", attempt + "\n")])
+    assert not policy({"content": attempt})
+    assert policy.summary()["reason"] == DEFAULT_REASON
+
+
+def test_policy_records_the_first_detector_that_fired():
+    history = [entry("a", "same"), entry("a", "same")]
+    policy = build_termination_policy({"max_repeats": 2, "max_turns": 2}, history=lambda: history)
+    assert policy({"content": "same"})
+    summary = policy.summary()
+    assert summary["reason"] == "repeated_loop"
+    assert summary["turns"] == 2
+
+
+def test_policy_options_can_be_disabled():
+    policy = build_termination_policy({"keyword": None, "max_empty": None})
+    assert policy.detectors == []
+    assert not policy({"content": "TERMINATE"})
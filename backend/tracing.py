@@ -0,0 +1,355 @@
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "autogenstudio"
+TRACE_FILE = "traces.jsonl"
+DEFAULT_OTLP_ENDPOINT = "http://localhost:4318"
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class SpanContext:
+    """Identity of a span, also used for parents that live in another process (W3C traceparent)"""
+
+    def __init__(self, trace_id: str, span_id: str) -> None:
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    """Parses a W3C traceparent header, returns None for a missing or malformed one"""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return SpanContext(parts[1], parts[2])
+
+
+class Span(SpanContext):
+    """
+    A timed stage of a request. Spans nest through a context variable; besides being exported, every finished span
+    adds its exclusive time (its duration minus that of its child spans) to the stage times of its root span, so the
+    root can report a breakdown of where a turn went that adds up to its total.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        parent: Optional[SpanContext] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        super().__init__(parent.trace_id if parent else secrets.token_hex(16), secrets.token_hex(8))
+        self.name = name
+        self.parent = parent
+        self.kind = kind
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        # only spans of this process take part in the stage breakdown
+        self.root: Span = parent.root if isinstance(parent, Span) else self
+        self.stage_times: Dict[str, float] = {}
+        self.children_time = 0.0
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        self.end_time_ns = self.start_time_ns + int(self.duration * 1e9)
+        with _stage_lock:
+            if isinstance(self.parent, Span):
+                self.parent.children_time += self.duration
+            stages = self.root.stage_times
+            stages[self.name] = stages.get(self.name, 0.0) + max(0.0, self.duration - self.children_time)
+
+    def timings(self) -> Dict[str, float]:
+        """Exclusive seconds per stage name of the finished spans below this root, plus the elapsed "total" """
+        elapsed = self.duration if self.duration is not None else time.perf_counter() - self._start
+        with _stage_lock:
+            timings = {name: round(seconds, 6) for name, seconds in self.root.stage_times.items()}
+        timings["total"] = round(elapsed, 6)
+        return timings
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time_ns),
+            "endTimeUnixNano": str(self.end_time_ns or self.start_time_ns),
+            "attributes": otlp_attributes(self.attributes),
+            "status": {"code": self.status},
+        }
+        if self.parent is not None:
+            span["parentSpanId"] = self.parent.span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def otlp_request(spans: List[Span], service_name: str) -> Dict[str, Any]:
+    """An OTLP/JSON ExportTraceServiceRequest"""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": otlp_attributes({"service.name": service_name, "process.pid": os.getpid()})},
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [span.to_otlp() for span in spans]}],
+            }
+        ]
+    }
+
+
+class SpanExporter(ABC):
+    @abstractmethod
+    def export(self, spans: List[Span]) -> None:
+        ...
+
+    def shutdown(self) -> None:
+        pass
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Appends one OTLP/JSON export request per batch as a line of a file, the format read by the OpenTelemetry
+    collector's otlpjsonfile receiver
+    """
+
+    def __init__(self, path: str, service_name: str = SERVICE_NAME) -> None:
+        self.path = path
+        self.service_name = service_name
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(otlp_request(spans, self.service_name), separators=(",", ":")) + "\n")
+
+
+class OTLPHttpSpanExporter(SpanExporter):
+    """Posts spans to an OTLP/HTTP collector endpoint with JSON encoding"""
+
+    def __init__(self, endpoint: str, service_name: str = SERVICE_NAME, timeout: float = 10) -> None:
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def export(self, spans: List[Span]) -> None:
+        import urllib.request
+
+        body = json.dumps(otlp_request(spans, self.service_name)).encode("utf-8")
+        request = urllib.request.Request(
+            self.endpoint, data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class BatchSpanProcessor:
+    """Exports finished spans from a background thread in batches, dropping spans when the queue is full"""
+
+    def __init__(
+        self, exporter: SpanExporter, max_queue: int = 2048, max_batch: int = 256, interval: float = 2
+    ) -> None:
+        self.exporter = exporter
+        self.max_batch = max_batch
+        self.interval = interval
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self.thread.start()
+
+    def on_end(self, span: Span) -> None:
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> List[Span]:
+        spans = []
+        while len(spans) < self.max_batch:
+            try:
+                spans.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return spans
+
+    def _export(self, spans: List[Span]) -> None:
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            logger.warning("Exporting %s spans failed: %s", len(spans), e)
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            while True:
+                spans = self._drain()
+                if not spans:
+                    break
+                self._export(spans)
+
+    def shutdown(self) -> None:
+        self.stopped.set()
+        self.thread.join(timeout=self.interval + 1)
+        spans = self._drain()
+        while spans:
+            self._export(spans)
+            spans = self._drain()
+        self.exporter.shutdown()
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the registered processors (exporters, metrics)"""
+
+    def __init__(self) -> None:
+        self.processors: List[Any] = []
+        self.listeners: List[Callable[[Span], None]] = []
+
+    def add_processor(self, processor: Any) -> None:
+        self.processors.append(processor)
+
+    def add_listener(self, listener: Callable[[Span], None]) -> None:
+        """Calls listener with every finished span, on the thread that finished it"""
+        # the list is replaced rather than changed in place, finish() may be iterating it on another thread
+        self.listeners = self.listeners + [listener]
+
+    def remove_listener(self, listener: Callable[[Span], None]) -> None:
+        self.listeners = [registered for registered in self.listeners if registered is not listener]
+
+    def finish(self, span: Span) -> None:
+        span.end()
+        for processor in self.processors:
+            processor.on_end(span)
+        for listener in self.listeners:
+            try:
+                listener(span)
+            except Exception as e:
+                logger.warning("Span listener failed: %s", e)
+
+    def shutdown(self) -> None:
+        processors, self.processors = self.processors, []
+        for processor in processors:
+            processor.shutdown()
+
+
+tracer = Tracer()
+_stage_lock = threading.Lock()
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(
+    name: str,
+    attributes: Optional[Dict[str, Any]] = None,
+    parent: Union[SpanContext, None] = None,
+    kind: int = SPAN_KIND_INTERNAL,
+) -> Iterator[Span]:
+    """Runs the block in a span that is a child of parent, or of the current span when no parent is given"""
+    current = Span(name, parent=parent or _current_span.get(), kind=kind, attributes=attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        tracer.finish(current)
+
+
+def traced(name: Optional[str] = None, kind: int = SPAN_KIND_INTERNAL) -> Callable:
+    """Decorator that runs a function in a span named name, or after the function"""
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind=kind):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def configure_tracing(app_root: str, exporter: Optional[str] = None) -> None:
+    """
+    Sets up span export from AUTOGENSTUDIO_TRACING: "file" appends OTLP/JSON to AUTOGENSTUDIO_TRACE_FILE (default
+    <app_root>/traces.jsonl), "otlp" posts to OTEL_EXPORTER_OTLP_TRACES_ENDPOINT or OTEL_EXPORTER_OTLP_ENDPOINT.
+    Without a setting spans are only used for the per-turn timings stored with each message.
+    """
+    exporter = exporter or os.environ.get("AUTOGENSTUDIO_TRACING", "none")
+    if tracer.processors or exporter == "none":
+        return
+
+    service_name = os.environ.get("OTEL_SERVICE_NAME", SERVICE_NAME)
+    if exporter == "file":
+        path = os.environ.get("AUTOGENSTUDIO_TRACE_FILE") or os.path.join(app_root, TRACE_FILE)
+        span_exporter: SpanExporter = FileSpanExporter(path, service_name=service_name)
+    elif exporter == "otlp":
+        endpoint = os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT")
+        if not endpoint:
+            base = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", DEFAULT_OTLP_ENDPOINT)
+            endpoint = base.rstrip("/") + "/v1/traces"
+        span_exporter = OTLPHttpSpanExporter(endpoint, service_name=service_name)
+    else:
+        raise ValueError(f"Unknown trace exporter: {exporter}")
+
+    tracer.add_processor(BatchSpanProcessor(span_exporter))
+    atexit.register(tracer.shutdown)
+    logger.info("Exporting traces with the %s exporter", exporter)
@@ -1,2 +1,4 @@
 from .dbutils import *
 from .utils import *
+from .filetracker import *
+from .blobstore import *
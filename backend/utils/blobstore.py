@@ -0,0 +1,164 @@
+import logging
+import os
+import shutil
+import stat
+import time
+import uuid
+from typing import Optional
+
+from .filetracker import hash_file
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIR = ".blobs"
+# linux FICLONE ioctl, makes dst a copy-on-write clone of src on btrfs/xfs
+FICLONE = 0x40049409
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """Creates dst as a copy-on-write clone of src, returns False (and leaves no dst) where that is not supported"""
+    if fcntl is None:
+        return False
+    try:
+        with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except FileNotFoundError:
+            pass
+        return False
+
+
+def _clone(src: str, dst: str) -> None:
+    """Copies src to dst as a reflink where the filesystem supports it, otherwise as a regular copy"""
+    if not _reflink(src, dst):
+        shutil.copyfile(src, dst)
+
+
+class BlobStore:
+    """
+    Content-addressed store for work dir files. Each distinct file is kept once under <root>/<sha[:2]>/<sha> as a
+    private, read-only reflink of the first work dir file with that content, and later files with the same content
+    are replaced by reflinks of the blob, so identical outputs across runs and users share their data blocks. Work
+    dir files never share an inode with a blob: writing to one copies the blocks it changes, and blobs can be
+    removed at any time. Blobs are a cache of recently seen content, gc() drops those not used for a while. On
+    filesystems without reflinks (e.g. ext4) work dir files are left as they are and nothing is stored, since a
+    private copy would only double the disk usage.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._reflinks: Optional[bool] = None
+        os.makedirs(root, exist_ok=True)
+
+    def supports_reflinks(self) -> bool:
+        """Whether the filesystem of the store can reflink, probed once with two empty files"""
+        if self._reflinks is None:
+            probe = os.path.join(self.root, f".probe-{uuid.uuid4().hex}")
+            open(probe, "wb").close()
+            try:
+                self._reflinks = _reflink(probe, f"{probe}.clone")
+            finally:
+                for path in (probe, f"{probe}.clone"):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+        return self._reflinks
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def add(self, path: str, sha256: Optional[str] = None) -> Optional[str]:
+        """Deduplicates the file at path against the stored blobs, returns the content hash"""
+        try:
+            file_stat = os.lstat(path)
+        except FileNotFoundError:
+            return None
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+
+        sha256 = sha256 or hash_file(path)
+        blob = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            if os.path.exists(blob):
+                self._replace_with_clone(blob, path, stat.S_IMODE(file_stat.st_mode))
+                os.utime(blob)
+            else:
+                # the first copy of the content becomes the blob, the work dir file itself is not touched
+                tmp_blob = f"{blob}.{uuid.uuid4().hex}.tmp"
+                if _reflink(path, tmp_blob):
+                    os.chmod(tmp_blob, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                    os.replace(tmp_blob, blob)
+        except OSError as e:
+            logger.debug("Could not deduplicate %s against blob %s: %s", path, sha256, e)
+        return sha256
+
+    def link(self, sha256: str, target: str, source: Optional[str] = None) -> None:
+        """Places a writable copy of the blob (or of source) at target, as a reflink when possible"""
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        blob = self.blob_path(sha256)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        _clone(source or blob, tmp_path)
+        os.chmod(tmp_path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(tmp_path, target)
+        if source is None:
+            os.utime(blob)
+
+    def add_file(self, src: str, sha256: str) -> Optional[str]:
+        """
+        Adds a file that is not referenced from any work dir yet, e.g. a staged import, by moving it in. Returns the
+        blob path, or None where reflinks are not supported: the file is left at src then, like add() stores nothing.
+        """
+        blob = self.blob_path(sha256)
+        if os.path.exists(blob):
+            return blob
+        if not self.supports_reflinks():
+            return None
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        os.chmod(src, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(src, blob)
+        return blob
+
+    def gc(self, max_idle: float = 7 * 24 * 3600) -> int:
+        """
+        Removes blobs that were not added or linked for max_idle seconds, returns the number of freed bytes. Work
+        dirs hold their own copies, so a removed blob only stops later files with its content from being shared.
+        """
+        freed = 0
+        now = time.time()
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                blob = os.path.join(prefix_dir, name)
+                try:
+                    blob_stat = os.stat(blob)
+                    if now - blob_stat.st_mtime > max_idle:
+                        os.remove(blob)
+                        freed += blob_stat.st_size
+                except FileNotFoundError:
+                    continue
+        return freed
+
+    @staticmethod
+    def _replace_with_clone(blob: str, path: str, mode: int) -> None:
+        """Replaces path with a reflink of the blob, path is left as it is where reflinks are not supported"""
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        if not _reflink(blob, tmp_path):
+            return
+        try:
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, path)
+        except OSError:
+            os.remove(tmp_path)
+            raise
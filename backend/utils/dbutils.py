@@ -1,11 +1,15 @@
+import contextvars
+import functools
 import json
 import logging
 import os
 import sqlite3
 import threading
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
 
 from datamodel import AgentFlowSpec, AgentWorkFlowConfig, Gallery, Message, Model, Session, Skill
+from tracing import span
 from version import __version__ as __db_version__
 
 VERSION_TABLE_SQL = """
@@ -27,6 +31,8 @@ MODELS_TABLE_SQL = """
                 api_type TEXT,
                 api_version TEXT,
                 description TEXT,
+                folder_id TEXT,
+                credentials TEXT,
                 UNIQUE (id, user_id)
             )
             """
@@ -92,6 +98,7 @@ WORKFLOWS_TABLE_SQL = """
                 name TEXT,
                 description TEXT,
                 summary_method TEXT,
+                termination_config TEXT,
                 UNIQUE (id, user_id)
             )
             """
@@ -107,9 +114,58 @@ GALLERY_TABLE_SQL = """
             )
             """
 
+GALLERY_INDEX_TABLE_SQL = """
+            CREATE TABLE IF NOT EXISTS gallery_index (
+                id TEXT NOT NULL,
+                title TEXT,
+                tags TEXT,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                first_prompt TEXT,
+                thumbnails TEXT,
+                timestamp DATETIME NOT NULL,
+                UNIQUE (id)
+            )
+            """
+
+GALLERY_TAGS_TABLE_SQL = """
+            CREATE TABLE IF NOT EXISTS gallery_tags (
+                gallery_id TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                UNIQUE (gallery_id, tag)
+            )
+            """
+
+GALLERY_INDEX_SQL = [
+    "CREATE INDEX IF NOT EXISTS gallery_index_timestamp ON gallery_index (timestamp)",
+    "CREATE INDEX IF NOT EXISTS gallery_tags_tag ON gallery_tags (tag)",
+]
+
 
 lock = threading.Lock()
-logger = logging.getLogger()
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_current_db_function: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("db_function", default=None)
+
+
+def db_function(function: F) -> F:
+    """
+    Labels the queries run by a dbutils function with its name (db.function of the db.query spans). Queries of
+    shared helpers such as get_item_by_field are labelled with the outermost db_function that called them.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _current_db_function.get() is not None:
+            return function(*args, **kwargs)
+        token = _current_db_function.set(function.__name__)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current_db_function.reset(token)
+
+    return wrapper
 
 
 class DBManager:
@@ -130,6 +186,29 @@ class DBManager:
     def migrate(self):
         self.add_column_if_not_exists("sessions", "name", "TEXT")
         self.add_column_if_not_exists("models", "description", "TEXT")
+        self.add_column_if_not_exists("models", "folder_id", "TEXT")
+        self.add_column_if_not_exists("models", "credentials", "TEXT")
+        self.add_column_if_not_exists("workflows", "termination_config", "TEXT")
+        self.create_gallery_index()
+
+    def create_gallery_index(self):
+        self.cursor.execute(GALLERY_INDEX_TABLE_SQL)
+        self.cursor.execute(GALLERY_TAGS_TABLE_SQL)
+        for index_sql in GALLERY_INDEX_SQL:
+            self.cursor.execute(index_sql)
+
+        # backfill gallery items published before the index existed
+        self.cursor.execute(
+            "SELECT g.id, g.session, g.messages, g.tags, g.timestamp FROM gallery g "
+            "LEFT JOIN gallery_index i ON g.id = i.id WHERE i.id IS NULL"
+        )
+        rows = self.cursor.fetchall()
+        for gallery_id, session, messages, tags, timestamp in rows:
+            card = get_gallery_card(json.loads(session), json.loads(messages), json.loads(tags))
+            insert_gallery_card(self.cursor, gallery_id, card, timestamp)
+        self.conn.commit()
+        if rows:
+            logger.info(f"Migration: {len(rows)} gallery items have been added to the gallery index.")
 
     def add_column_if_not_exists(self, table: str, column: str, column_type: str):
         try:
@@ -140,13 +219,13 @@ class DBManager:
                 self.conn.commit()
                 logger.info(f"Migration: New '{column}' column has been added to the '{table}' table.")
             else:
-                logger.info(f"'{column}' column already exists in the '{table}' table.")
+                logger.debug(f"'{column}' column already exists in the '{table}' table.")
 
         except Exception as e:
-            print(f"Error while checking and updating '{table}' table: {e}")
+            logger.error(f"Error while checking and updating '{table}' table: {e}")
 
     def reset_db(self):
-        print("resetting db")
+        logger.info("Resetting database")
         if os.path.exists(self.path):
             os.remove(self.path)
         self.init_db(path=self.path)
@@ -164,6 +243,8 @@ class DBManager:
         self.cursor.execute(GALLERY_TABLE_SQL)
         self.cursor.execute(AGENTS_TABLE_SQL)
         self.cursor.execute(WORKFLOWS_TABLE_SQL)
+        self.cursor.execute(GALLERY_INDEX_TABLE_SQL)
+        self.cursor.execute(GALLERY_TAGS_TABLE_SQL)
 
         current_dir = os.path.dirname(os.path.realpath(__file__))
         with open(os.path.join(current_dir, "dbdefaults.json"), "r", encoding="utf-8") as json_file:
@@ -213,7 +294,7 @@ class DBManager:
             for workflow in data["workflows"]:
                 workflow = AgentWorkFlowConfig(**workflow)
                 self.cursor.execute(
-                    "INSERT INTO workflows (id, user_id, timestamp, sender, receiver, type, name, description, summary_method) VALUES (?, ?, ?, ?, ?, ?, ?, ?,?)",
+                    "INSERT INTO workflows (id, user_id, timestamp, sender, receiver, type, name, description, summary_method, termination_config) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
                     (
                         workflow.id,
                         "default",
@@ -224,6 +305,7 @@ class DBManager:
                         workflow.name,
                         workflow.description,
                         workflow.summary_method,
+                        json.dumps(workflow.termination_config),
                     ),
                 )
 
@@ -231,15 +313,25 @@ class DBManager:
 
     def query(self, query: str, args: Tuple = (), return_json: bool = False) -> List[Dict[str, Any]]:
         try:
-            with lock:
-                self.cursor.execute(query, args)
-                result = self.cursor.fetchall()
-                self.commit()
-                if return_json:
-                    result = [dict(zip([key[0] for key in self.cursor.description], row)) for row in result]
-                return result
+            attributes = {
+                "db.system": "sqlite",
+                "db.operation": query.split(None, 1)[0].upper(),
+                # the dbutils function that runs the query, for per function latency metrics
+                "db.function": _current_db_function.get() or "query",
+            }
+            with span("db.query", attributes) as db_span:
+                lock_start = time.perf_counter()
+                with lock:
+                    db_span.set_attribute("db.lock_wait", time.perf_counter() - lock_start)
+                    self.cursor.execute(query, args)
+                    result = self.cursor.fetchall()
+                    self.commit()
+                    if return_json:
+                        result = [dict(zip([key[0] for key in self.cursor.description], row)) for row in result]
+                    return result
         except Exception as e:
-            logger.error("Error running query with query %s and args %s: %s", query, args, e)
+            # args are not logged, they can hold api keys and message contents
+            logger.error("Error running query %s with %d args: %s", query, len(args), e)
             raise e
 
     def commit(self) -> None:
@@ -249,13 +341,17 @@ class DBManager:
         self.conn.close()
 
 
+@db_function
 def get_models(user_id: str, dbmanager: DBManager) -> List[dict]:
     query = "SELECT * FROM models WHERE user_id = ? OR user_id = ?"
     args = (user_id, "default")
     results = dbmanager.query(query, args, return_json=True)
+    for row in results:
+        row["credentials"] = json.loads(row["credentials"]) if row.get("credentials") else None
     return results
 
 
+@db_function
 def upsert_model(model: Model, dbmanager: DBManager) -> List[dict]:
     existing_model = get_item_by_field("models", "id", model.id, dbmanager)
 
@@ -269,12 +365,17 @@ def upsert_model(model: Model, dbmanager: DBManager) -> List[dict]:
             "user_id": model.user_id,
             "timestamp": model.timestamp,
             "description": model.description,
+            "folder_id": model.folder_id,
+            "credentials": json.dumps(model.credentials) if model.credentials else None,
         }
         update_item("models", model.id, updated_data, dbmanager)
     else:
         query = """
-            INSERT INTO models (id, user_id, timestamp, model, api_key, base_url, api_type, api_version, description)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO models (
+                id, user_id, timestamp, model, api_key, base_url, api_type, api_version, description, folder_id,
+                credentials
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
         args = (
             model.id,
@@ -286,6 +387,8 @@ def upsert_model(model: Model, dbmanager: DBManager) -> List[dict]:
             model.api_type,
             model.api_version,
             model.description,
+            model.folder_id,
+            json.dumps(model.credentials) if model.credentials else None,
         )
         dbmanager.query(query=query, args=args)
 
@@ -293,6 +396,7 @@ def upsert_model(model: Model, dbmanager: DBManager) -> List[dict]:
     return models
 
 
+@db_function
 def delete_model(model: Model, dbmanager: DBManager) -> List[dict]:
     query = "DELETE FROM models WHERE id = ? AND user_id = ?"
     args = (model.id, model.user_id)
@@ -302,6 +406,7 @@ def delete_model(model: Model, dbmanager: DBManager) -> List[dict]:
     return models
 
 
+@db_function
 def create_message(message: Message, dbmanager: DBManager) -> List[dict]:
     query = "INSERT INTO messages (user_id, root_msg_id, msg_id, role, content, metadata, timestamp, session_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
     args = (
@@ -319,6 +424,14 @@ def create_message(message: Message, dbmanager: DBManager) -> List[dict]:
     return messages
 
 
+@db_function
+def update_message(msg_id: str, content: str, metadata: Optional[str], dbmanager: DBManager) -> None:
+    query = "UPDATE messages SET content = ?, metadata = ? WHERE msg_id = ?"
+    args = (content, metadata, msg_id)
+    dbmanager.query(query=query, args=args)
+
+
+@db_function
 def get_messages(user_id: str, session_id: str, dbmanager: DBManager) -> List[dict]:
     query = "SELECT * FROM messages WHERE user_id = ? AND session_id = ?"
     args = (user_id, session_id)
@@ -327,6 +440,7 @@ def get_messages(user_id: str, session_id: str, dbmanager: DBManager) -> List[di
     return result
 
 
+@db_function
 def get_sessions(user_id: str, dbmanager: DBManager) -> List[dict]:
     query = "SELECT * FROM sessions WHERE user_id = ?"
     args = (user_id,)
@@ -337,6 +451,7 @@ def get_sessions(user_id: str, dbmanager: DBManager) -> List[dict]:
     return result
 
 
+@db_function
 def create_session(user_id: str, session: Session, dbmanager: DBManager) -> List[dict]:
     query = "INSERT INTO sessions (user_id, id, timestamp, flow_config) VALUES (?, ?, ?,?)"
     args = (session.user_id, session.id, session.timestamp, json.dumps(session.flow_config.dict()))
@@ -346,6 +461,7 @@ def create_session(user_id: str, session: Session, dbmanager: DBManager) -> List
     return sessions
 
 
+@db_function
 def rename_session(name: str, session: Session, dbmanager: DBManager) -> List[dict]:
     query = "UPDATE sessions SET name = ? WHERE id = ?"
     args = (name, session.id)
@@ -355,6 +471,7 @@ def rename_session(name: str, session: Session, dbmanager: DBManager) -> List[di
     return sessions
 
 
+@db_function
 def delete_session(session: Session, dbmanager: DBManager) -> List[dict]:
     query = "DELETE FROM sessions WHERE id = ?"
     args = (session.id,)
@@ -367,30 +484,99 @@ def delete_session(session: Session, dbmanager: DBManager) -> List[dict]:
     return get_sessions(user_id=session.user_id, dbmanager=dbmanager)
 
 
+def get_gallery_card(session: Dict[str, Any], messages: List[Dict[str, Any]], tags: List[str]) -> Dict[str, Any]:
+    """Precomputes the data shown on a gallery grid card"""
+    flow_config = session.get("flow_config") or {}
+    first_prompt = next((message["content"] for message in messages if message.get("role") == "user"), "")
+
+    thumbnails = []
+    for message in messages:
+        metadata = message.get("metadata")
+        if isinstance(metadata, str):
+            try:
+                metadata = json.loads(metadata)
+            except json.JSONDecodeError:
+                metadata = None
+        for file in (metadata or {}).get("files", []) if isinstance(metadata, dict) else []:
+            if file.get("type") == "image" and file.get("path") and len(thumbnails) < 4:
+                thumbnails.append(f"{file['path']}?preview=true")
+
+    return {
+        "title": session.get("name") or flow_config.get("name") or first_prompt[:80],
+        "tags": tags,
+        "message_count": len(messages),
+        "first_prompt": first_prompt[:500],
+        "thumbnails": thumbnails,
+    }
+
+
+def insert_gallery_card(cursor: sqlite3.Cursor, gallery_id: str, card: Dict[str, Any], timestamp: str) -> None:
+    cursor.execute(
+        "INSERT INTO gallery_index (id, title, tags, message_count, first_prompt, thumbnails, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            gallery_id,
+            card["title"],
+            json.dumps(card["tags"]),
+            card["message_count"],
+            card["first_prompt"],
+            json.dumps(card["thumbnails"]),
+            timestamp,
+        ),
+    )
+    for tag in set(card["tags"]):
+        cursor.execute("INSERT OR IGNORE INTO gallery_tags (gallery_id, tag) VALUES (?, ?)", (gallery_id, tag))
+
+
+@db_function
 def create_gallery(session: Session, dbmanager: DBManager, tags: List[str] = []) -> Gallery:
     messages = get_messages(user_id=session.user_id, session_id=session.id, dbmanager=dbmanager)
     gallery_item = Gallery(session=session, messages=messages, tags=tags)
+    session_dict = gallery_item.session.dict()
+    messages_list = [message.dict() for message in gallery_item.messages]
     query = "INSERT INTO gallery (id, session, messages, tags, timestamp) VALUES (?, ?, ?, ?,?)"
     args = (
         gallery_item.id,
-        json.dumps(gallery_item.session.dict()),
-        json.dumps([message.dict() for message in gallery_item.messages]),
+        json.dumps(session_dict),
+        json.dumps(messages_list),
         json.dumps(gallery_item.tags),
         gallery_item.timestamp,
     )
     dbmanager.query(query=query, args=args)
+
+    card = get_gallery_card(session_dict, messages_list, gallery_item.tags)
+    with lock:
+        insert_gallery_card(dbmanager.cursor, gallery_item.id, card, gallery_item.timestamp)
+        dbmanager.commit()
     return gallery_item
 
 
-def get_gallery(gallery_id, dbmanager: DBManager) -> List[Gallery]:
-    if gallery_id:
-        query = "SELECT * FROM gallery WHERE id = ?"
-        args = (gallery_id,)
-    else:
-        query = "SELECT * FROM gallery"
-        args = ()
+@db_function
+def get_gallery(
+    gallery_id, dbmanager: DBManager, limit: Optional[int] = None, offset: int = 0, tag: Optional[str] = None
+) -> List[Any]:
+    """
+    Returns the full gallery item when gallery_id is given. Otherwise returns precomputed cards from the gallery
+    index, newest first, optionally filtered by tag and paginated with limit/offset.
+    """
+    if not gallery_id:
+        query = "SELECT i.* FROM gallery_index i"
+        args: Tuple = ()
+        if tag:
+            query += " JOIN gallery_tags t ON t.gallery_id = i.id WHERE t.tag = ?"
+            args += (tag,)
+        query += " ORDER BY i.timestamp DESC"
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            args += (limit, offset)
+        cards = dbmanager.query(query=query, args=args, return_json=True)
+        for card in cards:
+            card["tags"] = json.loads(card["tags"] or "[]")
+            card["thumbnails"] = json.loads(card["thumbnails"] or "[]")
+        return cards
+
+    query = "SELECT * FROM gallery WHERE id = ?"
+    args = (gallery_id,)
     result = dbmanager.query(query=query, args=args, return_json=True)
-    result = sorted(result, key=lambda k: k["timestamp"], reverse=True)
     gallery = []
     for row in result:
         gallery_item = Gallery(
@@ -404,6 +590,7 @@ def get_gallery(gallery_id, dbmanager: DBManager) -> List[Gallery]:
     return gallery
 
 
+@db_function
 def get_skills(user_id: str, dbmanager: DBManager) -> List[Skill]:
     query = "SELECT * FROM skills WHERE user_id = ? OR user_id = ?"
     args = (user_id, "default")
@@ -417,6 +604,7 @@ def get_skills(user_id: str, dbmanager: DBManager) -> List[Skill]:
     return skills
 
 
+@db_function
 def upsert_skill(skill: Skill, dbmanager: DBManager) -> List[Skill]:
     existing_skill = get_item_by_field("skills", "id", skill.id, dbmanager)
 
@@ -439,6 +627,7 @@ def upsert_skill(skill: Skill, dbmanager: DBManager) -> List[Skill]:
     return skills
 
 
+@db_function
 def delete_skill(skill: Skill, dbmanager: DBManager) -> List[Skill]:
     query = "DELETE FROM skills WHERE id = ? AND user_id = ?"
     args = (skill.id, skill.user_id)
@@ -447,6 +636,7 @@ def delete_skill(skill: Skill, dbmanager: DBManager) -> List[Skill]:
     return get_skills(user_id=skill.user_id, dbmanager=dbmanager)
 
 
+@db_function
 def delete_message(
     user_id: str, msg_id: str, session_id: str, dbmanager: DBManager, delete_all: bool = False
 ) -> List[dict]:
@@ -463,6 +653,7 @@ def delete_message(
         return messages
 
 
+@db_function
 def get_agents(user_id: str, dbmanager: DBManager) -> List[AgentFlowSpec]:
     query = "SELECT * FROM agents WHERE user_id = ? OR user_id = ?"
     args = (user_id, "default")
@@ -477,6 +668,7 @@ def get_agents(user_id: str, dbmanager: DBManager) -> List[AgentFlowSpec]:
     return agents
 
 
+@db_function
 def upsert_agent(agent_flow_spec: AgentFlowSpec, dbmanager: DBManager) -> List[Dict[str, Any]]:
     existing_agent = get_item_by_field("agents", "id", agent_flow_spec.id, dbmanager)
 
@@ -506,6 +698,7 @@ def upsert_agent(agent_flow_spec: AgentFlowSpec, dbmanager: DBManager) -> List[D
     return agents
 
 
+@db_function
 def delete_agent(agent: AgentFlowSpec, dbmanager: DBManager) -> List[Dict[str, Any]]:
     query = "DELETE FROM agents WHERE id = ? AND user_id = ?"
     args = (agent.id, agent.user_id)
@@ -514,6 +707,7 @@ def delete_agent(agent: AgentFlowSpec, dbmanager: DBManager) -> List[Dict[str, A
     return get_agents(user_id=agent.user_id, dbmanager=dbmanager)
 
 
+@db_function
 def get_item_by_field(table: str, field: str, value: Any, dbmanager: DBManager) -> Optional[Dict[str, Any]]:
     query = f"SELECT * FROM {table} WHERE {field} = ?"
     args = (value,)
@@ -521,6 +715,7 @@ def get_item_by_field(table: str, field: str, value: Any, dbmanager: DBManager)
     return result[0] if result else None
 
 
+@db_function
 def update_item(table: str, item_id: str, updated_data: Dict[str, Any], dbmanager: DBManager) -> None:
     set_clause = ", ".join([f"{key} = ?" for key in updated_data.keys()])
     query = f"UPDATE {table} SET {set_clause} WHERE id = ?"
@@ -528,20 +723,30 @@ def update_item(table: str, item_id: str, updated_data: Dict[str, Any], dbmanage
     dbmanager.query(query=query, args=args)
 
 
+@db_function
 def get_workflows(user_id: str, dbmanager: DBManager) -> List[Dict[str, Any]]:
     query = "SELECT * FROM workflows WHERE user_id = ? OR user_id = ?"
     args = (user_id, "default")
     result = dbmanager.query(query=query, args=args, return_json=True)
     result = sorted(result, key=lambda k: k["timestamp"], reverse=True)
-    workflows = []
-    for row in result:
-        row["sender"] = json.loads(row["sender"])
-        row["receiver"] = json.loads(row["receiver"])
-        workflow = AgentWorkFlowConfig(**row)
-        workflows.append(workflow)
-    return workflows
+    return [_workflow_from_row(row) for row in result]
+
+
+@db_function
+def get_workflow(workflow_id: str, dbmanager: DBManager) -> Optional[AgentWorkFlowConfig]:
+    query = "SELECT * FROM workflows WHERE id = ?"
+    result = dbmanager.query(query=query, args=(workflow_id,), return_json=True)
+    return _workflow_from_row(result[0]) if result else None
+
+
+def _workflow_from_row(row: Dict[str, Any]) -> AgentWorkFlowConfig:
+    row["sender"] = json.loads(row["sender"])
+    row["receiver"] = json.loads(row["receiver"])
+    row["termination_config"] = json.loads(row["termination_config"] or "null")
+    return AgentWorkFlowConfig(**row)
 
 
+@db_function
 def upsert_workflow(workflow: AgentWorkFlowConfig, dbmanager: DBManager) -> List[Dict[str, Any]]:
     existing_workflow = get_item_by_field("workflows", "id", workflow.id, dbmanager)
 
@@ -559,10 +764,11 @@ def upsert_workflow(workflow: AgentWorkFlowConfig, dbmanager: DBManager) -> List
             "name": workflow.name,
             "description": workflow.description,
             "summary_method": workflow.summary_method,
+            "termination_config": json.dumps(workflow.termination_config),
         }
         update_item("workflows", workflow.id, updated_data, dbmanager)
     else:
-        query = "INSERT INTO workflows (id, user_id, timestamp, sender, receiver, type, name, description, summary_method) VALUES (?, ?, ?, ?, ?, ?, ?, ?,?)"
+        query = "INSERT INTO workflows (id, user_id, timestamp, sender, receiver, type, name, description, summary_method, termination_config) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
         args = (
             workflow.id,
             workflow.user_id,
@@ -577,12 +783,14 @@ def upsert_workflow(workflow: AgentWorkFlowConfig, dbmanager: DBManager) -> List
             workflow.name,
             workflow.description,
             workflow.summary_method,
+            json.dumps(workflow.termination_config),
         )
         dbmanager.query(query=query, args=args)
 
     return get_workflows(user_id=workflow.user_id, dbmanager=dbmanager)
 
 
+@db_function
 def delete_workflow(workflow: AgentWorkFlowConfig, dbmanager: DBManager) -> List[Dict[str, Any]]:
     query = "DELETE FROM workflows WHERE id = ? AND user_id = ?"
     args = (workflow.id, workflow.user_id)
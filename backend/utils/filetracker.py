@@ -0,0 +1,93 @@
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+from .utils import get_file_type
+
+IGNORE_EXTENSIONS = {".pyc", ".cache"}
+IGNORE_NAMES = {"__pycache__", "__init__.py", ".history"}
+
+FileStat = Tuple[int, int, int]
+
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class FileChangeTracker:
+    """
+    Tracks files created, modified and deleted in a work dir during a run. start() records an os.scandir snapshot of
+    (size, mtime_ns, inode) per file and changes() diffs a second snapshot against it, so results do not depend on
+    timestamp windows or mtime granularity. Only changed files are hashed, their hashes are kept in hashes (by
+    absolute path) for deduplication in a BlobStore.
+    """
+
+    def __init__(self, source_dir: str, max_hash_bytes: int = 64 * 1024 * 1024) -> None:
+        self.source_dir = source_dir
+        self.max_hash_bytes = max_hash_bytes
+        self.before: Dict[str, FileStat] = {}
+        self.hashes: Dict[str, str] = {}
+
+    def snapshot(self) -> Dict[str, FileStat]:
+        files: Dict[str, FileStat] = {}
+        stack = [self.source_dir]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = os.scandir(directory)
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.name in IGNORE_NAMES:
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        if os.path.splitext(entry.name)[1] in IGNORE_EXTENSIONS:
+                            continue
+                        stat = entry.stat(follow_symlinks=False)
+                        files[entry.path] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        return files
+
+    def start(self) -> None:
+        self.before = self.snapshot()
+
+    def changes(self) -> List[Dict[str, object]]:
+        after = self.snapshot()
+        self.hashes = {}
+        changes = []
+        for file_path, stat in after.items():
+            previous = self.before.get(file_path)
+            if previous == stat:
+                continue
+            changes.append(self._describe(file_path, "created" if previous is None else "modified", stat[0]))
+
+        for file_path in self.before.keys() - after.keys():
+            changes.append(self._describe(file_path, "deleted", self.before[file_path][0]))
+
+        changes.sort(key=lambda x: x["extension"])
+        return changes
+
+    def _describe(self, file_path: str, status: str, size: int) -> Dict[str, object]:
+        sha256: Optional[str] = None
+        if status != "deleted" and size <= self.max_hash_bytes:
+            try:
+                sha256 = self.hashes[file_path] = hash_file(file_path)
+            except OSError:
+                pass
+
+        file_name = os.path.basename(file_path)
+        return {
+            "path": "files/user" + file_path.split("files/user", 1)[1] if "files/user" in file_path else "",
+            "name": file_name,
+            "extension": os.path.splitext(file_name)[1].lstrip("."),
+            "type": get_file_type(file_path),
+            "status": status,
+            "size": size,
+            "sha256": sha256,
+        }
@@ -1,18 +1,24 @@
+import ast
 import base64
+import copy
 import hashlib
+import logging
 import os
 import re
 import shutil
-from typing import Dict, List, Tuple, Union
+import stat
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
 from dotenv import load_dotenv
 
-import autogen
-
 from datamodel import AgentConfig, AgentFlowSpec, AgentWorkFlowConfig, LLMConfig, Model, Skill
+from metrics import record_cache
 from version import APP_NAME
-from yandexgpt.dto import CompletionOptions, CompletionRequest, Message, YandexGPTModelUri
-from yandexgpt.http_client import YandexGPTApiClient
+from yandexgpt.dto import Message
+
+logger = logging.getLogger(__name__)
+
 
 def md5_hash(text: str) -> str:
     return hashlib.md5(text.encode()).hexdigest()
@@ -110,7 +116,7 @@ def serialize_file(file_path: str) -> Tuple[str, str]:
 def get_modified_files(start_timestamp: float, end_timestamp: float, source_dir: str) -> List[Dict[str, str]]:
     modified_files = []
     ignore_extensions = {".pyc", ".cache"}
-    ignore_files = {"__pycache__", "__init__.py"}
+    ignore_files = {"__pycache__", "__init__.py", ".history"}
 
     for root, dirs, files in os.walk(source_dir):
         dirs[:] = [d for d in dirs if d not in ignore_files]
@@ -138,19 +144,24 @@ def get_modified_files(start_timestamp: float, end_timestamp: float, source_dir:
     return modified_files
 
 
+def get_app_root() -> str:
+    default_app_root = os.path.join(os.path.expanduser("~"), f".{APP_NAME}")
+    return os.environ.get("AUTOGENSTUDIO_APPDIR") or default_app_root
+
+
 def init_app_folders(app_file_path: str) -> Dict[str, str]:
     app_name = f".{APP_NAME}"
     default_app_root = os.path.join(os.path.expanduser("~"), app_name)
     if not os.path.exists(default_app_root):
         os.makedirs(default_app_root, exist_ok=True)
-    app_root = os.environ.get("AUTOGENSTUDIO_APPDIR") or default_app_root
+    app_root = get_app_root()
 
     if not os.path.exists(app_root):
         os.makedirs(app_root, exist_ok=True)
 
     env_file = os.path.join(app_root, ".env")
     if os.path.exists(env_file):
-        print(f"Loading environment variables from {env_file}")
+        logger.info("Loading environment variables from %s", env_file)
         load_dotenv(env_file)
 
     files_static_root = os.path.join(app_root, "files/")
@@ -164,35 +175,110 @@ def init_app_folders(app_file_path: str) -> Dict[str, str]:
         "static_folder_root": static_folder_root,
         "app_root": app_root,
     }
-    print(f"Initialized application data folder: {app_root}")
+    logger.info("Initialized application data folder: %s", app_root)
     return folders
 
 
+_skills_prompt_cache: Dict[str, str] = {}
+
+
+def get_skill_signatures(content: str) -> str:
+    """Reduces skill source to its imports, function signatures and docstrings"""
+    try:
+        tree = ast.parse(content)
+    except SyntaxError:
+        return content
+
+    signatures = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            signatures.append(ast.unparse(node))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            stub = copy.deepcopy(node)
+            docstring = ast.get_docstring(node)
+            stub.body = [ast.Expr(ast.Constant(docstring))] if docstring else []
+            stub.body.append(ast.Expr(ast.Constant(...)))
+            signatures.append(ast.unparse(stub))
+    return "\n\n".join(signatures)
+
+
+def get_skills_bundle(skills: List[Skill], cache_dir: str = None) -> Tuple[str, str]:
+    """
+    Compiles the skills into a content addressed skills.py bundle under cache_dir, the bundle is written only once
+    per unique skill set. Returns the bundle hash and path.
+    """
+    source = ""
+    for skill in skills:
+        source += f"""
+##### Begin of {skill.title} #####
+
+{skill.content}
+
+#### End of {skill.title} ####
+"""
+
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    bundle_dir = os.path.join(cache_dir or os.path.join(get_app_root(), "skills"), digest)
+    bundle_path = os.path.join(bundle_dir, "skills.py")
+    exists = os.path.exists(bundle_path)
+    record_cache("skills_bundle", exists)
+    if not exists:
+        os.makedirs(bundle_dir, exist_ok=True)
+        # unique per writer, concurrent turns with the same skills write the bundle at the same time
+        tmp_path = f"{bundle_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(source)
+        # the bundle is shared by every run with this skill set
+        os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        try:
+            os.replace(tmp_path, bundle_path)
+        except OSError:
+            # another writer won the race with the same content
+            os.remove(tmp_path)
+            if not os.path.exists(bundle_path):
+                raise
+    return digest, bundle_path
+
+
 def get_skills_from_prompt(skills: List[Skill], work_dir: str) -> str:
     instruction = """
 
 While solving the task you may use functions below which will be available in a file called skills.py .
 To use a function skill.py in code, IMPORT THE FUNCTION FROM skills.py  and then use the function.
+Only signatures and docstrings are listed. If you need the full source of a function, print it with
+`import inspect, skills; print(inspect.getsource(skills.<function name>))`.
 If you need to install python packages, write shell code to
 install via pip and use --quiet option.
 """
-    prompt = ""
-    for skill in skills:
-        prompt += f"""
+    digest, bundle_path = get_skills_bundle(skills)
+
+    if not os.path.exists(work_dir):
+        os.makedirs(work_dir)
+
+    # the bundle is read-only, so agents cannot change it through the link
+    skills_path = os.path.join(work_dir, "skills.py")
+    if not (os.path.islink(skills_path) and os.readlink(skills_path) == bundle_path):
+        if os.path.lexists(skills_path):
+            os.remove(skills_path)
+        try:
+            os.symlink(bundle_path, skills_path)
+        except OSError:
+            shutil.copyfile(bundle_path, skills_path)
+
+    record_cache("skills_prompt", digest in _skills_prompt_cache)
+    if digest not in _skills_prompt_cache:
+        prompt = ""
+        for skill in skills:
+            prompt += f"""
 ##### Begin of {skill.title} #####
 
-{skill.content}
+{get_skill_signatures(skill.content)}
 
 #### End of {skill.title} ####
 """
+        _skills_prompt_cache[digest] = prompt
 
-    if not os.path.exists(work_dir):
-        os.makedirs(work_dir)
-
-    with open(os.path.join(work_dir, "skills.py"), "w", encoding="utf-8") as f:
-        f.write(prompt)
-
-    return instruction + prompt
+    return instruction + _skills_prompt_cache[digest]
 
 
 def delete_files_in_folder(folders: Union[str, List[str]]) -> None:
@@ -201,7 +287,7 @@ def delete_files_in_folder(folders: Union[str, List[str]]) -> None:
 
     for folder in folders:
         if not os.path.isdir(folder):
-            print(f"The folder {folder} does not exist.")
+            logger.warning("The folder %s does not exist.", folder)
             continue
 
         for entry in os.listdir(folder):
@@ -212,10 +298,12 @@ def delete_files_in_folder(folders: Union[str, List[str]]) -> None:
                 elif os.path.isdir(path):
                     shutil.rmtree(path)
             except Exception as e:
-                print(f"Failed to delete {path}. Reason: {e}")
+                logger.error("Failed to delete %s. Reason: %s", path, e)
 
 
 def get_default_agent_config(work_dir: str) -> AgentWorkFlowConfig:
+    import autogen
+
     llm_config = LLMConfig(
         config_list=[{"model": "gpt-4"}],
         temperature=0,
@@ -277,28 +365,47 @@ def extract_successful_code_blocks(messages: List[Dict[str, str]]) -> List[str]:
 def sanitize_model(model: Model):
     if isinstance(model, Model):
         model = model.dict()
-    valid_keys = ["model", "base_url", "api_key", "api_type", "api_version"]
+    valid_keys = ["model", "base_url", "api_key", "api_type", "api_version", "folder_id", "credentials"]
     sanitized_model = {k: v for k, v in model.items() if (v is not None and v != "") and k in valid_keys}
     return sanitized_model
 
 def test_model(model: Model):
+    from yandexgpt.pool import complete
+
     sanitized_model = sanitize_model(model)
-    client = YandexGPTApiClient(token=sanitized_model["api_key"])
-    response = client.completion(
-        request=CompletionRequest(
-            messages=[Message(role="user",text="2+2=")]
-        )
-    )
+    response = complete(sanitized_model, messages=[Message(role="user",text="2+2=")])
     return response.alternatives[0].message.text
 
 
-def summarize_chat_history(task: str, messages: List[Dict[str, str]], model: Model):
+def compact_transcript(messages: Iterable[Dict[str, Any]], max_message_chars: int = 2000) -> str:
     """
-    Summarize the chat history using the model endpoint and returning the response.
+    Renders agent messages as "sender: content" lines for summarization. Empty messages and consecutive duplicates
+    are dropped and long contents are truncated.
     """
+    lines = []
+    previous = None
+    for row in messages:
+        message = row.get("message", row)
+        content = (message.get("content") or "").strip() if isinstance(message, dict) else str(message).strip()
+        if not content or content == previous:
+            continue
+        previous = content
+        if len(content) > max_message_chars:
+            content = content[:max_message_chars] + " ...[truncated]"
+        lines.append(f"{row.get('sender', message.get('role', 'agent'))}: {content}")
+    return "\n\n".join(lines)
+
+
+def summarize_chat_history(task: str, messages: Union[str, List[Dict[str, str]]], model: Model):
+    """
+    Summarize the chat history using the model endpoint and returning the response. messages is either the list of
+    agent messages or a transcript built by compact_transcript.
+    """
+
+    from yandexgpt.pool import complete
 
     sanitized_model = sanitize_model(model)
-    client = YandexGPTApiClient(token=sanitized_model["api_key"])
+    transcript = messages if isinstance(messages, str) else compact_transcript(messages)
     summarization_system_prompt = f"""
     You are a helpful assistant that is able to review the chat history between a set of agents (userproxy agents, assistants etc) as they try to address a given TASK and provide a summary. Be SUCCINCT but also comprehensive enough to allow others (who cannot see the chat history) understand and recreate the solution.
 
@@ -308,19 +415,17 @@ def summarize_chat_history(task: str, messages: List[Dict[str, str]], model: Mod
     ===
     The summary should focus on extracting the actual solution to the task from the chat history (assuming the task was addressed) such that any other agent reading the summary will understand what the actual solution is. Use a neutral tone and DO NOT directly mention the agents. Instead only focus on the actions that were carried out (e.g. do not say 'assistant agent generated some code visualization code ..'  instead say say 'visualization code was generated ..' ).
     """
-    response = client.completion(
-        request=CompletionRequest(
-            messages=[
-        
-                Message(
-                    role="system",
-                    text=summarization_system_prompt,
-                ),
-                Message(
-                    role="user",
-                    text=f"Summarize the following chat history. {str(messages)}",
-                ),
-            ]
-        )
+    response = complete(
+        sanitized_model,
+        messages=[
+            Message(
+                role="system",
+                text=summarization_system_prompt,
+            ),
+            Message(
+                role="user",
+                text=f"Summarize the following chat history.\n\n{transcript}",
+            ),
+        ],
     )
     return response.alternatives[0].message.text
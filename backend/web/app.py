@@ -1,29 +1,51 @@
 import asyncio
+import hmac
 import json
+import logging
 import os
-import queue
+import tempfile
 import threading
-import traceback
+import time
 from contextlib import asynccontextmanager
+from typing import Optional
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response
 from fastapi.staticfiles import StaticFiles
-from openai import OpenAIError
+from starlette.background import BackgroundTask
 
-from chatmanager import AutoGenChatManager, WebSocketConnectionManager
+from archive import default_compression, export_archive, import_archive
+from batch import RESULTS_NAME, BatchManager
+from chatmanager import AutoGenChatManager, WebSocketConnectionManager, process_chat_request
 from datamodel import (
     DBWebRequestModel,
     DeleteMessageWebRequestModel,
-    Message,
     Session,
 )
-from utils import DBManager, dbutils, init_app_folders, md5_hash, test_model
+from logconfig import configure_logging
+from messagebus import get_message_bus
+from metrics import (
+    CONTENT_TYPE,
+    JOB_QUEUE_DEPTH,
+    MESSAGE_QUEUE_DEPTH,
+    REGISTRY,
+    WEBSOCKET_CONNECTIONS,
+    HTTPMetricsMiddleware,
+)
+from profiler import get_profiler, snapshot, start_profiler, stop_profiler
+from retention import get_retention_manager, start_retention_manager
+from tracing import SPAN_KIND_SERVER, configure_tracing, parse_traceparent, span
+from utils import BLOBS_DIR, BlobStore, DBManager, dbutils, init_app_folders, test_model
 from version import VERSION
+from web.artifacts import ArtifactServer
+from worker import CHAT_JOB, chat_job_payload, get_job_queue
+
+logger = logging.getLogger(__name__)
 
-managers = {"chat": None} 
+managers = {"chat": None, "jobs": None, "bus": None, "loop": None, "batches": None}
 
-message_queue = queue.Queue()
 active_connections = []
 active_connections_lock = asyncio.Lock()
 websocket_manager = WebSocketConnectionManager(
@@ -31,30 +53,98 @@ websocket_manager = WebSocketConnectionManager(
 )
 
 
+def deliver_message(message: dict) -> None:
+    """Sends a message to the websocket connections of this worker process that it is addressed to"""
+    for connection, socket_client_id in websocket_manager.active_connections:
+        if message["connection_id"] == socket_client_id:
+            # websockets belong to the event loop of the app, not to the calling thread
+            asyncio.run_coroutine_threadsafe(websocket_manager.send_message(message, connection), managers["loop"])
+
+
 def message_handler():
+    """
+    Delivers messages from the message bus. Every web worker receives every message and forwards the ones for its
+    own connections, so a chat running in one worker reaches a websocket connected to another.
+    """
+    for message in managers["bus"].listen():
+        try:
+            deliver_message(message)
+        except Exception as e:
+            logger.error("Error delivering message: %s", e)
+
+
+def job_event_relay():
+    """
+    Forwards agent messages published by queue workers to the websocket connections of this process, and prunes
+    finished jobs and delivered events older than AUTOGENSTUDIO_JOB_RETENTION_HOURS (24 by default) once an hour
+    """
+    job_queue = managers["jobs"]
+    last_event_id = job_queue.last_event_id()
+    max_age = float(os.environ.get("AUTOGENSTUDIO_JOB_RETENTION_HOURS", "24")) * 3600
+    next_prune = time.monotonic()
     while True:
-        message = message_queue.get()
-        print("Active Connections: ", [client_id for _, client_id in websocket_manager.active_connections])
-        print("Current message connection id: ", message["connection_id"])
-        for connection, socket_client_id in websocket_manager.active_connections:
-            if message["connection_id"] == socket_client_id:
-                asyncio.run(websocket_manager.send_message(message, connection))
-        message_queue.task_done()
+        if time.monotonic() >= next_prune:
+            try:
+                job_queue.prune(max_age=max_age)
+            except Exception as e:
+                logger.error("Pruning the job queue failed: %s", e)
+            next_prune = time.monotonic() + 3600
+        events = job_queue.read_events(after_id=last_event_id)
+        for event in events:
+            # every web worker reads all job events, so they are delivered locally rather than through the bus
+            deliver_message(event["message"])
+            last_event_id = event["id"]
+        if not events:
+            time.sleep(0.1)
+
 
+app_file_path = os.path.dirname(os.path.abspath(__file__))
+ui_folder_path = os.path.join(app_file_path, "ui")
 
-message_handler_thread = threading.Thread(target=message_handler, daemon=True)
-message_handler_thread.start()
+# set up in lifespan, so importing this module has no side effects
+folders = {}
+dbmanager: DBManager = None
+artifact_server: ArtifactServer = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("***** App started *****")
-    managers["chat"] = AutoGenChatManager(message_queue=message_queue)
+    global dbmanager, artifact_server
+    configure_logging()
+    folders.update(init_app_folders(app_file_path))
+    dbmanager = DBManager(path=os.path.join(folders["app_root"], "database.sqlite"))
+    artifact_server = ArtifactServer(
+        roots=[folders["files_static_root"], os.path.join(folders["app_root"], "skills")],
+        cache_dir=os.path.join(folders["app_root"], "artifact_cache"),
+    )
+    configure_tracing(folders["app_root"])
+    managers["loop"] = asyncio.get_running_loop()
+    managers["bus"] = get_message_bus(folders["app_root"])
+    MESSAGE_QUEUE_DEPTH.set_function(managers["bus"].depth)
+    WEBSOCKET_CONNECTIONS.set_function(lambda: len(websocket_manager.active_connections))
+    threading.Thread(target=message_handler, name="message-handler", daemon=True).start()
+
+    logger.info("App started")
+    managers["chat"] = AutoGenChatManager(
+        message_queue=managers["bus"], blob_store=BlobStore(os.path.join(folders["files_static_root"], BLOBS_DIR))
+    )
+    start_retention_manager(folders["files_static_root"], cache_dirs=[artifact_server.cache_dir])
+    managers["batches"] = BatchManager(
+        os.path.join(folders["app_root"], "batches"),
+        dbmanager=dbmanager,
+        files_static_root=folders["files_static_root"],
+    )
+    if os.environ.get("AUTOGENSTUDIO_QUEUE", "False") == "True":
+        managers["jobs"] = get_job_queue(folders["app_root"])
+        JOB_QUEUE_DEPTH.set_function(managers["jobs"].depth)
+        threading.Thread(target=job_event_relay, name="job-event-relay", daemon=True).start()
+        logger.info("Chat messages are processed by queue workers")
 
     yield
 
     await websocket_manager.disconnect_all()
-    print("***** App stopped *****")
+    managers["bus"].close()
+    logger.info("App stopped")
 
 
 app = FastAPI(lifespan=lifespan)
@@ -75,55 +165,74 @@ app.add_middleware(
 )
 
 
-app_file_path = os.path.dirname(os.path.abspath(__file__))
-folders = init_app_folders(app_file_path)
-ui_folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ui")
-
 api = FastAPI(root_path="/api")
+api.add_middleware(HTTPMetricsMiddleware)
 app.mount("/api", api)
 
-app.mount("/", StaticFiles(directory=ui_folder_path, html=True), name="ui")
-api.mount("/files", StaticFiles(directory=folders["files_static_root"], html=True), name="files")
 
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text format metrics of this worker process"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
-db_path = os.path.join(folders["app_root"], "database.sqlite")
-dbmanager = DBManager(path=db_path)
 
+# the ui folder is created by init_app_folders in lifespan, before the first request
+app.mount("/", StaticFiles(directory=ui_folder_path, html=True, check_dir=False), name="ui")
 
-@api.post("/messages")
-async def add_message(req: DBWebRequestModel):
-    message = Message(**req.message.dict())
-    user_history = dbutils.get_messages(user_id=message.user_id, session_id=req.message.session_id, dbmanager=dbmanager)
 
-    # save incoming message to db
-    dbutils.create_message(message=message, dbmanager=dbmanager)
-    user_dir = os.path.join(folders["files_static_root"], "user", md5_hash(message.user_id))
-    os.makedirs(user_dir, exist_ok=True)
-
-    try:
-        response_message: Message = managers["chat"].chat(
-            message=message,
-            history=user_history,
-            user_dir=user_dir,
-            flow_config=req.workflow,
-            connection_id=req.connection_id,
-        )
-
-        # save agent's response to db
-        messages = dbutils.create_message(message=response_message, dbmanager=dbmanager)
-        response = {
-            "status": True,
-            "message": "Message processed successfully",
-            "data": messages,
-            # "metadata": json.loads(response_message.metadata),
-        }
-        return response
-    except Exception as ex_error:
-        print(traceback.format_exc())
-        return {
-            "status": False,
-            "message": "Error occurred while processing message: " + str(ex_error),
-        }
+@api.post("/messages")
+async def add_message(req: DBWebRequestModel, traceparent: Optional[str] = Header(None)):
+    if managers["jobs"] is None:
+        with span("POST /messages", parent=parse_traceparent(traceparent), kind=SPAN_KIND_SERVER):
+            # the chat blocks for the whole turn, agent messages are sent from the loop while it runs in a thread
+            return await run_in_threadpool(
+                process_chat_request,
+                req,
+                chat_manager=managers["chat"],
+                dbmanager=dbmanager,
+                files_static_root=folders["files_static_root"],
+            )
+
+    job_id = await run_in_threadpool(managers["jobs"].enqueue, CHAT_JOB, chat_job_payload(req))
+    if req.connection_id:
+        # the worker publishes the agent_response to the connection, job_event_relay delivers it
+        return {"status": True, "message": "Message queued", "data": {"job_id": job_id, "status": "queued"}}
+
+    # clients without a socket wait for the result, the worker keeps running a job the request stopped waiting for
+    deadline = time.monotonic() + float(os.environ.get("AUTOGENSTUDIO_JOB_WAIT_TIMEOUT", "600"))
+    while True:
+        job = await run_in_threadpool(managers["jobs"].get, job_id)
+        if job is None:
+            return {
+                "status": False,
+                "message": f"Error occurred while processing message: job {job_id} not found",
+            }
+        if job["status"] == "done":
+            return job["result"]
+        if job["status"] == "failed":
+            return {
+                "status": False,
+                "message": "Error occurred while processing message: " + str(job["error"]),
+            }
+        if time.monotonic() >= deadline:
+            return {
+                "status": False,
+                "message": f"Timed out waiting for job {job_id}, its messages are saved to the session when it is done",
+                "data": {"job_id": job_id, "status": job["status"]},
+            }
+        await asyncio.sleep(0.25)
+
+
+@api.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a queued chat job, with the chat response once it is done"""
+    if managers["jobs"] is None:
+        raise HTTPException(status_code=404, detail="Chat messages are not queued")
+    job = await run_in_threadpool(managers["jobs"].get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    data = {key: job[key] for key in ("id", "status", "attempts", "result", "error")}
+    return {"status": True, "message": "Job retrieved successfully", "data": data}
 
 
 @api.get("/messages")
@@ -139,7 +248,7 @@ async def get_messages(user_id: str = None, session_id: str = None):
             "message": "Messages retrieved successfully",
         }
     except Exception as ex_error:
-        print(ex_error)
+        logger.error("Error occurred while retrieving messages: %s", ex_error)
         return {
             "status": False,
             "message": "Error occurred while retrieving messages: " + str(ex_error),
@@ -147,22 +256,145 @@ async def get_messages(user_id: str = None, session_id: str = None):
 
 
 @api.get("/gallery")
-async def get_gallery_items(gallery_id: str = None):
+async def get_gallery_items(gallery_id: str = None, limit: int = None, offset: int = 0, tag: str = None):
     try:
-        gallery = dbutils.get_gallery(gallery_id=gallery_id, dbmanager=dbmanager)
+        gallery = dbutils.get_gallery(gallery_id=gallery_id, dbmanager=dbmanager, limit=limit, offset=offset, tag=tag)
         return {
             "status": True,
             "data": gallery,
             "message": "Gallery items retrieved successfully",
         }
     except Exception as ex_error:
-        print(ex_error)
+        logger.error("Error occurred while retrieving messages: %s", ex_error)
         return {
             "status": False,
             "message": "Error occurred while retrieving messages: " + str(ex_error),
         }
 
 
+@api.get("/sessions/export")
+def export_user_sessions(user_id: str, session_id: str = None, workflows: bool = True):
+    # the archive is written to a temporary file and streamed from disk, then removed
+    extension = ".tar.zst" if default_compression() == "zstd" else ".tar.gz"
+    archive_file = tempfile.NamedTemporaryFile(dir=folders["app_root"], suffix=extension, delete=False)
+    try:
+        with archive_file:
+            export_archive(
+                archive_file,
+                dbmanager=dbmanager,
+                files_static_root=folders["files_static_root"],
+                user_id=user_id,
+                session_ids=[session_id] if session_id else None,
+                include_workflows=workflows,
+            )
+    except Exception as ex_error:
+        os.remove(archive_file.name)
+        logger.exception("Error occurred while exporting sessions")
+        return {
+            "status": False,
+            "message": "Error occurred while exporting sessions: " + str(ex_error),
+        }
+
+    return FileResponse(
+        archive_file.name,
+        media_type="application/octet-stream",
+        filename=f"sessions-{int(time.time())}{extension}",
+        background=BackgroundTask(os.remove, archive_file.name),
+    )
+
+
+@api.post("/sessions/import")
+async def import_user_sessions(request: Request, user_id: str):
+    """Imports an archive sent as the raw request body, the upload is spooled to disk before importing"""
+    try:
+        with tempfile.TemporaryFile(dir=folders["app_root"]) as archive_file:
+            async for chunk in request.stream():
+                archive_file.write(chunk)
+            archive_file.seek(0)
+            stats = await run_in_threadpool(
+                import_archive,
+                archive_file,
+                dbmanager=dbmanager,
+                files_static_root=folders["files_static_root"],
+                user_id=user_id,
+            )
+        return {
+            "status": True,
+            "message": "Sessions imported successfully",
+            "data": stats,
+        }
+    except Exception as ex_error:
+        logger.exception("Error occurred while importing sessions")
+        return {
+            "status": False,
+            "message": "Error occurred while importing sessions: " + str(ex_error),
+        }
+
+
+@api.post("/batches")
+async def create_batch(request: Request, workflow_id: str, user_id: str, concurrency: int = 4):
+    """Runs a workflow over the JSONL tasks sent as the raw request body, see batch.read_tasks for the format"""
+    try:
+        with tempfile.TemporaryFile(dir=folders["app_root"]) as tasks_file:
+            async for chunk in request.stream():
+                tasks_file.write(chunk)
+            tasks_file.seek(0)
+            run = await run_in_threadpool(
+                managers["batches"].create, tasks_file, workflow_id, user_id, max(1, min(concurrency, 32))
+            )
+        return {
+            "status": True,
+            "message": "Batch started",
+            "data": run.progress(),
+        }
+    except Exception as ex_error:
+        logger.exception("Error occurred while starting batch")
+        return {
+            "status": False,
+            "message": "Error occurred while starting batch: " + str(ex_error),
+        }
+
+
+@api.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Progress of a running batch, or the summary of a finished one"""
+    try:
+        batch = await run_in_threadpool(managers["batches"].get, batch_id)
+    except ValueError as ex_error:
+        raise HTTPException(status_code=400, detail=str(ex_error))
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return {"status": True, "message": "Batch retrieved successfully", "data": batch}
+
+
+@api.post("/batches/{batch_id}/resume")
+async def resume_batch(batch_id: str):
+    """Runs the tasks of a cancelled or interrupted batch that have no successful result yet"""
+    try:
+        run = await run_in_threadpool(managers["batches"].start, batch_id)
+    except (ValueError, FileNotFoundError) as ex_error:
+        return {"status": False, "message": "Error occurred while resuming batch: " + str(ex_error)}
+    return {"status": True, "message": "Batch resumed", "data": run.progress()}
+
+
+@api.post("/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    if not managers["batches"].cancel(batch_id):
+        return {"status": False, "message": "Batch is not running in this worker"}
+    return {"status": True, "message": "Batch cancelled"}
+
+
+@api.get("/batches/{batch_id}/results")
+def download_batch_results(batch_id: str):
+    try:
+        results_path = managers["batches"].path(batch_id, RESULTS_NAME)
+    except ValueError as ex_error:
+        raise HTTPException(status_code=400, detail=str(ex_error))
+    if not os.path.exists(results_path):
+        raise HTTPException(status_code=404, detail="No results yet")
+    return FileResponse(results_path, media_type="application/x-ndjson", filename=f"batch-{batch_id}.jsonl")
+
+
 @api.get("/sessions")
 async def get_user_sessions(user_id: str = None):
     if user_id is None:
@@ -177,7 +409,7 @@ async def get_user_sessions(user_id: str = None):
             "message": "Sessions retrieved successfully",
         }
     except Exception as ex_error:
-        print(ex_error)
+        logger.error("Error occurred while retrieving sessions: %s", ex_error)
         return {
             "status": False,
             "message": "Error occurred while retrieving sessions: " + str(ex_error),
@@ -196,7 +428,7 @@ async def create_user_session(req: DBWebRequestModel):
             "data": user_sessions,
         }
     except Exception as ex_error:
-        print(traceback.format_exc())
+        logger.exception("Error occurred while creating session")
         return {
             "status": False,
             "message": "Error occurred while creating session: " + str(ex_error),
@@ -205,8 +437,7 @@ async def create_user_session(req: DBWebRequestModel):
 
 @api.post("/sessions/rename")
 async def rename_user_session(name: str, req: DBWebRequestModel):
-    print("Rename: " + name)
-    print("renaming session for user: " + req.user_id + " to: " + name)
+    logger.debug("Renaming session %s", req.session.id if req.session else None)
     try:
         session = dbutils.rename_session(name=name, session=req.session, dbmanager=dbmanager)
         return {
@@ -215,7 +446,7 @@ async def rename_user_session(name: str, req: DBWebRequestModel):
             "data": session,
         }
     except Exception as ex_error:
-        print(traceback.format_exc())
+        logger.exception("Error occurred while renaming session")
         return {
             "status": False,
             "message": "Error occurred while renaming session: " + str(ex_error),
@@ -232,7 +463,7 @@ async def publish_user_session_to_gallery(req: DBWebRequestModel):
             "data": gallery_item,
         }
     except Exception as ex_error:
-        print(traceback.format_exc())
+        logger.exception("Error occurred while publishing session")
         return {
             "status": False,
             "message": "Error occurred  while publishing session: " + str(ex_error),
@@ -243,13 +474,14 @@ async def publish_user_session_to_gallery(req: DBWebRequestModel):
 async def delete_user_session(req: DBWebRequestModel):
     try:
         sessions = dbutils.delete_session(session=req.session, dbmanager=dbmanager)
+        get_retention_manager().delete_session(user_id=req.session.user_id, session_id=req.session.id)
         return {
             "status": True,
             "message": "Session deleted successfully",
             "data": sessions,
         }
     except Exception as ex_error:
-        print(traceback.format_exc())
+        logger.exception("Error occurred while deleting session")
         return {
             "status": False,
             "message": "Error occurred while deleting session: " + str(ex_error),
@@ -268,7 +500,7 @@ async def remove_message(req: DeleteMessageWebRequestModel):
             "data": messages,
         }
     except Exception as ex_error:
-        print(ex_error)
+        logger.error("Error occurred while deleting message: %s", ex_error)
         return {
             "status": False,
             "message": "Error occurred while deleting message: " + str(ex_error),
@@ -286,7 +518,7 @@ async def get_user_skills(user_id: str):
             "data": skills,
         }
     except Exception as ex_error:
-        print(ex_error)
+        logger.error("Error occurred while retrieving skills: %s", ex_error)
         return {
             "status": False,
             "message": "Error occurred while retrieving skills: " + str(ex_error),
@@ -304,7 +536,7 @@ async def create_user_skills(req: DBWebRequestModel):
         }
 
     except Exception as ex_error:
-        print(ex_error)
+        logger.error("Error occurred while creating skills: %s", ex_error)
         return {
             "status": False,
             "message": "Error occurred while creating skills: " + str(ex_error),
@@ -323,7 +555,7 @@ async def delete_user_skills(req: DBWebRequestModel):
         }
 
     except Exception as ex_error:
-        print(ex_error)
+        logger.error("Error occurred while deleting skill: %s", ex_error)
         return {
             "status": False,
             "message": "Error occurred while deleting skill: " + str(ex_error),
@@ -341,7 +573,7 @@ async def get_user_agents(user_id: str):
             "data": agents,
         }
     except Exception as ex_error:
-        print(ex_error)
+        logger.error("Error occurred while retrieving agents: %s", ex_error)
         return {
             "status": False,
             "message": "Error occurred while retrieving agents: " + str(ex_error),
@@ -360,7 +592,7 @@ async def create_user_agents(req: DBWebRequestModel):
         }
 
     except Exception as ex_error:
-        print(traceback.format_exc())
+        logger.exception("Error occurred while creating agent")
         return {
             "status": False,
             "message": "Error occurred while creating agent: " + str(ex_error),
@@ -379,7 +611,7 @@ async def delete_user_agent(req: DBWebRequestModel):
         }
 
     except Exception as ex_error:
-        print(traceback.format_exc())
+        logger.exception("Error occurred while deleting agent")
         return {
             "status": False,
             "message": "Error occurred while deleting agent: " + str(ex_error),
@@ -397,7 +629,7 @@ async def get_user_models(user_id: str):
             "data": models,
         }
     except Exception as ex_error:
-        print(ex_error)
+        logger.error("Error occurred while retrieving models: %s", ex_error)
         return {
             "status": False,
             "message": "Error occurred while retrieving models: " + str(ex_error),
@@ -416,7 +648,7 @@ async def create_user_models(req: DBWebRequestModel):
         }
 
     except Exception as ex_error:
-        print(traceback.format_exc())
+        logger.exception("Error occurred while creating model")
         return {
             "status": False,
             "message": "Error occurred while creating model: " + str(ex_error),
@@ -433,14 +665,8 @@ async def test_user_models(req: DBWebRequestModel):
             "data": response,
         }
 
-    except OpenAIError as oai_error:
-        print(traceback.format_exc())
-        return {
-            "status": False,
-            "message": "Error occurred while testing model: " + str(oai_error),
-        }
     except Exception as ex_error:
-        print(traceback.format_exc())
+        logger.exception("Error occurred while testing model")
         return {
             "status": False,
             "message": "Error occurred while testing model: " + str(ex_error),
@@ -459,7 +685,7 @@ async def delete_user_model(req: DBWebRequestModel):
         }
 
     except Exception as ex_error:
-        print(traceback.format_exc())
+        logger.exception("Error occurred while deleting model")
         return {
             "status": False,
             "message": "Error occurred while deleting model: " + str(ex_error),
@@ -477,7 +703,7 @@ async def get_user_workflows(user_id: str):
             "data": workflows,
         }
     except Exception as ex_error:
-        print(ex_error)
+        logger.error("Error occurred while retrieving workflows: %s", ex_error)
         return {
             "status": False,
             "message": "Error occurred while retrieving workflows: " + str(ex_error),
@@ -495,7 +721,7 @@ async def create_user_workflow(req: DBWebRequestModel):
         }
 
     except Exception as ex_error:
-        print(ex_error)
+        logger.error("Error occurred while creating workflow: %s", ex_error)
         return {
             "status": False,
             "message": "Error occurred while creating workflow: " + str(ex_error),
@@ -513,13 +739,18 @@ async def delete_user_workflow(req: DBWebRequestModel):
         }
 
     except Exception as ex_error:
-        print(ex_error)
+        logger.error("Error occurred while deleting workflow: %s", ex_error)
         return {
             "status": False,
             "message": "Error occurred while deleting workflow: " + str(ex_error),
         }
 
 
+@api.get("/files/{file_path:path}")
+def get_file(file_path: str, request: Request, preview: bool = False):
+    return artifact_server.serve(request, root=folders["files_static_root"], file_path=file_path, preview=preview)
+
+
 @api.get("/version")
 async def get_version():
     return {
@@ -529,11 +760,73 @@ async def get_version():
     }
 
 
+def require_admin(authorization: Optional[str] = Header(None)) -> None:
+    """Admin endpoints are only enabled with AUTOGENSTUDIO_ADMIN_TOKEN and need it as a bearer token"""
+    token = os.environ.get("AUTOGENSTUDIO_ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = (authorization or "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode("utf-8"), token.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+# profiling of this worker process, with several workers each request reaches one of them (see the pid in responses)
+admin = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+@admin.post("/profiler/start")
+async def start_sampling_profiler(interval: float = 0.01, run_id: str = None, duration: float = 60):
+    """Samples all threads, or only those working on run_id (a session or message id), for at most duration s"""
+    try:
+        profiler = start_profiler(interval=max(interval, 0.001), run_id=run_id, duration=min(duration, 3600))
+    except RuntimeError as ex_error:
+        raise HTTPException(status_code=409, detail=str(ex_error))
+    return {"status": True, "message": "Profiler started", "data": {"pid": os.getpid(), **profiler.summary()}}
+
+
+@admin.post("/profiler/stop")
+async def stop_sampling_profiler():
+    profiler = await run_in_threadpool(stop_profiler)
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="No profile has been recorded")
+    return {"status": True, "message": "Profiler stopped", "data": {"pid": os.getpid(), **profiler.summary()}}
+
+
+@admin.get("/profiler/profile")
+async def download_profile(format: str = "speedscope"):
+    """The last profile as speedscope JSON or as folded stacks for flamegraph tools"""
+    profiler = get_profiler()
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="No profile has been recorded")
+    name = f"profile-{os.getpid()}-{int(profiler.started_at)}"
+    if format == "speedscope":
+        body, media_type, filename = json.dumps(profiler.speedscope()), "application/json", f"{name}.speedscope.json"
+    elif format == "collapsed":
+        body, media_type, filename = profiler.collapsed(), "text/plain", f"{name}.folded"
+    else:
+        raise HTTPException(status_code=400, detail="format must be speedscope or collapsed")
+    return Response(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@admin.get("/stacks")
+async def get_stacks():
+    """Stacks of all threads and the pending asyncio tasks of the app loop"""
+    return {"status": True, "message": "Snapshot taken", "data": snapshot(asyncio.get_running_loop())}
+
+
+api.include_router(admin)
+
+
 async def process_socket_message(data: dict, websocket: WebSocket, client_id: str):
-    print(f"Client says: {data['type']}")
+    logger.debug("Socket message from %s: %s", client_id, data["type"])
     if data["type"] == "user_message":
         user_request_body = DBWebRequestModel(**data["data"])
-        response = await add_message(user_request_body)
+        response = await add_message(user_request_body, traceparent=data.get("traceparent"))
+        if managers["jobs"] is not None and user_request_body.connection_id:
+            # queued, the agent_response arrives from the worker through the job event relay
+            status_message = {"type": "agent_status", "data": response, "connection_id": client_id}
+            await websocket_manager.send_message(status_message, websocket)
+            return
         response_socket_message = {
             "type": "agent_response",
             "data": response,
@@ -543,12 +836,12 @@ async def process_socket_message(data: dict, websocket: WebSocket, client_id: st
 
 
 @api.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await websocket_manager.connect(websocket, client_id)
+async def websocket_endpoint(websocket: WebSocket, client_id: str, batch: bool = False):
+    await websocket_manager.connect(websocket, client_id, batch=batch)
     try:
         while True:
             data = await websocket.receive_json()
             await process_socket_message(data, websocket, client_id)
     except WebSocketDisconnect:
-        print(f"Client #{client_id} is disconnected")
+        logger.debug("Client %s disconnected", client_id)
         await websocket_manager.disconnect(websocket)
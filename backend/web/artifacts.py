@@ -0,0 +1,208 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from metrics import record_cache
+from utils import get_file_type
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {"code", "csv"}
+COMPRESSIBLE_EXTENSIONS = {".txt", ".log", ".svg"}
+MIN_COMPRESS_SIZE = 1024
+THUMBNAIL_SIZE = (256, 256)
+CSV_PREVIEW_LINES = 20
+CHUNK_SIZE = 256 * 1024
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ArtifactServer:
+    """
+    Serves generated artifacts from disk. Files are streamed in chunks and never fully buffered. Responses carry
+    strong ETags derived from the content hash, support single byte ranges (for video seeking), use precompressed
+    gzip/brotli variants for text types and can return image thumbnails or CSV heads as previews. Compressed
+    variants and thumbnails are cached under cache_dir by content hash.
+    """
+
+    def __init__(self, roots: List[str], cache_dir: str, max_etags: int = 10000) -> None:
+        self.roots = [os.path.realpath(root) for root in roots]
+        self.cache_dir = cache_dir
+        self.max_etags = max_etags
+        self._etags: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def resolve(self, root: str, file_path: str) -> str:
+        path = os.path.realpath(os.path.join(root, file_path))
+        matched_root = next((r for r in self.roots if path == r or path.startswith(r + os.sep)), None)
+        # dot directories of a root are internal (.blobs, .trash, import staging)
+        if matched_root is None or os.path.relpath(path, matched_root).startswith("."):
+            raise HTTPException(status_code=404, detail="File not found")
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail="File not found")
+        return path
+
+    def etag(self, path: str, stat: os.stat_result) -> str:
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            record_cache("artifact_etag", key in self._etags)
+            if key in self._etags:
+                self._etags.move_to_end(key)
+                return self._etags[key]
+
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        etag = sha256.hexdigest()
+
+        with self._lock:
+            self._etags[key] = etag
+            if len(self._etags) > self.max_etags:
+                self._etags.popitem(last=False)
+        return etag
+
+    def serve(self, request: Request, root: str, file_path: str, preview: bool = False) -> Response:
+        path = self.resolve(root, file_path)
+        stat = os.stat(path)
+        etag = self.etag(path, stat)
+        headers = {"ETag": f'"{etag}"', "Accept-Ranges": "bytes", "Cache-Control": "no-cache"}
+
+        if_none_match = request.headers.get("if-none-match")
+        # variants (compressed, preview) use "<hash>-<variant>" tags, all are current while the hash matches
+        if if_none_match and etag in [tag.strip().strip('"').split("-")[0] for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if preview:
+            preview_response = self._preview(path, etag, media_type, headers)
+            if preview_response is not None:
+                return preview_response
+
+        range_header = request.headers.get("range")
+        if range_header:
+            return self._range_response(path, stat.st_size, range_header, media_type, headers)
+
+        encoded = self._compressed_variant(path, etag, stat.st_size, request.headers.get("accept-encoding", ""))
+        if encoded is not None:
+            encoded_path, encoding = encoded
+            headers.update({"ETag": f'"{etag}-{encoding}"', "Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+            return FileResponse(encoded_path, media_type=media_type, headers=headers)
+
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
+
+    def _range_response(
+        self, path: str, size: int, range_header: str, media_type: str, headers: dict
+    ) -> Response:
+        match = RANGE_PATTERN.match(range_header.strip())
+        if match is None:
+            # multiple ranges are not supported, fall back to the whole file
+            return FileResponse(path, media_type=media_type, headers=headers)
+
+        start, end = match.groups()
+        if start == "":
+            length = int(end or 0)
+            start, end = max(0, size - length), size - 1
+        else:
+            start, end = int(start), min(int(end) if end else size - 1, size - 1)
+
+        if start > end or start >= size:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+        def read_range() -> Iterator[bytes]:
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+
+        headers = {**headers, "Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)}
+        return StreamingResponse(read_range(), status_code=206, media_type=media_type, headers=headers)
+
+    def _compressible(self, path: str, size: int) -> bool:
+        extension = os.path.splitext(path)[1].lower()
+        return size >= MIN_COMPRESS_SIZE and (
+            get_file_type(path) in COMPRESSIBLE_TYPES or extension in COMPRESSIBLE_EXTENSIONS
+        )
+
+    def _compressed_variant(
+        self, path: str, etag: str, size: int, accept_encoding: str
+    ) -> Optional[Tuple[str, str]]:
+        if not self._compressible(path, size):
+            return None
+
+        accepted = {encoding.split(";")[0].strip() for encoding in accept_encoding.split(",")}
+        if brotli is not None and "br" in accepted:
+            return self._cached(f"{etag}.br", path, self._brotli), "br"
+        if "gzip" in accepted:
+            return self._cached(f"{etag}.gz", path, self._gzip), "gzip"
+        return None
+
+    @staticmethod
+    def _gzip(src, dst) -> None:
+        with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=6, mtime=0) as gz:
+            shutil.copyfileobj(src, gz, CHUNK_SIZE)
+
+    @staticmethod
+    def _brotli(src, dst) -> None:
+        compressor = brotli.Compressor()
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+            dst.write(compressor.process(chunk))
+        dst.write(compressor.finish())
+
+    def _cached(self, name: str, path: str, build) -> str:
+        cached_path = os.path.join(self.cache_dir, name)
+        exists = os.path.exists(cached_path)
+        record_cache("artifact_variant", exists)
+        if exists:
+            # the retention sweep evicts the least recently used variants
+            os.utime(cached_path)
+        else:
+            tmp_path = f"{cached_path}.{threading.get_ident()}.tmp"
+            with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+                build(src, dst)
+            os.replace(tmp_path, cached_path)
+        return cached_path
+
+    def _preview(self, path: str, etag: str, media_type: str, headers: dict) -> Optional[Response]:
+        file_type = get_file_type(path)
+        if file_type == "csv" and path.lower().endswith(".csv"):
+            lines = []
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                for _, line in zip(range(CSV_PREVIEW_LINES), f):
+                    lines.append(line)
+            return Response("".join(lines), media_type="text/csv", headers={**headers, "ETag": f'"{etag}-preview"'})
+
+        if file_type == "image" and not path.lower().endswith(".svg"):
+            try:
+                # Pillow is optional and slow to import, load it on the first thumbnail
+                from PIL import Image
+            except ImportError:
+                return None
+
+            def thumbnail(src, dst) -> None:
+                with Image.open(src) as image:
+                    image.thumbnail(THUMBNAIL_SIZE)
+                    image.save(dst, format="PNG")
+
+            thumbnail_path = self._cached(f"{etag}.thumb.png", path, thumbnail)
+            preview_headers = {**headers, "ETag": f'"{etag}-preview"'}
+            return FileResponse(thumbnail_path, media_type="image/png", headers=preview_headers)
+
+        return None
@@ -0,0 +1,130 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from dataclasses import asdict
+from typing import Any, Dict, Optional
+
+from chatmanager import AutoGenChatManager, process_chat_request
+from datamodel import DBWebRequestModel
+from jobqueue import JobEventPublisher, JobQueue
+from logconfig import configure_logging
+from retention import start_retention_manager
+from metrics import JOB_QUEUE_DEPTH, start_metrics_server
+from tracing import configure_tracing
+from utils import BLOBS_DIR, BlobStore, DBManager, init_app_folders
+
+logger = logging.getLogger(__name__)
+
+CHAT_JOB = "chat"
+
+
+def get_job_queue(app_root: str) -> JobQueue:
+    visibility_timeout = float(os.environ.get("AUTOGENSTUDIO_JOB_VISIBILITY_TIMEOUT", "300"))
+    max_attempts = int(os.environ.get("AUTOGENSTUDIO_JOB_MAX_ATTEMPTS", "3"))
+    return JobQueue(
+        path=os.path.join(app_root, "jobs.sqlite"), visibility_timeout=visibility_timeout, max_attempts=max_attempts
+    )
+
+
+def chat_job_payload(req: DBWebRequestModel) -> Dict[str, Any]:
+    return asdict(req)
+
+
+class Worker:
+    """Claims chat jobs from the queue and runs their workflows outside of the web process"""
+
+    def __init__(self, job_queue: JobQueue, dbmanager: DBManager, files_static_root: str, poll_interval: float = 1):
+        self.job_queue = job_queue
+        self.dbmanager = dbmanager
+        self.files_static_root = files_static_root
+        self.poll_interval = poll_interval
+        self.blob_store = BlobStore(os.path.join(files_static_root, BLOBS_DIR))
+        self.stopped = threading.Event()
+
+    def run_forever(self, worker_id: str) -> None:
+        while not self.stopped.is_set():
+            job = self.job_queue.claim(worker_id, kinds=[CHAT_JOB])
+            if job is None:
+                self.stopped.wait(self.poll_interval)
+                continue
+            self.run_job(job, worker_id)
+
+    def run_job(self, job: Dict[str, Any], worker_id: str) -> None:
+        logger.info("Worker %s running job %s (attempt %s)", worker_id, job["id"], job["attempts"])
+        finished = threading.Event()
+
+        def heartbeat() -> None:
+            while not finished.wait(self.job_queue.visibility_timeout / 3):
+                self.job_queue.heartbeat(job["id"], worker_id)
+
+        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeat_thread.start()
+        try:
+            chat_manager = AutoGenChatManager(
+                message_queue=JobEventPublisher(self.job_queue, job["id"]), blob_store=self.blob_store
+            )
+            response = process_chat_request(
+                DBWebRequestModel(**job["payload"]),
+                chat_manager=chat_manager,
+                dbmanager=self.dbmanager,
+                files_static_root=self.files_static_root,
+                raise_errors=True,
+            )
+            self.job_queue.complete(job["id"], worker_id, response)
+        except Exception as ex_error:
+            error = str(ex_error) or traceback.format_exc()
+            if self.job_queue.fail(job["id"], worker_id, error):
+                return
+            response = {"status": False, "message": "Error occurred while processing message: " + error}
+        finally:
+            finished.set()
+
+        # the web app does not wait for the job, the response goes to the socket like the agent messages did
+        connection_id = job["payload"].get("connection_id")
+        if connection_id:
+            self.job_queue.publish_event(
+                {"type": "agent_response", "data": response, "connection_id": connection_id}, job_id=job["id"]
+            )
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+def run_worker(concurrency: int = 1, poll_interval: float = 1, metrics_port: Optional[int] = None) -> None:
+    configure_logging()
+    app_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web")
+    folders = init_app_folders(app_file_path)
+    dbmanager = DBManager(path=os.path.join(folders["app_root"], "database.sqlite"))
+    configure_tracing(folders["app_root"])
+    # the web app runs the retention sweeps, workers only offload their deletions
+    start_retention_manager(folders["files_static_root"], sweep=False)
+    worker = Worker(
+        job_queue=get_job_queue(folders["app_root"]),
+        dbmanager=dbmanager,
+        files_static_root=folders["files_static_root"],
+        poll_interval=poll_interval,
+    )
+
+    if metrics_port:
+        JOB_QUEUE_DEPTH.set_function(worker.job_queue.depth)
+        start_metrics_server(metrics_port)
+        logger.info("Serving worker metrics on port %s", metrics_port)
+
+    worker_prefix = f"{socket.gethostname()}-{os.getpid()}"
+    threads = [
+        threading.Thread(target=worker.run_forever, args=(f"{worker_prefix}-{i}",), daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    logger.info("Worker %s started with %d thread(s)", worker_prefix, concurrency)
+
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        worker.stop()
+    logger.info("Worker %s stopped", worker_prefix)
@@ -1,12 +1,27 @@
+import copy
+import functools
+import inspect
+import logging
+import os
 from datetime import datetime
 from typing import Dict, List, Optional, Union
 
 import autogen
 
 from datamodel import AgentConfig, AgentFlowSpec, AgentWorkFlowConfig, Message, SocketMessage
-from utils import clear_folder, get_skills_from_prompt, sanitize_model
+from history import AgentHistory
+from retention import clear_folder_async
+from sandbox import build_pooled_execution_config
+from termination import build_termination_policy
+from tracing import span
+from utils import get_skills_from_prompt, sanitize_model
 from yandexgpt.autogen_client import YandexGPTAutogenClient
 
+logger = logging.getLogger(__name__)
+
+# values of AUTOGENSTUDIO_CODE_EXECUTOR and of "executor" in an agent's code_execution_config
+CODE_EXECUTORS = ("local", "pooled")
+
 
 class AutoGenWorkFlowManager:
     """
@@ -26,14 +41,19 @@ class AutoGenWorkFlowManager:
         self.connection_id = connection_id
         self.work_dir = work_dir or "work_dir"
         if clear_work_dir:
-            clear_folder(self.work_dir)
+            clear_folder_async(self.work_dir)
         self.config = config
-        self.sender = self.load(config.sender)
-        self.receiver = self.load(config.receiver)
-        self.agent_history = []
+        self.agent_history = AgentHistory(work_dir=self.work_dir, connection_id=connection_id)
+        self.termination_policy = build_termination_policy(
+            config.termination_config, history=lambda: self.agent_history
+        )
+        with span("workflow.build_agents", {"workflow.name": config.name, "workflow.type": config.type}):
+            self.sender = self.load(config.sender)
+            self.receiver = self.load(config.receiver)
 
         if history:
-            self.populate_history(history)
+            with span("workflow.replay_history", {"workflow.history_messages": len(history)}):
+                self.populate_history(history)
 
     def process_message(
         self,
@@ -87,9 +107,12 @@ class AutoGenWorkFlowManager:
                 )
 
     def sanitize_agent_spec(self, agent_spec: AgentFlowSpec) -> AgentFlowSpec:
-        agent_spec.config.is_termination_msg = agent_spec.config.is_termination_msg or (
-            lambda x: "TERMINATE" in x.get("content", "").rstrip()[-20:]
-        )
+        """
+        Returns a copy of agent_spec set up for this run, the workflow config itself is left untouched so it can be
+        reused by other runs (termination policy, work dir and skills prompt are per run)
+        """
+        agent_spec = copy.deepcopy(agent_spec)
+        agent_spec.config.is_termination_msg = agent_spec.config.is_termination_msg or self.termination_policy
 
         def get_default_system_message(agent_type: str) -> str:
             if agent_type == "assistant":
@@ -106,8 +129,16 @@ class AutoGenWorkFlowManager:
         
         if agent_spec.config.code_execution_config is not False:
             code_execution_config = agent_spec.config.code_execution_config or {}
-            code_execution_config["work_dir"] = self.work_dir
-            code_execution_config["use_docker"] = False
+            executor = code_execution_config.get("executor") or os.environ.get("AUTOGENSTUDIO_CODE_EXECUTOR") or "local"
+            if executor not in CODE_EXECUTORS:
+                raise ValueError(f"Unknown code executor {executor!r}, expected one of {', '.join(CODE_EXECUTORS)}")
+            if executor == "pooled":
+                code_execution_config = build_pooled_execution_config(code_execution_config, self.work_dir)
+            else:
+                # autogen reads a string "executor" as the name of one of its own executors
+                code_execution_config.pop("executor", None)
+                code_execution_config["work_dir"] = self.work_dir
+                code_execution_config["use_docker"] = False
             agent_spec.config.code_execution_config = code_execution_config
 
             if agent_spec.skills:
@@ -126,7 +157,7 @@ class AutoGenWorkFlowManager:
         agent_spec = self.sanitize_agent_spec(agent_spec)
         if agent_spec.type == "groupchat":
             agents = [
-                self.load(self.sanitize_agent_spec(agent_config)) for agent_config in agent_spec.groupchat_config.agents
+                self.load(agent_config) for agent_config in agent_spec.groupchat_config.agents
             ]
             group_chat_config = agent_spec.groupchat_config.dict()
             group_chat_config["agents"] = agents
@@ -151,19 +182,47 @@ class AutoGenWorkFlowManager:
         return agent
 
     def run(self, message: str, clear_history: bool = False) -> None:
-        self.sender.initiate_chat(
-            self.receiver,
-            message=message,
-            clear_history=clear_history,
-        )
+        with span("workflow.run"):
+            self.sender.initiate_chat(
+                self.receiver,
+                message=message,
+                clear_history=clear_history,
+            )
+
+
+# autogen reply functions worth a span of their own, the others only check a condition
+TRACED_REPLY_FUNCTIONS = {
+    "generate_oai_reply": "agent.llm_reply",
+    "generate_code_execution_reply": "agent.code_execution",
+    "_generate_code_execution_reply_using_executor": "agent.code_execution",
+    "generate_function_call_reply": "agent.function_call",
+    "generate_tool_calls_reply": "agent.tool_calls",
+    "run_chat": "groupchat.run",
+}
+
+
+def trace_reply_functions(agent: autogen.ConversableAgent) -> None:
+    """Wraps the registered synchronous reply functions of an agent listed in TRACED_REPLY_FUNCTIONS in spans"""
+    for reply_func_tuple in agent._reply_func_list:
+        reply_func = reply_func_tuple["reply_func"]
+        span_name = TRACED_REPLY_FUNCTIONS.get(getattr(reply_func, "__name__", ""))
+        if span_name is None or inspect.iscoroutinefunction(reply_func):
+            continue
+
+        def traced_reply(*args, reply_func=reply_func, span_name=span_name, **kwargs):
+            with span(span_name, {"agent.name": agent.name}):
+                return reply_func(*args, **kwargs)
+
+        reply_func_tuple["reply_func"] = functools.wraps(reply_func)(traced_reply)
 
 
 class ExtendedConversableAgent(autogen.ConversableAgent):
     def __init__(self, message_processor=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.message_processor = message_processor
-        print(self.system_message)
+        logger.debug("Agent %s system message: %s", self.name, self.system_message)
         self.register_model_client(YandexGPTAutogenClient)
+        trace_reply_functions(self)
 
     def receive(
         self,
@@ -182,6 +241,7 @@ class ExtendedGroupChatManager(autogen.GroupChatManager):
         super().__init__(*args, **kwargs)
         self.message_processor = message_processor
         self.register_model_client(YandexGPTAutogenClient)
+        trace_reply_functions(self)
 
     def receive(
         self,
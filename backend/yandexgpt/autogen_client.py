@@ -1,7 +1,7 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
-from yandexgpt.dto import CompletionOptions, CompletionRequest, YandexGPTModelUri, Message as MessageYandexGPT
-from yandexgpt.http_client import YandexGPTApiClient
+from yandexgpt.dto import CompletionOptions, Message as MessageYandexGPT
+from yandexgpt.pool import complete
 
 
 @dataclass
@@ -18,27 +18,29 @@ class Choice:
 class ModelClientResponse:
     choices: list[Choice]
     model: str
+    usage: dict = field(default_factory=dict)
+    cost: float = 0
 
 
 class YandexGPTAutogenClient:
     def __init__(self, config: dict):
-        self.api_client = YandexGPTApiClient(token=config.get("api_key", ""))
+        # api_key/folder_id or a list of credentials, see yandexgpt.pool.parse_credentials
+        self.config = config
         self.model_name = config["model"]
 
     def create(self, params: dict) -> ModelClientResponse:
         if params.get("stream", False):
             raise NotImplemented
         
-        request = CompletionRequest(
-            modelUri=YandexGPTModelUri.YANDEX_GPT,
-            completionOptions=CompletionOptions(
+        api_response = complete(
+            self.config,
+            messages=[MessageYandexGPT.from_autogen_json(autogen_json) for autogen_json in params["messages"]],
+            options=CompletionOptions(
                 stream=False,
                 temperature=0.9,
                 maxTokens=1000,
             ),
-            messages=[MessageYandexGPT.from_autogen_json(autogen_json) for autogen_json in params["messages"]],
         )
-        api_response = self.api_client.completion(request=request)
 
         return ModelClientResponse(
             choices=[
@@ -49,6 +51,11 @@ class YandexGPTAutogenClient:
                 )
             ],
             model=self.model_name,
+            usage={
+                "prompt_tokens": int(api_response.usage.inputTextTokens),
+                "completion_tokens": int(api_response.usage.completionTokens),
+                "total_tokens": int(api_response.usage.totalTokens),
+            },
         )
 
 
@@ -61,4 +68,11 @@ class YandexGPTAutogenClient:
 
     @staticmethod
     def get_usage(response):
-        return {}
+        # the keys autogen sums up in its usage summaries
+        return {
+            "prompt_tokens": response.usage.get("prompt_tokens", 0),
+            "completion_tokens": response.usage.get("completion_tokens", 0),
+            "total_tokens": response.usage.get("total_tokens", 0),
+            "cost": response.cost,
+            "model": response.model,
+        }
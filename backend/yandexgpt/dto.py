@@ -1,10 +1,33 @@
+import os
 from enum import StrEnum
 from pydantic import BaseModel
 
 
+# folder of models configured without a folder_id
+DEFAULT_FOLDER_ID = os.environ.get("YANDEXGPT_FOLDER_ID", "b1gbmv781ng5j6vl23br")
+YANDEXGPT_MODELS = ("yandexgpt", "yandexgpt-lite", "yandexgpt-32k", "summarization")
+
+
 class YandexGPTModelUri(StrEnum):
-    YANDEX_GPT = "gpt://b1gbmv781ng5j6vl23br/yandexgpt/latest"
-    YANDEX_GPT_LITE = "gpt://b1gbmv781ng5j6vl23br/yandexgpt-lite/latest"
+    YANDEX_GPT = f"gpt://{DEFAULT_FOLDER_ID}/yandexgpt/latest"
+    YANDEX_GPT_LITE = f"gpt://{DEFAULT_FOLDER_ID}/yandexgpt-lite/latest"
+
+
+def model_uri(model: str | None, folder_id: str | None = None) -> str:
+    """
+    gpt:// URI of a model name in a folder: "yandexgpt-lite" -> gpt://<folder>/yandexgpt-lite/latest, a name with a
+    version ("yandexgpt/rc") keeps it, a full URI is used as is. Other names (e.g. "gpt-4" of the default agent
+    config) fall back to yandexgpt.
+    """
+    model = model or "yandexgpt"
+    if model.startswith("gpt://"):
+        return model
+    folder_id = folder_id or DEFAULT_FOLDER_ID
+    if "/" in model:
+        return f"gpt://{folder_id}/{model}"
+    if model not in YANDEXGPT_MODELS:
+        model = "yandexgpt"
+    return f"gpt://{folder_id}/{model}/latest"
 
 
 class Message(BaseModel):
@@ -23,7 +46,7 @@ class CompletionOptions(BaseModel):
 
 
 class CompletionRequest(BaseModel):
-    modelUri: YandexGPTModelUri = YandexGPTModelUri.YANDEX_GPT
+    modelUri: str = YandexGPTModelUri.YANDEX_GPT
     completionOptions: CompletionOptions = CompletionOptions()
     messages: list[Message]
 
@@ -1,32 +1,306 @@
+import logging
+import os
 import requests
+import time
 from time import sleep
 
+from metrics import record_cache
+from tracing import SPAN_KIND_CLIENT, Span, span
 from yandexgpt.dto import CompletionRequest, CompletionResponse
+from yandexgpt.ratelimit import (
+    Permit,
+    RateLimiter,
+    RateLimitTimeout,
+    current_priority,
+    estimate_tokens,
+    get_rate_limiter,
+)
+from yandexgpt.resilience import RETRYABLE_STATUS, RetryPolicy, get_circuit_breaker
+from yandexgpt.singleflight import SingleFlight, request_key
+
+
+DEFAULT_BASE_URL = "https://llm.api.cloud.yandex.net"
+# (connect, read) seconds for a single http request
+DEFAULT_TIMEOUT = (3.05, 30.0)
+# seconds until an operation that is not done is given up
+DEFAULT_OPERATION_TIMEOUT = 300.0
+# gRPC codes of failed operations that are worth another attempt: DEADLINE_EXCEEDED, INTERNAL, UNAVAILABLE
+TRANSIENT_OPERATION_CODES = frozenset({4, 13, 14})
+
+logger = logging.getLogger(__name__)
+
+# identical completions in flight in this process, shared by all clients
+_in_flight = SingleFlight()
+
+
+class YandexGPTApiError(Exception):
+    def __init__(self, message: str, status_code: int | None = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def transient(self) -> bool:
+        """Network errors and unavailable or overloaded API, the failures that count against the circuit breaker"""
+        return self.status_code is None or self.status_code in RETRYABLE_STATUS
+
+
+class YandexGPTQuotaError(YandexGPTApiError):
+    pass
+
+
+class YandexGPTOperationError(YandexGPTApiError):
+    """The operation finished with an error, status_code is its gRPC code"""
+
+    @property
+    def transient(self) -> bool:
+        return self.status_code in TRANSIENT_OPERATION_CODES
+
+
+class YandexGPTTimeoutError(YandexGPTApiError):
+    @property
+    def transient(self) -> bool:
+        return True
+
+
+class CircuitOpenError(YandexGPTApiError):
+    @property
+    def transient(self) -> bool:
+        return False
+
+
+def _env_float(name: str) -> float | None:
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+def _env_timeout() -> tuple[float, float]:
+    """YANDEXGPT_TIMEOUT is "connect,read" or a single value for both"""
+    value = os.environ.get("YANDEXGPT_TIMEOUT")
+    if not value:
+        return DEFAULT_TIMEOUT
+    parts = [float(part) for part in value.split(",")]
+    return (parts[0], parts[-1])
+
+
+def _json(response: requests.Response) -> dict:
+    # error pages of proxies and gateways are not JSON
+    try:
+        return response.json()
+    except ValueError:
+        return {}
+
+
+def _retry_after(response: requests.Response) -> float | None:
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
 
 
 class YandexGPTApiClient:
     _session: requests.Session | None = None
 
-    def __init__(self, token: str) -> None:
+    def __init__(
+        self,
+        token: str,
+        base_url: str | None = None,
+        poll_interval: float | None = None,
+        timeout: tuple[float, float] | None = None,
+        retries: int | None = None,
+        quota_retries: int | None = None,
+        operation_timeout: float | None = None,
+        hedge_after: float | None = None,
+        coalesce: bool | None = None,
+    ) -> None:
+        self._token = token
         self._headers = {"Authorization": f"Api-Key {token}"}
+        # base_url points the client at a proxy or the benchmark mock server
+        self._base_url = (base_url or os.environ.get("YANDEXGPT_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self._poll_interval = (
+            poll_interval if poll_interval is not None else float(os.environ.get("YANDEXGPT_POLL_INTERVAL", "1"))
+        )
+        self._timeout = timeout or _env_timeout()
+        self._retry = RetryPolicy(
+            attempts=retries if retries is not None else int(os.environ.get("YANDEXGPT_RETRIES", "3"))
+        )
+        # a client whose caller can switch to another API key gives up on a 429 sooner than on other errors
+        self._quota_retries = quota_retries if quota_retries is not None else self._retry.attempts
+        self._operation_timeout = (
+            operation_timeout or _env_float("YANDEXGPT_OPERATION_TIMEOUT") or DEFAULT_OPERATION_TIMEOUT
+        )
+        # a duplicate operation is submitted when the first is not done after hedge_after seconds, off by default
+        self._hedge_after = hedge_after if hedge_after is not None else _env_float("YANDEXGPT_HEDGE_AFTER")
+        self._breaker = get_circuit_breaker(self._base_url)
+        self._coalesce = coalesce if coalesce is not None else os.environ.get("YANDEXGPT_COALESCE", "1") != "0"
+        self._session = requests.Session()
+        self._session.headers.update(self._headers)
 
-    def completion(self, request: CompletionRequest) -> CompletionResponse:
-        request_id = self._id_of_completion(request=request)
-        while True:
-            response = self._result_of_completions(request_id)
-            if response.get("done"):
-                return CompletionResponse(**response["response"])
-            
-            sleep(1)
-        
-        return CompletionResponse(**response.json()["result"])
-
-    def _id_of_completion(self, request: CompletionRequest) -> str:
-        response = requests.post("https://llm.api.cloud.yandex.net/foundationModels/v1/completionAsync", json=request.model_dump(), headers=self._headers)
-        print(request.model_dump_json(), self._headers, response.json())
-        return response.json()["id"]
-    
-    def _result_of_completions(self, id: str) -> dict:
-        response = requests.get(f"https://llm.api.cloud.yandex.net/operations/{id}", headers=self._headers)
-        print(response.json())
-        return response.json()
+    def completion(self, request: CompletionRequest, priority: int | None = None) -> CompletionResponse:
+        """
+        Identical requests of the same API key that are in flight at the same time share one operation and poll
+        loop, the callers arriving later get a copy of the first caller's response (or its exception)
+        """
+        if not self._coalesce:
+            return self._completion(request, priority)
+
+        key = request_key(self._token, self._base_url, request.model_dump(mode="json"))
+        completion, shared = _in_flight.do(key, lambda: self._completion(request, priority))
+        record_cache("llm_singleflight", shared)
+        return completion.model_copy(deep=True) if shared else completion
+
+    def _completion(self, request: CompletionRequest, priority: int | None = None) -> CompletionResponse:
+        """
+        Runs a completion through the rate limiter shared by all clients of this API key and model, interactive
+        requests are served before background ones (see yandexgpt.ratelimit.llm_priority). Fails fast with
+        CircuitOpenError while the API is degraded.
+        """
+        limiter = get_rate_limiter(self._token, str(request.modelUri))
+        priority = current_priority() if priority is None else priority
+        estimated_tokens = estimate_tokens(
+            [message.text for message in request.messages], request.completionOptions.maxTokens
+        )
+        attributes = {"llm.model": str(request.modelUri), "llm.messages": len(request.messages)}
+        with span("yandexgpt.completion", attributes, kind=SPAN_KIND_CLIENT) as completion_span:
+            if not self._breaker.allow():
+                raise CircuitOpenError(
+                    f"YandexGPT is unavailable, retrying in {self._breaker.retry_after():.0f}s", status_code=503
+                )
+            try:
+                with span("yandexgpt.ratelimit", {"llm.priority": priority, "llm.estimated_tokens": estimated_tokens}):
+                    permit = limiter.acquire(estimated_tokens, priority)
+                with permit:
+                    completion = self._run_operation(request, limiter, permit, priority, completion_span)
+            except YandexGPTApiError as e:
+                # quota is per API key, not a sign of a degraded API
+                if e.transient and not isinstance(e, YandexGPTQuotaError):
+                    self._breaker.record_failure()
+                else:
+                    self._breaker.record_success()
+                raise
+            except BaseException:
+                # not an answer of the API, a half open trial is let through again on the next call
+                self._breaker.release_trial()
+                raise
+            self._breaker.record_success()
+
+            completion_span.set_attribute("llm.usage.input_tokens", int(completion.usage.inputTextTokens))
+            completion_span.set_attribute("llm.usage.output_tokens", int(completion.usage.completionTokens))
+            return completion
+
+    def _run_operation(
+        self, request: CompletionRequest, limiter: RateLimiter, permit: Permit, priority: int, completion_span: Span
+    ) -> CompletionResponse:
+        with span("yandexgpt.submit", kind=SPAN_KIND_CLIENT):
+            operations = [self._id_of_completion(request=request, limiter=limiter)]
+        primary = operations[0]
+        started = time.monotonic()
+        hedge_permit: Permit | None = None
+        # the time until the operation is done is queueing and generation on the Yandex side
+        with span("yandexgpt.poll", {"llm.operation_id": operations[0]}, kind=SPAN_KIND_CLIENT) as poll_span:
+            polls = 0
+            try:
+                while True:
+                    for operation_id in list(operations):
+                        polls += 1
+                        limiter.acquire_poll()
+                        response = self._result_of_completions(operation_id, limiter)
+                        if response.get("error"):
+                            error = response["error"]
+                            operations.remove(operation_id)
+                            logger.warning(
+                                "Operation failed: %s",
+                                error.get("message"),
+                                extra={"operation_id": operation_id, "code": error.get("code")},
+                            )
+                            if not operations:
+                                raise YandexGPTOperationError(
+                                    f"YandexGPT operation failed: {error.get('message')}", status_code=error.get("code")
+                                )
+                        elif response.get("done"):
+                            poll_span.set_attribute("llm.polls", polls)
+                            completion = CompletionResponse(**response["response"])
+                            permit.release(int(completion.usage.totalTokens))
+                            if len(operations) > 1:
+                                completion_span.set_attribute("llm.hedge_won", operation_id != primary)
+                            return completion
+
+                    elapsed = time.monotonic() - started
+                    if elapsed >= self._operation_timeout:
+                        raise YandexGPTTimeoutError(
+                            f"YandexGPT operation not done after {self._operation_timeout:.0f}s", status_code=None
+                        )
+                    if self._hedge_after is not None and hedge_permit is None and elapsed >= self._hedge_after:
+                        hedge_permit = self._hedge(request, limiter, permit.tokens, priority, operations)
+                        completion_span.set_attribute("llm.hedged", hedge_permit is not None)
+
+                    sleep(self._poll_interval)
+            finally:
+                if hedge_permit is not None:
+                    hedge_permit.release()
+
+    def _hedge(
+        self, request: CompletionRequest, limiter: RateLimiter, tokens: int, priority: int, operations: list[str]
+    ) -> Permit | None:
+        """Submits a duplicate of a slow operation if the limiter has spare capacity right now"""
+        try:
+            hedge_permit = limiter.acquire(tokens, priority, timeout=0)
+        except RateLimitTimeout:
+            return None
+        try:
+            operations.append(self._id_of_completion(request=request, limiter=limiter))
+        except YandexGPTApiError as e:
+            logger.warning("Hedged request failed: %s", e)
+            hedge_permit.release()
+            return None
+        logger.debug("Hedged slow operation", extra={"operation_id": operations[0], "hedge_id": operations[-1]})
+        return hedge_permit
+
+    def _request(self, method: str, path: str, limiter: RateLimiter, **kwargs) -> requests.Response:
+        """
+        Sends a request with connect/read timeouts, retrying network errors, 429 and 5xx with jittered backoff.
+        A 429 also pauses the shared limiter, so other clients of the key back off as well.
+        """
+        url = f"{self._base_url}{path}"
+        for attempt in range(self._retry.attempts + 1):
+            delay = self._retry.backoff(attempt)
+            try:
+                response = self._session.request(method, url, timeout=self._timeout, **kwargs)
+            except requests.RequestException as e:
+                error = YandexGPTApiError(f"{method} {path} failed: {e.__class__.__name__}")
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    return response
+                if response.status_code == 429:
+                    error = YandexGPTQuotaError("YandexGPT quota exceeded", status_code=429)
+                    delay = _retry_after(response) or delay
+                    limiter.pause(delay)
+                    if attempt >= self._quota_retries:
+                        break
+                else:
+                    error = YandexGPTApiError(f"{method} {path} answered {response.status_code}", response.status_code)
+            if attempt == self._retry.attempts:
+                break
+            logger.warning("%s, retrying in %.2fs", error, delay)
+            sleep(delay)
+        raise error
+
+    def _id_of_completion(self, request: CompletionRequest, limiter: RateLimiter) -> str:
+        response = self._request("POST", "/foundationModels/v1/completionAsync", limiter, json=request.model_dump())
+        operation = _json(response)
+        logger.debug(
+            "Completion submitted",
+            extra={"operation_id": operation.get("id"), "status": response.status_code, "messages": len(request.messages)},
+        )
+        if response.status_code != 200 or "id" not in operation:
+            message = operation.get("message", response.text[:200])
+            raise YandexGPTApiError(f"completionAsync failed: {message}", status_code=response.status_code)
+        return operation["id"]
+
+    def _result_of_completions(self, id: str, limiter: RateLimiter) -> dict:
+        response = self._request("GET", f"/operations/{id}", limiter)
+        operation = _json(response)
+        logger.debug("Operation polled", extra={"operation_id": id, "done": bool(operation.get("done"))})
+        if response.status_code != 200:
+            message = operation.get("message", response.text[:200])
+            raise YandexGPTApiError(f"Polling operation {id} failed: {message}", status_code=response.status_code)
+        return operation
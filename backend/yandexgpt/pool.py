@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, TypeVar
+
+from metrics import LLM_CREDENTIAL_HEALTHY
+from yandexgpt.dto import (
+    DEFAULT_FOLDER_ID,
+    CompletionOptions,
+    CompletionRequest,
+    CompletionResponse,
+    Message,
+    model_uri,
+)
+from yandexgpt.http_client import YandexGPTApiClient, YandexGPTApiError
+from yandexgpt.ratelimit import key_fingerprint
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LEAST_LOADED = "least_loaded"
+ROUND_ROBIN = "round_robin"
+# an invalid or revoked key is taken out of rotation like an unavailable one
+FAILOVER_STATUS = frozenset({401, 403})
+MAX_COOLDOWN = 60.0
+
+
+class Credential:
+    """An API key and the folder its models are billed to, with its load and health"""
+
+    def __init__(self, api_key: str, folder_id: str | None = None, weight: float = 1.0) -> None:
+        self.api_key = api_key
+        self.folder_id = folder_id or DEFAULT_FOLDER_ID
+        self.weight = max(float(weight), 0.01)
+        # a fingerprint of the key for logs and metrics
+        self.name = f"{key_fingerprint(api_key)}/{self.folder_id}"
+        self.in_flight = 0
+        self.failures = 0
+        self.unhealthy_until = 0.0
+        self.current_weight = 0.0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+
+def should_fail_over(error: BaseException) -> bool:
+    return isinstance(error, YandexGPTApiError) and (error.transient or error.status_code in FAILOVER_STATUS)
+
+
+class CredentialPool:
+    """
+    Routes calls over several credentials. least_loaded picks the healthy credential with the fewest calls in flight
+    per unit of weight, round_robin cycles through them in proportion to their weights (smooth weighted round robin,
+    which also breaks ties for least_loaded). A credential whose call failed with a transient, quota or auth error is
+    left out for a cooldown that doubles with each consecutive failure, and the call fails over to the next one.
+    """
+
+    def __init__(self, credentials: list[Credential], strategy: str = LEAST_LOADED) -> None:
+        if not credentials:
+            raise ValueError("A credential pool needs at least one credential")
+        self.credentials = credentials
+        self.strategy = strategy
+        self.lock = threading.Lock()
+        for credential in credentials:
+            LLM_CREDENTIAL_HEALTHY.set(1, credential=credential.name)
+
+    def pick(self, exclude: list[Credential]) -> Credential | None:
+        """Chooses a credential and counts the call in its in_flight, release() it when the call is done"""
+        with self.lock:
+            candidates = [credential for credential in self.credentials if credential not in exclude]
+            if not candidates:
+                return None
+            now = time.monotonic()
+            # when every credential is cooling down, the one that recovers first is tried anyway
+            healthy = [credential for credential in candidates if credential.healthy(now)] or [
+                min(candidates, key=lambda credential: credential.unhealthy_until)
+            ]
+            if self.strategy == LEAST_LOADED:
+                lowest = min(credential.in_flight / credential.weight for credential in healthy)
+                healthy = [credential for credential in healthy if credential.in_flight / credential.weight == lowest]
+            total = sum(credential.weight for credential in healthy)
+            for credential in healthy:
+                credential.current_weight += credential.weight
+            chosen = max(healthy, key=lambda credential: credential.current_weight)
+            chosen.current_weight -= total
+            # counted under the same lock, so concurrent callers see the load when they pick
+            chosen.in_flight += 1
+            return chosen
+
+    def release(self, credential: Credential) -> None:
+        with self.lock:
+            credential.in_flight -= 1
+
+    def record_success(self, credential: Credential) -> None:
+        with self.lock:
+            recovered = credential.failures > 0
+            credential.failures = 0
+            credential.unhealthy_until = 0.0
+        if recovered:
+            LLM_CREDENTIAL_HEALTHY.set(1, credential=credential.name)
+            logger.info("Credential %s is healthy again", credential.name)
+
+    def record_failure(self, credential: Credential) -> None:
+        with self.lock:
+            credential.failures += 1
+            cooldown = min(MAX_COOLDOWN, 2 ** (credential.failures - 1))
+            credential.unhealthy_until = time.monotonic() + cooldown
+        LLM_CREDENTIAL_HEALTHY.set(0, credential=credential.name)
+        logger.warning(
+            "Credential %s failed %d time(s), cooling down for %.0fs", credential.name, credential.failures, cooldown
+        )
+
+    def call(self, function: Callable[[Credential], T]) -> T:
+        """Runs function with a credential, failing over to the others while it fails with a fail-over error"""
+        tried: list[Credential] = []
+        error: Exception | None = None
+        while True:
+            credential = self.pick(exclude=tried)
+            if credential is None:
+                raise error
+            tried.append(credential)
+            try:
+                result = function(credential)
+            except Exception as e:
+                if not should_fail_over(e):
+                    raise
+                self.record_failure(credential)
+                error = e
+                continue
+            finally:
+                self.release(credential)
+            self.record_success(credential)
+            return result
+
+
+def parse_credentials(config: dict[str, Any]) -> list[Credential]:
+    """
+    Credentials of a model config: its "credentials" list (or JSON text) of {"api_key", "folder_id", "weight"}
+    objects, or the single api_key and folder_id of the model
+    """
+    credentials = config.get("credentials") or []
+    if isinstance(credentials, str):
+        credentials = json.loads(credentials)
+    if not credentials:
+        credentials = [{"api_key": config.get("api_key") or ""}]
+    return [
+        Credential(
+            api_key=credential["api_key"],
+            folder_id=credential.get("folder_id") or config.get("folder_id"),
+            weight=credential.get("weight", 1.0),
+        )
+        for credential in credentials
+    ]
+
+
+_pools: dict[str, CredentialPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_credential_pool(config: dict[str, Any]) -> CredentialPool:
+    """The pool shared by every model config of the process with the same credentials"""
+    credentials = parse_credentials(config)
+    key = json.dumps(sorted((c.api_key, c.folder_id, c.weight) for c in credentials))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = CredentialPool(credentials, strategy=os.environ.get("YANDEXGPT_ROUTING", LEAST_LOADED))
+        return _pools[key]
+
+
+@lru_cache(maxsize=64)
+def get_api_client(api_key: str, base_url: str | None = None, quota_retries: int | None = None) -> YandexGPTApiClient:
+    return YandexGPTApiClient(token=api_key, base_url=base_url, quota_retries=quota_retries)
+
+
+def complete(
+    config: dict[str, Any], messages: list[Message], options: CompletionOptions | None = None
+) -> CompletionResponse:
+    """Completion for a model config (a row of the models table), routed over its credentials"""
+
+    pool = get_credential_pool(config)
+    # with other credentials to fail over to, a 429 is not waited out on the same key
+    quota_retries = 0 if len(pool.credentials) > 1 else None
+
+    def run(credential: Credential) -> CompletionResponse:
+        request = CompletionRequest(
+            modelUri=model_uri(config.get("model"), credential.folder_id),
+            completionOptions=options or CompletionOptions(),
+            messages=messages,
+        )
+        client = get_api_client(credential.api_key, config.get("base_url"), quota_retries)
+        return client.completion(request=request)
+
+    return pool.call(run)
@@ -0,0 +1,226 @@
+import contextvars
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# queueing priorities, lower is served first
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# requests/sec for completionAsync, tokens/min (input + output), concurrent operations, operation polls/sec
+DEFAULT_LIMITS = {"rps": 10.0, "tpm": None, "concurrency": 10, "poll_rps": 50.0}
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: int) -> Iterator[None]:
+    """Runs the LLM calls made in the block with the given queueing priority"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+class TokenBucket:
+    """Refills at rate units per second up to capacity, the level goes negative when usage is settled late"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.level -= amount
+
+
+class Permit:
+    """A granted LLM operation, release it when the operation is done to free its concurrency slot"""
+
+    def __init__(self, limiter: "RateLimiter", tokens: int, waited: float) -> None:
+        self.limiter = limiter
+        self.tokens = tokens
+        self.waited = waited
+        self.released = False
+
+    def release(self, used_tokens: int | None = None) -> None:
+        if not self.released:
+            self.released = True
+            self.limiter._release(self, used_tokens)
+
+    def __enter__(self) -> "Permit":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class RateLimiter:
+    """
+    Client-side limits for one API key and model: a request bucket for completionAsync calls, an optional token
+    bucket charged with the estimated tokens of a request (settled with the actual usage), a cap on concurrent
+    operations and a separate bucket for operation polls. Waiters are served strictly by (priority, arrival), so
+    interactive turns overtake queued background summaries.
+    """
+
+    def __init__(
+        self, rps: float = 10, tpm: float | None = None, concurrency: int = 10, poll_rps: float | None = 50
+    ) -> None:
+        self.requests = TokenBucket(rps, max(1.0, rps))
+        self.tokens = TokenBucket(tpm / 60, tpm) if tpm else None
+        self.polls = TokenBucket(poll_rps, max(1.0, poll_rps)) if poll_rps else None
+        self.concurrency = concurrency
+        self.active = 0
+        self.paused_until = 0.0
+        self.waiters: list = []
+        self.sequence = itertools.count()
+        self.cond = threading.Condition()
+
+    def _wait_time(self, tokens: int, now: float) -> float | None:
+        """Seconds until a request can be granted, None when it has to wait for a released operation"""
+        if self.active >= self.concurrency:
+            return None
+        wait = max(0.0, self.paused_until - now, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def acquire(self, tokens: int = 0, priority: int | None = None, timeout: float | None = None) -> Permit:
+        priority = current_priority() if priority is None else priority
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        entry = (priority, next(self.sequence))
+        with self.cond:
+            heapq.heappush(self.waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._wait_time(tokens, now) if self.waiters[0] == entry else None
+                    if wait == 0:
+                        heapq.heappop(self.waiters)
+                        self.requests.consume(1)
+                        if self.tokens is not None:
+                            self.tokens.consume(tokens)
+                        self.active += 1
+                        # the next waiter may be grantable right away
+                        self.cond.notify_all()
+                        return Permit(self, tokens, now - start)
+                    if deadline is not None:
+                        if now >= deadline:
+                            raise RateLimitTimeout(f"No LLM capacity within {timeout}s")
+                        wait = min(wait, deadline - now) if wait is not None else deadline - now
+                    self.cond.wait(wait)
+            except BaseException:
+                if entry in self.waiters:
+                    self.waiters.remove(entry)
+                    heapq.heapify(self.waiters)
+                    self.cond.notify_all()
+                raise
+
+    def _release(self, permit: Permit, used_tokens: int | None) -> None:
+        with self.cond:
+            self.active -= 1
+            if self.tokens is not None and used_tokens is not None:
+                self.tokens.consume(used_tokens - permit.tokens)
+            self.cond.notify_all()
+
+    def acquire_poll(self) -> None:
+        """Waits for the poll bucket, polls are not prioritised since each belongs to an operation already running"""
+        if self.polls is None:
+            return
+        with self.cond:
+            while True:
+                wait = self.polls.wait_time(1, time.monotonic())
+                if wait == 0:
+                    self.polls.consume(1)
+                    return
+                self.cond.wait(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Holds back new requests after the API answered with a quota error"""
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def estimate_tokens(texts: list[str], max_tokens: int = 0) -> int:
+    # about 4 characters per token for mixed Russian and English text, plus the completion budget
+    return sum(len(text) for text in texts) // 4 + max_tokens
+
+
+def model_family(model_uri: str) -> str:
+    """gpt://<folder>/yandexgpt-lite/latest -> yandexgpt-lite"""
+    parts = model_uri.split("://", 1)[-1].split("/")
+    return parts[1] if len(parts) > 1 else parts[0]
+
+
+def key_fingerprint(api_key: str) -> str:
+    """The short hash an API key is known by in logs, metrics and YANDEXGPT_RATE_LIMITS"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+def process_count() -> int:
+    """Processes that call YandexGPT with the same keys, the web workers unless YANDEXGPT_PROCESSES says otherwise"""
+    return max(1, int(os.environ.get("YANDEXGPT_PROCESSES") or os.environ.get("AUTOGENSTUDIO_WORKERS") or 1))
+
+
+def load_limits(model: str, api_key: str | None = None) -> dict:
+    """
+    Limits for a model family from YANDEXGPT_RATE_LIMITS, a JSON object keyed by model family with "*" as the
+    fallback, and by "<key fingerprint>/<model family>" or "<key fingerprint>/*" for a single API key, e.g.
+    {"*": {"rps": 10, "concurrency": 8}, "yandexgpt": {"tpm": 200000}, "3e23e816/*": {"rps": 2}}.
+    The limits are enforced per process, so the configured values are divided by process_count().
+    """
+    config = json.loads(os.environ.get("YANDEXGPT_RATE_LIMITS") or "{}")
+    limits = {**DEFAULT_LIMITS, **config.get("*", {}), **config.get(model, {})}
+    if api_key is not None:
+        fingerprint = key_fingerprint(api_key)
+        limits.update({**config.get(f"{fingerprint}/*", {}), **config.get(f"{fingerprint}/{model}", {})})
+
+    processes = process_count()
+    for name in ("rps", "tpm", "poll_rps"):
+        if limits[name]:
+            limits[name] = limits[name] / processes
+    limits["concurrency"] = max(1, int(limits["concurrency"]) // processes)
+    return limits
+
+
+_limiters: dict[tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key: str, model_uri: str) -> RateLimiter:
+    """
+    The limiter shared by every client of the process that uses this API key and model family. Processes do not
+    share limiters, each gets its share of the configured limits (see load_limits).
+    """
+    model = model_family(model_uri)
+    key = (hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16], model)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(**load_limits(model, api_key))
+        return _limiters[key]
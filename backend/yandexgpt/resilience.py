@@ -0,0 +1,85 @@
+import random
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# responses worth another attempt: quota, and the gateway or the model service being unavailable
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter, so clients that failed together do not retry together"""
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.5, max_delay: float = 10.0) -> None:
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failed calls and rejects calls for recovery_time seconds. Then a single
+    trial call is let through (half open): its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_time: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.recovery_time:
+                self.state = HALF_OPEN
+                self.trial_running = False
+            if self.state == HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_running = False
+
+    def release_trial(self) -> None:
+        """Ends a call that says nothing about the API (interrupted, or failed on our side), the state is kept"""
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.trial_running = False
+
+    def retry_after(self) -> float:
+        with self.lock:
+            return max(0.0, self.opened_at + self.recovery_time - time.monotonic())
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(base_url: str, failure_threshold: int = 5, recovery_time: float = 30.0) -> CircuitBreaker:
+    """The breaker shared by every client of the process that talks to base_url"""
+    with _breakers_lock:
+        if base_url not in _breakers:
+            _breakers[base_url] = CircuitBreaker(failure_threshold, recovery_time)
+        return _breakers[base_url]
@@ -0,0 +1,49 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the function, callers arriving while it is
+    in flight wait for its result (or exception) instead of running it again. Nothing is cached after the call
+    returns, so a later call with the same key runs again.
+    """
+
+    def __init__(self) -> None:
+        self.calls: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+
+    def do(self, key: str, function: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Returns the result and whether it was shared from a call already in flight"""
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    def in_flight(self) -> int:
+        with self.lock:
+            return len(self.calls)
+
+
+def request_key(*parts: Any) -> str:
+    """Hash of the canonical JSON of parts, equal for requests that differ only in key order"""
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
@@ -2111,6 +2111,16 @@ export const AgentRow = ({ message }: { message: any }) => {
       className="m"
     >
       <MarkdownView data={message.message?.content} className="text-sm" />
+      {message.ref && (
+        <a
+          href={`${getServerUrl()}/${message.ref}`}
+          target="_blank"
+          rel="noopener noreferrer"
+          className="text-xs text-accent underline"
+        >
+          Message truncated, view full message
+        </a>
+      )}
     </GroupView>
   );
 };
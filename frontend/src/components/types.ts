@@ -80,6 +80,7 @@ export interface IFlowConfig {
   type: "twoagents" | "groupchat";
   timestamp?: string;
   summary_method?: "none" | "last" | "llm";
+  termination_config?: { [key: string]: any } | null;
   id?: string;
   user_id?: string;
 }
@@ -102,6 +103,9 @@ export interface IMetadataFile {
   extension: string;
   content: string;
   type: string;
+  status?: "created" | "modified" | "deleted";
+  size?: number;
+  sha256?: string | null;
 }
 
 export interface IChatSession {
@@ -120,6 +124,16 @@ export interface IGalleryItem {
   timestamp: string;
 }
 
+export interface IGalleryCard {
+  id: string;
+  title: string;
+  tags: Array<string>;
+  message_count: number;
+  first_prompt: string;
+  thumbnails: Array<string>;
+  timestamp: string;
+}
+
 export interface ISkill {
   title: string;
   file_name?: string;
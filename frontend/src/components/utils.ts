@@ -642,3 +642,41 @@ export const isValidConfig = (
     message: "Configuration is valid.",
   };
 };
+
+// Decodes the batch frames sent to websockets opened with ?batch=1 back into
+// regular socket messages. Agent names arrive once and are referenced by
+// index, agent messages only carry the fields that changed since the last one.
+export const createSocketDecoder = () => {
+  const names: string[] = [];
+  let previous: { [key: string]: any } = {};
+  let previousMessage: { [key: string]: any } = {};
+
+  return (frame: any): any[] => {
+    if (!frame || frame.type !== "batch") {
+      return [frame];
+    }
+    names.push(...(frame.n || []));
+    return frame.events.map((event: any) => {
+      if (event.k !== "m") {
+        return event.e;
+      }
+      previous = { ...previous, ...(event.d || {}) };
+      const message = { ...previousMessage, ...(event.m || {}) };
+      (event.x || []).forEach((key: string) => delete message[key]);
+      previousMessage = message;
+      return {
+        type: "agent_message",
+        data: {
+          ...previous,
+          recipient: names[previous.recipient],
+          sender: names[previous.sender],
+          timestamp: previous.timestamp
+            ? new Date(previous.timestamp).toISOString()
+            : null,
+          message: message,
+          message_type: "agent_message",
+        },
+      };
+    });
+  };
+};
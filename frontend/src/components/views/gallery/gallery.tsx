@@ -1,7 +1,7 @@
 import * as React from "react";
 import { appContext } from "../../../hooks/provider";
 import { fetchJSON, getServerUrl, timeAgo, truncateText } from "../../utils";
-import { IGalleryItem, IStatus } from "../../types";
+import { IGalleryCard, IGalleryItem, IStatus } from "../../types";
 import { Button, message } from "antd";
 import { BounceLoader, Card } from "../../atoms";
 import {
@@ -15,7 +15,7 @@ const GalleryView = ({ location }: any) => {
   const serverUrl = getServerUrl();
   const { user } = React.useContext(appContext);
   const [loading, setLoading] = React.useState(false);
-  const [gallery, setGallery] = React.useState<null | IGalleryItem[]>(null);
+  const [gallery, setGallery] = React.useState<null | IGalleryCard[]>(null);
   const [currentGallery, setCurrentGallery] =
     React.useState<null | IGalleryItem>(null);
   const listGalleryUrl = `${serverUrl}/gallery?user_id=${user?.email}`;
@@ -108,27 +108,37 @@ const GalleryView = ({ location }: any) => {
     return <div className="flex flex-wrap">{tagsView}</div>;
   };
 
-  const galleryRows = gallery?.map((item: IGalleryItem, index: number) => {
+  const galleryRows = gallery?.map((item: IGalleryCard, index: number) => {
     const isSelected = currentGallery?.id === item.id;
     return (
       <div key={"galleryrow" + index} className="">
         <Card
           active={isSelected}
           onClick={() => {
-            setCurrentGallery(item);
+            // cards only carry summary data, load the full item
+            setCurrentGalleryId(item.id);
+            fetchGallery(item.id);
             // add to history
             navigate(`/gallery?id=${item.id}`);
           }}
           className="h-full p-2 cursor-pointer"
-          title={truncateText(item.messages[0]?.content || "", 20)}
+          title={truncateText(item.first_prompt || "", 20)}
         >
+          {item.thumbnails?.length > 0 && (
+            <img
+              src={`${serverUrl}/${item.thumbnails[0]}`}
+              alt=""
+              loading="lazy"
+              className="w-full h-20 object-cover rounded"
+            />
+          )}
           <div className="my-2">
             {" "}
-            {truncateText(item.messages[0]?.content || "", 80)}
+            {truncateText(item.first_prompt || "", 80)}
           </div>
           <div className="text-xs">
             {" "}
-            {item.messages.length} message{item.messages.length > 1 && "s"}
+            {item.message_count} message{item.message_count > 1 && "s"}
           </div>
           <div className="my-2 border-t border-dashed w-full pt-2 inline-flex gap-2 ">
             <TagsView tags={item.tags} />{" "}
@@ -21,7 +21,12 @@ import {
   IMessage,
   IStatus,
 } from "../../types";
-import { examplePrompts, getServerUrl, guid } from "../../utils";
+import {
+  createSocketDecoder,
+  examplePrompts,
+  getServerUrl,
+  guid,
+} from "../../utils";
 import { appContext } from "../../../hooks/provider";
 import MetaDataView from "./metadata";
 import {
@@ -284,8 +289,10 @@ const ChatBox = ({
     if (waitingToReconnect) {
       return;
     }
-    // Only set up the websocket once
-    const socketUrl = websocketUrl + connectionId;
+    // Only set up the websocket once. batch=1 asks the server to coalesce
+    // agent events into compact batch frames
+    const socketUrl = websocketUrl + connectionId + "?batch=1";
+    const decodeFrame = createSocketDecoder();
     console.log("socketUrl", socketUrl);
     if (!wsClient.current) {
       const client = new WebSocket(socketUrl);
@@ -322,9 +329,7 @@ const ChatBox = ({
         }, RETRY_INTERVAL);
       };
 
-      client.onmessage = (message) => {
-        const data = JSON.parse(message.data);
-        console.log("received message", data);
+      const handleSocketMessage = (data: any) => {
         if (data && data.type === "agent_message") {
           // indicates an intermediate agent message update
           const newsocketMessages = Object.assign([], socketMessages);
@@ -345,9 +350,24 @@ const ChatBox = ({
         } else if (data && data.type === "agent_response") {
           // indicates a final agent response
           processAgentResponse(data.data);
+        } else if (data && data.type === "agent_summary") {
+          // the llm summary of an already delivered response is ready
+          const currentMessages = useConfigStore.getState().messages || [];
+          setMessages(
+            currentMessages.map((msg: IChatMessage) =>
+              msg.msg_id === data.data.msg_id
+                ? { ...msg, text: data.data.content }
+                : msg
+            )
+          );
         }
       };
 
+      client.onmessage = (message) => {
+        const frame = JSON.parse(message.data);
+        decodeFrame(frame).forEach(handleSocketMessage);
+      };
+
       return () => {
         console.log("Cleanup");
         // Dereference, so it will set up next time